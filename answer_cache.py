@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Semantic Answer Cache Configuration ---
+# Generated answers are cached per scope - (customer, profile version, namespaces) - with the embedding of the
+# question. A later question in the same scope whose embedding has at least ANSWER_CACHE_THRESHOLD cosine similarity
+# to a cached one gets the cached answer without retrieval or generation. 0 disables the cache.
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "900"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+# Optional SQLite file that keeps answers across cold starts (e.g. /tmp/answer_cache.sqlite); "" keeps them in memory
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+
+
+def profile_version(profile_text: str) -> str:
+    """Version of a customer profile: a hash of its text, so any profile change starts a new cache scope."""
+    return hashlib.sha256(profile_text.encode("utf-8")).hexdigest()[:16]
+
+
+class SQLiteAnswerStore:
+    """
+    Local persistent store for SemanticAnswerCache entries. Any object with the same load/save/delete methods can
+    be passed to the cache instead, e.g. an adapter for a shared key-value service.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                entry_id TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def load(self):
+        """Yields (entry_id, scope, embedding, answer, created) for every stored entry, oldest first."""
+        for entry_id, scope, blob, answer, created in self._conn.execute(
+            "SELECT entry_id, scope, embedding, answer, created FROM answers ORDER BY created"
+        ):
+            yield entry_id, scope, np.frombuffer(blob, dtype=np.float32), answer, created
+
+    def save(self, entry_id: str, scope: str, embedding: np.ndarray, answer: str, created: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO answers (entry_id, scope, embedding, answer, created) VALUES (?, ?, ?, ?, ?)",
+            (entry_id, scope, embedding.astype(np.float32).tobytes(), answer, created),
+        )
+        self._conn.commit()
+
+    def delete(self, entry_ids) -> None:
+        self._conn.executemany("DELETE FROM answers WHERE entry_id = ?", ((entry_id,) for entry_id in entry_ids))
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers looked up by question similarity within a scope. Entries expire `ttl_seconds`
+    after they were stored (0 = never), and beyond `max_entries` the least recently used entry is evicted.
+    With a `store`, entries are loaded from it at start-up and every change is written through to it. Stored entries
+    whose embedding is not `dimension`-dim (e.g. written before an embedding dimension change) are dropped on load;
+    lookups only compare against entries of the query's dimension either way.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, store=None, clock=time.time, dimension: int = None):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Answer cache threshold must be in (0, 1], got {threshold}.")
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.dimension = dimension
+        self.store = store
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # entry_id -> (scope, unit embedding, answer, created), in LRU order
+        self._scopes = {} # scope -> [entry_id]
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.dimension_mismatches = 0
+        if store is not None:
+            for entry_id, scope, embedding, answer, created in store.load():
+                self._add(entry_id, scope, embedding, answer, created)
+            if dimension:
+                self._drop([entry_id for entry_id, (_, embedding, _, _) in self._entries.items()
+                            if embedding.shape[0] != dimension], "dimension_mismatches")
+            self._drop(self._expired_ids(), "expirations")
+            self._drop(list(self._entries)[: max(0, len(self._entries) - max_entries)], "evictions")
+
+    @staticmethod
+    def scope(customer_id, profile_version: str, namespaces=()) -> str:
+        return json.dumps([customer_id or "", profile_version, sorted(namespaces or ())])
+
+    def _add(self, entry_id, scope, embedding, answer, created) -> None:
+        self._entries[entry_id] = (scope, embedding, answer, created)
+        self._scopes.setdefault(scope, []).append(entry_id)
+
+    def _expired_ids(self) -> list:
+        if not self.ttl_seconds:
+            return []
+        cutoff = self._clock() - self.ttl_seconds
+        return [entry_id for entry_id, (_, _, _, created) in self._entries.items() if created < cutoff]
+
+    def _drop(self, entry_ids, counter: str) -> None:
+        """Removes entries from memory and the store. Caller holds the lock (or is the constructor)."""
+        for entry_id in entry_ids:
+            scope = self._entries.pop(entry_id)[0]
+            self._scopes[scope].remove(entry_id)
+            if not self._scopes[scope]:
+                del self._scopes[scope]
+        if entry_ids:
+            setattr(self, counter, getattr(self, counter) + len(entry_ids))
+            if self.store is not None:
+                self.store.delete(entry_ids)
+
+    def lookup(self, scope: str, embedding):
+        """Returns (answer, similarity) of the most similar live entry in `scope` at or above the threshold, else None."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._drop(self._expired_ids(), "expirations")
+            entry_ids = [entry_id for entry_id in self._scopes.get(scope, [])
+                         if self._entries[entry_id][1].shape == query.shape]
+            if entry_ids:
+                similarities = np.stack([self._entries[entry_id][1] for entry_id in entry_ids]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(entry_ids[best])
+                    self.hits += 1
+                    return self._entries[entry_ids[best]][2], float(similarities[best])
+            self.misses += 1
+            return None
+
+    def put(self, scope: str, embedding, answer: str) -> None:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        entry_id, created = uuid.uuid4().hex, self._clock()
+        with self._lock:
+            self._add(entry_id, scope, embedding, answer, created)
+            if self.store is not None:
+                self.store.save(entry_id, scope, embedding, answer, created)
+            self._drop(list(self._entries)[: max(0, len(self._entries) - self.max_entries)], "evictions")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "dimension_mismatches": self.dimension_mismatches,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
@@ -0,0 +1,43 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Batched Retrieval Configuration ---
+# retrieve_many() runs a list of queries at once instead of one after another. At most
+# RETRIEVE_MANY_EMBED_CONCURRENCY embedding calls are in flight (they share the Bedrock quota with everything else),
+# and each query's search starts as soon as its own embedding is ready, with up to RETRIEVE_MANY_WORKERS queries in
+# progress. A batch that fits in the workers takes about as long as its slowest query.
+RETRIEVE_MANY_WORKERS = int(os.getenv("RETRIEVE_MANY_WORKERS", "8"))
+RETRIEVE_MANY_EMBED_CONCURRENCY = int(os.getenv("RETRIEVE_MANY_EMBED_CONCURRENCY", "4"))
+
+
+def retrieve_many(queries, embed, search, max_workers: int = RETRIEVE_MANY_WORKERS,
+                  embed_concurrency: int = RETRIEVE_MANY_EMBED_CONCURRENCY) -> list:
+    """
+    Runs search(query, embed(query)) for every query concurrently and returns [(results, timings)] in query order.
+    Queries can be any objects embed and search understand, e.g. dicts carrying a per-query filter.
+    timings holds embed_ms and search_ms for the query's own calls and total_ms from the start of the batch until
+    its results were ready, which includes any wait for a worker or an embedding slot. The first error is raised.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    started = time.perf_counter()
+    embed_slots = threading.BoundedSemaphore(max(1, embed_concurrency))
+
+    def run(query):
+        with embed_slots:
+            embed_started = time.perf_counter()
+            vectors = embed(query)
+            embedded = time.perf_counter()
+        results = search(query, vectors)
+        finished = time.perf_counter()
+        return results, {
+            "embed_ms": round((embedded - embed_started) * 1000, 3),
+            "search_ms": round((finished - embedded) * 1000, 3),
+            "total_ms": round((finished - started) * 1000, 3),
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries))), thread_name_prefix="retrieve") as executor:
+        return list(executor.map(run, queries))
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from urllib.parse import urlparse
+
+import numpy as np
+
+import pinecone_dataload
+from chunking import chunk_record
+from corpus_loader import iter_records
+from embedding_cache import normalize_text
+from embedding_settings import EMBEDDING_MODEL_ID, EMBEDDING_NORMALIZE, titan_model_kwargs
+
+# --- Bedrock Batch Inference Configuration ---
+# Bulk backend for full re-embeds: every chunk that is not yet in the embedding cache is written as JSONL to S3,
+# embedded by one Bedrock model-invocation (batch) job, and the job output is loaded into the embedding cache.
+# The regular ingestion pipeline then runs with every embedding served from the cache, so large backfills use
+# the batch quota instead of competing with online traffic for on-demand invoke_model capacity.
+#
+#   python bedrock_batch_embedding.py --s3-uri s3://my-bucket/embedding-jobs --role-arn arn:aws:iam::...:role/...
+#   python bedrock_batch_embedding.py --local   # everything against the stand-ins in offline_stubs.py
+BATCH_S3_URI = os.getenv("BEDROCK_BATCH_S3_URI", "") # s3://bucket/prefix under which job inputs/outputs are written
+BATCH_ROLE_ARN = os.getenv("BEDROCK_BATCH_ROLE_ARN", "") # Service role Bedrock assumes to read and write the bucket
+# Endpoint overrides for S3-compatible or Bedrock stand-ins such as LocalStack or MinIO
+BATCH_S3_ENDPOINT_URL = os.getenv("BEDROCK_BATCH_S3_ENDPOINT_URL") or None
+BATCH_BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_BATCH_BEDROCK_ENDPOINT_URL") or None
+BATCH_RECORDS_PER_FILE = int(os.getenv("BEDROCK_BATCH_RECORDS_PER_FILE", "50000")) # Bedrock per-file record quota
+# Bedrock rejects jobs below its minimum record count; smaller workloads are left to the on-demand path
+BATCH_MIN_RECORDS = int(os.getenv("BEDROCK_BATCH_MIN_RECORDS", "100"))
+BATCH_POLL_SECONDS = float(os.getenv("BEDROCK_BATCH_POLL_SECONDS", "60"))
+BATCH_TIMEOUT_HOURS = int(os.getenv("BEDROCK_BATCH_TIMEOUT_HOURS", "24"))
+
+SUCCEEDED_STATUSES = ("Completed", "PartiallyCompleted")
+FAILED_STATUSES = ("Failed", "Stopped", "Expired")
+
+
+def parse_s3_uri(uri: str):
+    """Splits s3://bucket/prefix into (bucket, prefix without trailing slash)."""
+    parsed = urlparse(uri)
+    if parsed.scheme != "s3" or not parsed.netloc:
+        raise ValueError(f"Expected an s3://bucket/prefix URI, got '{uri}'.")
+    return parsed.netloc, parsed.path.strip("/")
+
+
+def get_s3_client(endpoint_url=BATCH_S3_ENDPOINT_URL):
+    import boto3
+    return boto3.client("s3", region_name=pinecone_dataload.AWS_REGION, endpoint_url=endpoint_url)
+
+
+def get_bedrock_batch_client(endpoint_url=BATCH_BEDROCK_ENDPOINT_URL):
+    """The 'bedrock' control-plane client, which owns model-invocation jobs (not 'bedrock-runtime')."""
+    import boto3
+    return boto3.client("bedrock", region_name=pinecone_dataload.AWS_REGION, endpoint_url=endpoint_url)
+
+
+def iter_uncached_texts(corpus_path, embedding_cache):
+    """Yields each distinct chunk text of the corpus that the embedding cache does not hold yet."""
+    seen = set()
+    for record in iter_records(corpus_path):
+        for chunk in chunk_record(record):
+            text = chunk["Content"]
+            digest = hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+            if not text or digest in seen:
+                continue
+            seen.add(digest)
+            if embedding_cache.get_raw(text) is None:
+                yield text
+
+
+def write_input_files(texts, directory, dimension, records_per_file=BATCH_RECORDS_PER_FILE):
+    """
+    Writes batch-inference input records ({"recordId", "modelInput"}) as JSONL files of at most `records_per_file`
+    lines into `directory`. Returns (paths, record_count).
+    """
+    model_kwargs = titan_model_kwargs(dimension, EMBEDDING_NORMALIZE)
+    paths, count, f = [], 0, None
+    try:
+        for text in texts:
+            if count % records_per_file == 0:
+                if f is not None:
+                    f.close()
+                paths.append(os.path.join(directory, f"part-{len(paths):05d}.jsonl"))
+                f = open(paths[-1], "w", encoding="utf-8")
+            # Record IDs are 11 alphanumeric characters; outputs are matched back by their input text instead
+            f.write(json.dumps({"recordId": f"{count:011d}", "modelInput": {"inputText": text, **model_kwargs}}) + "\n")
+            count += 1
+    finally:
+        if f is not None:
+            f.close()
+    return paths, count
+
+
+def submit_job(bedrock, job_name, input_uri, output_uri, role_arn, timeout_hours=BATCH_TIMEOUT_HOURS):
+    """Creates the model-invocation job and returns its ARN."""
+    response = bedrock.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=role_arn,
+        modelId=EMBEDDING_MODEL_ID,
+        inputDataConfig={"s3InputDataConfig": {"s3Uri": input_uri, "s3InputFormat": "JSONL"}},
+        outputDataConfig={"s3OutputDataConfig": {"s3Uri": output_uri}},
+        timeoutDurationInHours=timeout_hours,
+    )
+    return response["jobArn"]
+
+
+def wait_for_job(bedrock, job_arn, poll_seconds=BATCH_POLL_SECONDS):
+    """Polls the job until it reaches a terminal status; returns the final job description or raises RuntimeError."""
+    last_status = None
+    while True:
+        job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+        status = job["status"]
+        if status != last_status:
+            print(f"Batch job {job_arn.rsplit('/', 1)[-1]}: {status}")
+            last_status = status
+        if status in SUCCEEDED_STATUSES:
+            return job
+        if status in FAILED_STATUSES:
+            raise RuntimeError(f"Batch embedding job {job_arn} ended with status {status}: {job.get('message', '')}")
+        time.sleep(poll_seconds)
+
+
+def iter_output_records(s3, bucket, prefix):
+    """Streams the parsed JSON lines of every *.jsonl.out object under `prefix`, without downloading whole files."""
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        page = s3.list_objects_v2(**kwargs)
+        for item in page.get("Contents", []):
+            if not item["Key"].endswith(".jsonl.out"): # skips manifest.json.out
+                continue
+            for line in s3.get_object(Bucket=bucket, Key=item["Key"])["Body"].iter_lines():
+                if line:
+                    yield json.loads(line)
+        if not page.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+
+def load_output_into_cache(output_records, embedding_cache):
+    """
+    Stores each successful output record's embedding under its input text. Returns (loaded, failed); failed
+    records are left uncached, so ingestion embeds them on demand.
+    """
+    loaded = failed = 0
+    for output in output_records:
+        embedding = (output.get("modelOutput") or {}).get("embedding")
+        if output.get("error") or embedding is None:
+            failed += 1
+            continue
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if embedding.shape[0] != embedding_cache.dimension:
+            raise ValueError(f"Batch output has {embedding.shape[0]}-dim embeddings, expected {embedding_cache.dimension}.")
+        embedding_cache.put(output["modelInput"]["inputText"], embedding)
+        loaded += 1
+    return loaded, failed
+
+
+def run_batch_embedding(corpus_path=None, s3_uri=None, role_arn=None, dimension=None, s3=None, bedrock=None,
+                        poll_seconds=BATCH_POLL_SECONDS, min_records=BATCH_MIN_RECORDS):
+    """
+    Embeds every uncached chunk of the corpus with one Bedrock batch job and loads the results into the embedding
+    cache. Returns a summary dict. Workloads below `min_records` are not submitted.
+    """
+    corpus_path = corpus_path or pinecone_dataload.CORPUS_PATH
+    s3_uri = s3_uri or BATCH_S3_URI
+    role_arn = role_arn or BATCH_ROLE_ARN
+    dimension = dimension or pinecone_dataload.DIMENSION
+    if not s3_uri or not role_arn:
+        raise ValueError("Batch embedding needs BEDROCK_BATCH_S3_URI and BEDROCK_BATCH_ROLE_ARN (or --s3-uri/--role-arn).")
+    embedding_cache = pinecone_dataload.get_embedding_cache(dimension)
+    if embedding_cache is None:
+        raise ValueError("Batch embedding hands its results to ingestion through the embedding cache; set EMBEDDING_CACHE_PATH.")
+    s3 = s3 or get_s3_client()
+    bedrock = bedrock or get_bedrock_batch_client()
+    bucket, prefix = parse_s3_uri(s3_uri)
+    # Job names must be unique per account and at most 63 characters
+    job_name = f"embed-{pinecone_dataload.INDEX_NAME}-{dimension}-{time.strftime('%Y%m%d%H%M%S')}"[:54] + f"-{uuid.uuid4().hex[:8]}"
+    job_prefix = f"{prefix}/{job_name}" if prefix else job_name
+    summary = {"job_name": job_name, "records": 0, "loaded": 0, "failed": 0, "submitted": False}
+
+    workdir = tempfile.mkdtemp(prefix="bedrock_batch_")
+    try:
+        paths, summary["records"] = write_input_files(iter_uncached_texts(corpus_path, embedding_cache), workdir, dimension)
+        if summary["records"] < min_records:
+            print(f"Only {summary['records']} uncached chunks (batch minimum is {min_records}); leaving them to on-demand embedding.")
+            return summary
+        # Results reach ingestion through the cache, so they must all fit in it at once
+        needed_bytes = summary["records"] * dimension * 4
+        if embedding_cache.stats()["size_bytes"] + needed_bytes > embedding_cache.max_bytes:
+            raise ValueError(f"{summary['records']} embeddings need {needed_bytes / 2**20:.0f} MB more cache than "
+                             f"EMBEDDING_CACHE_MAX_BYTES={embedding_cache.max_bytes} allows; raise it for this backfill.")
+        for path in paths:
+            s3.upload_file(path, bucket, f"{job_prefix}/input/{os.path.basename(path)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Uploaded {summary['records']} chunks in {len(paths)} files to s3://{bucket}/{job_prefix}/input/.")
+
+    job_arn = submit_job(bedrock, job_name, f"s3://{bucket}/{job_prefix}/input/", f"s3://{bucket}/{job_prefix}/output/", role_arn)
+    summary.update(submitted=True, job_arn=job_arn)
+    summary["status"] = wait_for_job(bedrock, job_arn, poll_seconds)["status"]
+    # Bedrock writes the outputs under <output URI>/<job ID>/
+    output_prefix = f"{job_prefix}/output/{job_arn.rsplit('/', 1)[-1]}/"
+    summary["loaded"], summary["failed"] = load_output_into_cache(iter_output_records(s3, bucket, output_prefix), embedding_cache)
+    print(f"Loaded {summary['loaded']} batch embeddings into the cache ({summary['failed']} failed records will be embedded on demand).")
+    return summary
+
+
+def run_batch_ingest(corpus_path=None, mode=None, s3_uri=None, role_arn=None, resume=False, s3=None, bedrock=None,
+                     poll_seconds=BATCH_POLL_SECONDS, min_records=BATCH_MIN_RECORDS):
+    """Runs the batch embedding job, then the regular ingestion pipeline, which now finds every embedding cached."""
+    batch_summary = run_batch_embedding(corpus_path, s3_uri, role_arn, s3=s3, bedrock=bedrock, poll_seconds=poll_seconds,
+                                        min_records=min_records)
+    totals = pinecone_dataload.run_ingest(corpus_path=corpus_path, mode=mode, resume=resume)
+    totals["batch_embedding"] = batch_summary
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Ingest the corpus with embeddings from a Bedrock batch inference job.")
+    parser.add_argument("--corpus", help=f"JSONL, CSV or Parquet file (default: {pinecone_dataload.CORPUS_PATH})")
+    parser.add_argument("--mode", choices=["full", "delta"], help=f"Ingestion mode (default: {pinecone_dataload.INGEST_MODE})")
+    parser.add_argument("--resume", action="store_true", help="Continue the latest unfinished ingestion run.")
+    parser.add_argument("--s3-uri", help="s3://bucket/prefix for job inputs and outputs (default: BEDROCK_BATCH_S3_URI)")
+    parser.add_argument("--role-arn", help="Service role for the batch job (default: BEDROCK_BATCH_ROLE_ARN)")
+    parser.add_argument("--poll-seconds", type=float, default=BATCH_POLL_SECONDS)
+    parser.add_argument("--min-records", type=int,
+                        help=f"Smallest workload submitted as a batch job (default: {BATCH_MIN_RECORDS}, 1 with --local)")
+    parser.add_argument("--local", action="store_true", help="Run against the in-process S3, Bedrock and Pinecone stand-ins.")
+    args = parser.parse_args()
+
+    s3_client = bedrock_client = None
+    workdir = None
+    if args.local:
+        from offline_stubs import StubBedrockBatch, StubBedrockRuntime, StubPinecone, StubS3
+        s3_client = StubS3()
+        bedrock_client = StubBedrockBatch(s3_client)
+        pinecone_dataload.use_clients(pinecone_client=StubPinecone(), bedrock_runtime=StubBedrockRuntime())
+        # Stub vectors, the manifest and the journal go to a scratch directory instead of the real files. The
+        # settings are patched on the module because pinecone_dataload has already read the environment.
+        workdir = tempfile.TemporaryDirectory(prefix="bedrock_batch_local_")
+        pinecone_dataload.EMBEDDING_CACHE_PATH = os.path.join(workdir.name, "embedding_cache.sqlite")
+        pinecone_dataload.INGEST_MANIFEST_PATH = os.path.join(workdir.name, "ingest_manifest.sqlite")
+        pinecone_dataload.INGEST_JOURNAL_PATH = os.path.join(workdir.name, "ingest_journal.sqlite")
+        pinecone_dataload.SPARSE_VOCABULARY_PATH = os.path.join(workdir.name, "sparse_vocabulary.json")
+        pinecone_dataload.DOCUMENT_STORE_PATH = ""
+        args.s3_uri = args.s3_uri or "s3://local-batch-bucket/embedding-jobs"
+        args.role_arn = args.role_arn or "arn:aws:iam::000000000000:role/local-batch"
+        args.poll_seconds = 0
+        if args.min_records is None:
+            args.min_records = 1 # the bundled corpus is far below the real minimum; submit it anyway
+    try:
+        totals = run_batch_ingest(args.corpus, args.mode, args.s3_uri, args.role_arn, args.resume,
+                                  s3=s3_client, bedrock=bedrock_client, poll_seconds=args.poll_seconds,
+                                  min_records=args.min_records if args.min_records is not None else BATCH_MIN_RECORDS)
+    finally:
+        if workdir is not None:
+            workdir.cleanup()
+    print(json.dumps(totals, indent=2, default=str))
@@ -16,13 +16,16 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 
+from batch_retrieval import retrieve_many
+from embedding_settings import EMBEDDING_MODEL_ID, EMBEDDING_DIMENSION, EMBEDDING_NORMALIZE, titan_model_kwargs
+
 # --- 1. Pinecone Configuration ---
 # IMPORTANT: Replace with your actual Pinecone API Key and Environment
 # You can get these from your Pinecone dashboard: app.pinecone.io
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY") # Example: "YOUR_ABCDEFGHIJKLMN"
 PINECONE_ENVIRONMENT = "us-east-1" # Example: "us-east-1" or "gcp-starter"
 INDEX_NAME = "smart-saving-unstruct" # Matches the index name used for upserting
-DIMENSION = 1024 # Dimension for 'amazon.titan-embed-text-v2:0'
+DIMENSION = EMBEDDING_DIMENSION # Must match the dimension INDEX_NAME was built with (see embedding_settings.py)
 METRIC = "cosine" # Similarity metric: 'cosine', 'euclidean', or 'dotproduct'
 PINECONE_INDEX_HOST = "smart-saving-unstruct-3ithvk0.svc.aped-4627-b74a.pinecone.io" 
 
@@ -31,7 +34,6 @@ PINECONE_INDEX_HOST = "smart-saving-unstruct-3ithvk0.svc.aped-4627-b74a.pinecone
 # boto3 will automatically look for credentials in environment variables (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
 # or in ~/.aws/credentials. Ensure your AWS region is also configured.
 AWS_REGION = "us-east-1" # Or your desired AWS region where Bedrock is available
-EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
 GENERATION_MODEL_ID = 'mistral.mistral-7b-instruct-v0:2' # Using a Mistral model for generation
 
 # --- 2. AWS Bedrock Configuration ---
@@ -39,7 +41,6 @@ GENERATION_MODEL_ID = 'mistral.mistral-7b-instruct-v0:2' # Using a Mistral model
 # boto3 will automatically look for credentials in environment variables (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
 # or in ~/.aws/credentials. Ensure your AWS region is also configured.
 AWS_REGION = "us-east-1" # Or your desired AWS region where Bedrock is available
-EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
 GENERATION_MODEL_ID = 'mistral.mistral-7b-instruct-v0:2' # Using a Mistral model for generation
 
 # --- 3. Initialize Pinecone Client (Global Configuration) ---
@@ -73,6 +74,7 @@ print(f"Initializing embedding model {EMBEDDING_MODEL_ID} for LangChain...")
 # Initialize Bedrock Embeddings for LangChain
 embeddings = BedrockEmbeddings(
     model_id=EMBEDDING_MODEL_ID,
+    model_kwargs=titan_model_kwargs(EMBEDDING_DIMENSION, EMBEDDING_NORMALIZE), # Same dimension/normalization as ingestion
     client=bedrock_runtime # Pass the boto3 client directly
 )
 
@@ -92,7 +94,8 @@ except Exception as e:
     print("Please ensure the index exists in Pinecone and your API key/environment are correct for LangChain's connection.")
     exit()
 
-retriever = vectorstore.as_retriever(search_kwargs={"k": 3}) # Configure retriever for top_k=3
+RETRIEVER_TOP_K = 3
+retriever = vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_TOP_K}) # Configure retriever for top_k=3
 
 # --- 6. Define the RAG Chain with LangChain ---
 
@@ -124,21 +127,21 @@ prompt_template = ChatPromptTemplate.from_messages(
 )
 
 # Build the RAG chain using LangChain Expression Language (LCEL)
-rag_chain = (
-    {"context": retriever, "question": RunnablePassthrough()}
-    | prompt_template
-    | llm
-    | StrOutputParser()
-)
+# answer_chain generates from already retrieved documents; rag_chain retrieves them first
+answer_chain = prompt_template | llm | StrOutputParser()
+rag_chain = {"context": retriever, "question": RunnablePassthrough()} | answer_chain
 
 # --- Main RAG Application Flow ---
-def run_rag_application(user_query: str):
+def run_rag_application(user_query: str, docs: list = None):
     print(f"User Query: \"{user_query}\"\n")
 
-    print("Retrieving relevant documents and generating response using LLM with context (via LangChain)...")
-    
-    # Invoke the entire RAG chain
-    final_response = rag_chain.invoke(user_query) 
+    if docs is None:
+        print("Retrieving relevant documents and generating response using LLM with context (via LangChain)...")
+        # Invoke the entire RAG chain
+        final_response = rag_chain.invoke(user_query)
+    else:
+        print("Generating response using LLM with the prefetched context (via LangChain)...")
+        final_response = answer_chain.invoke({"context": docs, "question": user_query})
 
     print("--- RAG Answer ---")
     print(final_response)
@@ -154,7 +157,15 @@ if __name__ == "__main__":
         "What common fraud red flags should JPMC bankers be aware of during credit application review, according to internal policies?"
     ]
 
-    for i, q in enumerate(queries):
+    # Retrieve context for all queries at once; generation then runs per query as before
+    retrievals = retrieve_many(
+        queries,
+        embeddings.embed_query,
+        lambda query, embedding: vectorstore.similarity_search_by_vector(embedding, k=RETRIEVER_TOP_K),
+    )
+
+    for i, (q, (docs, timings)) in enumerate(zip(queries, retrievals)):
         print(f"\nQUERY {i+1}:\n")
-        run_rag_application(q)
+        print(f"Retrieval timings (ms): {timings}")
+        run_rag_application(q, docs)
         print("=" * 70 + "\n")
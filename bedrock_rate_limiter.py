@@ -0,0 +1,186 @@
+import json
+import os
+import random
+import threading
+import time
+
+# --- Rate Limiter Configuration ---
+# Budgets should be set a little under the account's Bedrock on-demand quotas for the models in use.
+# A value of 0 disables that budget.
+BEDROCK_REQUESTS_PER_SECOND = float(os.getenv("BEDROCK_REQUESTS_PER_SECOND", "20"))
+BEDROCK_TOKENS_PER_MINUTE = float(os.getenv("BEDROCK_TOKENS_PER_MINUTE", "300000"))
+BEDROCK_MAX_RETRIES = int(os.getenv("BEDROCK_MAX_RETRIES", "8"))
+# Upper bound on the time one call may spend backing off before its error is raised (0 = bounded only by
+# BEDROCK_MAX_RETRIES). Callers with a deadline, like the Lambda, should set it below their timeout.
+BEDROCK_MAX_RETRY_SECONDS = float(os.getenv("BEDROCK_MAX_RETRY_SECONDS", "0"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+# Error codes Bedrock returns when a quota is exhausted. Other errors are not retried here.
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ProvisionedThroughputExceededException",
+}
+# Transient errors that are also retried: server-side error codes and 5xx responses, plus botocore's timeout and
+# connection errors (matched by class name). Client errors such as validation or access errors are not retried.
+TRANSIENT_ERROR_CODES = {
+    "InternalServerException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+}
+TRANSIENT_EXCEPTION_NAMES = {
+    "ReadTimeoutError",
+    "ConnectTimeoutError",
+    "EndpointConnectionError",
+    "ConnectionClosedError",
+}
+# Rough characters-per-token ratio used to estimate a request's token cost before sending it
+CHARS_PER_TOKEN = 4
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    True for a botocore ClientError whose error code is a throttling code. Checked structurally so that
+    importing this module does not pull in botocore.
+    """
+    response = getattr(error, "response", None)
+    return isinstance(response, dict) and response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for a 5xx or transient-code ClientError, or a botocore timeout or connection error."""
+    if any(cls.__name__ in TRANSIENT_EXCEPTION_NAMES for cls in type(error).__mro__):
+        return True
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    return response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES or status >= 500
+
+
+def estimate_request_tokens(body) -> int:
+    """Estimates the tokens an invoke_model request will consume: its input text plus any max_tokens."""
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode("utf-8")
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        return max(1, len(str(body)) // CHARS_PER_TOKEN)
+    if not isinstance(payload, dict):
+        return max(1, len(body) // CHARS_PER_TOKEN)
+    if "inputText" in payload:
+        input_tokens = len(payload["inputText"]) // CHARS_PER_TOKEN
+    else:
+        input_tokens = len(body) // CHARS_PER_TOKEN
+    output_tokens = payload.get("max_tokens", payload.get("max_gen_len", 0)) or 0
+    return max(1, input_tokens + int(output_tokens))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` units per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._available = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Blocks until `amount` units are available and takes them. Returns the seconds spent waiting."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return waited
+                delay = (amount - self._available) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class BedrockRateLimiter:
+    """
+    Paces Bedrock runtime calls with a requests-per-second and a tokens-per-minute token bucket, and retries
+    throttling and transient errors with jittered exponential backoff, for at most `max_retries` retries and
+    `max_retry_seconds` of backoff per call. Other errors propagate immediately.
+    """
+
+    def __init__(self, requests_per_second: float = BEDROCK_REQUESTS_PER_SECOND,
+                 tokens_per_minute: float = BEDROCK_TOKENS_PER_MINUTE, max_retries: int = BEDROCK_MAX_RETRIES,
+                 max_retry_seconds: float = BEDROCK_MAX_RETRY_SECONDS):
+        self.request_bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_retries = max_retries
+        self.max_retry_seconds = max_retry_seconds
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "throttled": 0, "transient_errors": 0, "retries": 0, "failed": 0, "wait_seconds": 0.0}
+
+    def _count(self, name: str, amount=1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def call(self, fn, *args, estimated_tokens: int = 1, **kwargs):
+        """Calls fn(*args, **kwargs) within the rate budgets, retrying throttling and transient errors."""
+        backed_off = 0.0
+        for attempt in range(self.max_retries + 1):
+            waited = 0.0
+            if self.request_bucket is not None:
+                waited += self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                waited += self.token_bucket.acquire(estimated_tokens)
+            self._count("requests")
+            self._count("wait_seconds", waited)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if is_throttling_error(e):
+                    self._count("throttled")
+                elif is_transient_error(e):
+                    self._count("transient_errors")
+                else:
+                    raise
+                if attempt == self.max_retries or (self.max_retry_seconds and backed_off >= self.max_retry_seconds):
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                # Full jitter keeps concurrent workers from retrying in lockstep
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                if self.max_retry_seconds:
+                    delay = min(delay, self.max_retry_seconds - backed_off)
+                time.sleep(delay)
+                backed_off += delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, wait_seconds=round(self.counters["wait_seconds"], 3))
+
+
+class RateLimitedBedrockClient:
+    """
+    Wraps a boto3 'bedrock-runtime' client so invoke_model and invoke_model_with_response_stream go through
+    a BedrockRateLimiter. All other attributes are delegated to the wrapped client, so it can be passed
+    anywhere a client is expected (get_embedding, BedrockEmbeddings, ChatBedrock).
+    """
+
+    def __init__(self, client, limiter: BedrockRateLimiter):
+        self._client = client
+        self.limiter = limiter
+
+    def invoke_model(self, **kwargs):
+        tokens = estimate_request_tokens(kwargs.get("body", ""))
+        return self.limiter.call(self._client.invoke_model, estimated_tokens=tokens, **kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        tokens = estimate_request_tokens(kwargs.get("body", ""))
+        return self.limiter.call(self._client.invoke_model_with_response_stream, estimated_tokens=tokens, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# --- Offline Ingestion Benchmark ---
+# Runs the real ingestion pipeline (pinecone_dataload.run_ingest) on a synthetic corpus against the local
+# stand-ins in offline_stubs.py, and reports throughput, peak memory and where the time went. Use it to compare
+# concurrency and batching settings before a production run, e.g.
+#
+#   python benchmark_ingest.py --documents 5000 --embed-workers 16 --upsert-workers 8
+#   python benchmark_ingest.py --documents 2000 --bedrock-throttle-rate 0.05 --requests-per-second 50
+#
+# Pipeline settings are passed through the same environment variables a production run reads, so they are
+# set before pinecone_dataload is imported.
+WORDS = (
+    "mortgage applicant income savings portfolio risk credit employment loan rate market retirement account "
+    "deposit budget expense investment dividend equity bond inflation liquidity collateral payment balance "
+    "advisor customer review profile stable volatile growth allocation tax planning guide quarterly"
+).split()
+
+
+def write_synthetic_corpus(path, documents, mean_words=150, long_fraction=0.1, seed=7):
+    """
+    Writes `documents` JSONL records shaped like data/unstructured_data_records.jsonl. Lengths vary around
+    `mean_words`; `long_fraction` of the documents are ten times longer so chunking is exercised.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(documents):
+            words = max(5, int(rng.gauss(mean_words, mean_words / 3)))
+            if rng.random() < long_fraction:
+                words *= 10
+            sentences, remaining = [], words
+            while remaining > 0:
+                length = min(remaining, rng.randint(8, 25))
+                sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+                remaining -= length
+            record = {
+                "Document ID": f"BENCH_{i:07d}",
+                "Source": "Synthetic Benchmark",
+                "Date": "2025-01-01",
+                "Headline": f"Synthetic document {i}",
+                "Content": " ".join(sentences),
+                "Metadata": {"customer_id": f"P{rng.randint(1, 500):03d}", "risk_indicator": rng.choice(["low", "medium", "high"])},
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux and bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion offline against stubbed Bedrock and Pinecone.")
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--mean-words", type=int, default=150)
+    parser.add_argument("--long-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--bedrock-latency-ms", type=float, default=40.0)
+    parser.add_argument("--bedrock-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--bedrock-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--upsert-latency-ms", type=float, default=80.0)
+    parser.add_argument("--upsert-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--upsert-error-rate", type=float, default=0.0)
+    parser.add_argument("--embed-workers", type=int)
+    parser.add_argument("--embed-in-flight", type=int)
+    parser.add_argument("--upsert-workers", type=int)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--dimension", type=int)
+    parser.add_argument("--requests-per-second", type=float, default=0.0, help="Bedrock request budget; 0 disables pacing.")
+    parser.add_argument("--tokens-per-minute", type=float, default=0.0, help="Bedrock token budget; 0 disables pacing.")
+    parser.add_argument("--output", help="Also write the report as JSON to this path.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ingest_benchmark_")
+    settings = {
+        "EMBED_MAX_WORKERS": args.embed_workers,
+        "EMBED_MAX_IN_FLIGHT": args.embed_in_flight,
+        "UPSERT_MAX_WORKERS": args.upsert_workers,
+        "INGEST_BATCH_SIZE": args.batch_size,
+        "EMBEDDING_DIMENSION": args.dimension,
+        "BEDROCK_REQUESTS_PER_SECOND": args.requests_per_second,
+        "BEDROCK_TOKENS_PER_MINUTE": args.tokens_per_minute,
+        "EMBEDDING_CACHE_PATH": "", # every run measures real embedding work
+        "DOCUMENT_STORE_PATH": "",
+        "INGEST_MODE": "full",
+        "INGEST_MANIFEST_PATH": os.path.join(workdir, "ingest_manifest.sqlite"),
+        "INGEST_JOURNAL_PATH": os.path.join(workdir, "ingest_journal.sqlite"),
+        "PINECONE_API_KEY": "offline-benchmark",
+    }
+    os.environ.update({name: str(value) for name, value in settings.items() if value is not None})
+
+    import pinecone_dataload # reads the settings above
+    from offline_stubs import LatencyModel, StubBedrockRuntime, StubIndex, StubPinecone
+
+    corpus_path = os.path.join(workdir, "corpus.jsonl")
+    write_synthetic_corpus(corpus_path, args.documents, args.mean_words, args.long_fraction, args.seed)
+    random.seed(args.seed)
+
+    bedrock = StubBedrockRuntime(LatencyModel(args.bedrock_latency_ms, args.bedrock_latency_sigma), args.bedrock_throttle_rate)
+    pinecone_client = StubPinecone(lambda: StubIndex(LatencyModel(args.upsert_latency_ms, args.upsert_latency_sigma), args.upsert_error_rate))
+    pinecone_dataload.use_clients(pinecone_client=pinecone_client, bedrock_runtime=bedrock)
+
+    try:
+        started = time.perf_counter()
+        totals = pinecone_dataload.run_ingest(corpus_path=corpus_path)
+        seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    index_counters = pinecone_dataload.get_index().counters
+    stage_seconds = totals.pop("stage_seconds")
+    report = {
+        "documents": args.documents,
+        "seconds": round(seconds, 3),
+        "docs_per_second": round(totals["embedded_documents"] / seconds, 1),
+        "vectors_per_second": round(totals["upserted_vectors"] / seconds, 1),
+        "upserts_per_second": round(index_counters["upsert_requests"] / seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stage_seconds": stage_seconds,
+        "stage_share": {stage: round(value / seconds, 3) for stage, value in stage_seconds.items()},
+        "totals": totals,
+        "bedrock": {"calls": bedrock.calls, "throttled": bedrock.throttled, "limiter": pinecone_dataload.get_bedrock_client().limiter.stats()},
+        "pinecone": index_counters,
+        "settings": {
+            "embed_workers": pinecone_dataload.EMBED_MAX_WORKERS,
+            "embed_in_flight": pinecone_dataload.EMBED_MAX_IN_FLIGHT,
+            "upsert_workers": pinecone_dataload.UPSERT_MAX_WORKERS,
+            "batch_size": pinecone_dataload.INGEST_BATCH_SIZE,
+            "dimension": pinecone_dataload.DIMENSION,
+            "chunk_size_tokens": pinecone_dataload.CHUNK_SIZE_TOKENS,
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
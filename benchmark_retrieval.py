@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from batch_retrieval import retrieve_many
+
+# --- Retrieval Quality and Latency Benchmark ---
+# Runs the golden queries in data/golden_queries.jsonl (query, expected document IDs and, for customer-specific
+# questions, a metadata filter admitting that customer's documents and the global ones, as the Lambda's scoped
+# retrieval does) against a retriever backend and reports recall@k, MRR and latency percentiles
+# as JSON, so a performance change can be checked against retrieval quality, e.g.
+#
+#   python benchmark_retrieval.py --backend pinecone
+#   python benchmark_retrieval.py --backend replica --replica-dir replica_snapshot --filtered
+#   python benchmark_retrieval.py --backend pinecone --sparse-vocabulary sparse_vocabulary.json --alpha 0.5
+#   python benchmark_retrieval.py --offline --sparse-vocabulary auto   # stubbed Bedrock/Pinecone, no credentials
+#
+# Recall counts parent documents: chunks of the same document are one result at the rank of the best chunk.
+GOLDEN_QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "golden_queries.jsonl")
+RECALL_AT = (1, 3, 5, 10)
+
+
+def load_golden_queries(path: str = GOLDEN_QUERIES_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(values) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+    }
+
+
+class RetrievalBackend:
+    """
+    Embeds a query and searches `search(vector, top_k, namespace, filter, sparse_vector) -> matches`, where
+    matches are Pinecone-shaped ({"id", "score", "metadata"}). Hybrid when a sparse encoder is given; several
+    namespaces are searched one after another and merged by score.
+    """
+
+    def __init__(self, name, search, embed, sparse_encoder=None, alpha: float = 1.0, namespaces=None):
+        self.name = name
+        self.search = search
+        self.embed = embed
+        self.sparse_encoder = sparse_encoder
+        self.alpha = alpha
+        self.namespaces = namespaces or [""]
+
+    def query_vectors(self, query: str):
+        """Dense query vector and, for hybrid search, the sparse one, both scaled by alpha."""
+        from sparse_encoder import hybrid_scale
+        vector = self.embed(query)
+        if self.sparse_encoder is not None:
+            sparse_vector = self.sparse_encoder.encode_query(query)
+            if sparse_vector["indices"]:
+                return hybrid_scale(list(vector), sparse_vector, self.alpha)
+        return vector, None
+
+    def search_vectors(self, vectors, top_k: int, filter: dict = None) -> list:
+        """Parent document IDs in rank order."""
+        vector, sparse_vector = vectors
+        matches = [match for namespace in self.namespaces
+                   for match in self.search(vector, top_k, namespace, filter, sparse_vector)]
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        document_ids = []
+        for match in matches[:top_k]:
+            document_id = match["metadata"].get("document_id", match["id"])
+            if document_id not in document_ids:
+                document_ids.append(document_id)
+        return document_ids
+
+
+def pinecone_search(index):
+    def search(vector, top_k, namespace, filter, sparse_vector):
+        kwargs = {"sparse_vector": sparse_vector} if sparse_vector is not None else {}
+        return index.query(vector=list(map(float, vector)), top_k=top_k, include_metadata=True,
+                           namespace=namespace, filter=filter, **kwargs)["matches"]
+    return search
+
+
+def replica_search(replica):
+    def search(vector, top_k, namespace, filter, sparse_vector):
+        return replica.query(vector, top_k=top_k, namespace=namespace, filter=filter, sparse_vector=sparse_vector)
+    return search
+
+
+def run_benchmark(backend: RetrievalBackend, golden: list, top_k: int = 10, filtered: bool = False,
+                  repeat: int = 1, per_query: bool = False, concurrency: int = 1) -> dict:
+    """
+    Runs the golden set `repeat` times through retrieve_many() with `concurrency` queries in flight and scores the
+    first run. Per-query latency is the query's own embed + search time; batch_ms is each run's wall time.
+    """
+    def search(item, vectors):
+        return backend.search_vectors(vectors, top_k, item.get("filter") if filtered else None)
+
+    latencies, embed_times, search_times, batch_times = [], [], [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        runs = retrieve_many(golden, lambda item: backend.query_vectors(item["query"]), search,
+                             max_workers=concurrency, embed_concurrency=concurrency)
+        batch_times.append((time.perf_counter() - started) * 1000)
+        for _, timings in runs:
+            embed_times.append(timings["embed_ms"])
+            search_times.append(timings["search_ms"])
+            latencies.append(timings["embed_ms"] + timings["search_ms"])
+        if len(batch_times) == 1:
+            retrieved = [document_ids for document_ids, _ in runs]
+
+    recalls = {k: [] for k in RECALL_AT if k <= top_k}
+    reciprocal_ranks, details = [], []
+    for item, document_ids in zip(golden, retrieved):
+        expected = set(item["expected"])
+        for k in recalls:
+            recalls[k].append(len(expected & set(document_ids[:k])) / len(expected))
+        rank = next((position + 1 for position, document_id in enumerate(document_ids) if document_id in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        if per_query:
+            details.append({"query": item["query"], "expected": item["expected"], "retrieved": document_ids[:top_k],
+                            "first_relevant_rank": rank})
+
+    report = {
+        "backend": backend.name,
+        "hybrid_alpha": backend.alpha if backend.sparse_encoder is not None else None,
+        "filtered": filtered,
+        "namespaces": backend.namespaces,
+        "queries": len(golden),
+        "top_k": top_k,
+        "concurrency": concurrency,
+        **{f"recall@{k}": round(float(np.mean(values)), 4) for k, values in recalls.items()},
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "latency_ms": percentiles(latencies),
+        "embed_ms": percentiles(embed_times),
+        "search_ms": percentiles(search_times),
+        "batch_ms": percentiles(batch_times),
+    }
+    if per_query:
+        report["per_query"] = details
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency on the golden query set.")
+    parser.add_argument("--golden", default=GOLDEN_QUERIES_PATH)
+    parser.add_argument("--backend", choices=["pinecone", "replica"], default="pinecone")
+    parser.add_argument("--index", help="Pinecone index (default: INDEX_NAME)")
+    parser.add_argument("--replica-dir", help="Local replica snapshot directory (--backend replica)")
+    parser.add_argument("--sparse-vocabulary", help="BM25 vocabulary for hybrid queries ('auto' with --offline)")
+    parser.add_argument("--alpha", type=float, default=0.7, help="Hybrid weight: 1.0 dense only, 0.0 sparse only")
+    parser.add_argument("--filtered", action="store_true", help="Apply the golden queries' metadata filters")
+    parser.add_argument("--namespaces", help="Comma-separated namespaces to search (default: the default namespace)")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1, help="Times each query is run for the latency figures")
+    parser.add_argument("--concurrency", type=int, default=1, help="Queries in flight at once (see batch_retrieval.py)")
+    parser.add_argument("--per-query", action="store_true", help="Include each query's retrieved documents")
+    parser.add_argument("--offline", action="store_true",
+                        help="Ingest the corpus into the stand-ins from offline_stubs.py first. Stub embeddings are "
+                             "pseudo-random, so quality figures only mean something with a sparse vocabulary and a "
+                             "low --alpha (e.g. --sparse-vocabulary auto --alpha 0).")
+    parser.add_argument("--output", help="Also write the report as JSON to this path.")
+    args = parser.parse_args(argv)
+
+    workdir = None
+    if args.offline:
+        workdir = tempfile.mkdtemp(prefix="retrieval_benchmark_")
+        os.environ.update({
+            "PINECONE_API_KEY": "offline-benchmark",
+            "BEDROCK_REQUESTS_PER_SECOND": "0", # the stub has no quota; pacing would dominate embed_ms
+            "BEDROCK_TOKENS_PER_MINUTE": "0",
+            "EMBEDDING_CACHE_PATH": "",
+            "DOCUMENT_STORE_PATH": "",
+            "NAMESPACE_ROUTING": "off",
+            "SPARSE_VECTORS": "true",
+            "SPARSE_VOCABULARY_PATH": os.path.join(workdir, "sparse_vocabulary.json"),
+            "INGEST_MANIFEST_PATH": os.path.join(workdir, "ingest_manifest.sqlite"),
+            "INGEST_JOURNAL_PATH": os.path.join(workdir, "ingest_journal.sqlite"),
+        })
+
+    import pinecone_dataload # reads the settings above
+    from local_replica import LocalReplica
+    from sparse_encoder import BM25Encoder
+
+    try:
+        if args.offline:
+            from offline_stubs import StubBedrockRuntime, StubIndex, StubPinecone
+            stub_index = StubIndex(keep_vectors=True)
+            pinecone_dataload.use_clients(pinecone_client=StubPinecone(lambda: stub_index), bedrock_runtime=StubBedrockRuntime())
+            pinecone_dataload.run_ingest(mode="full")
+            if args.sparse_vocabulary == "auto":
+                args.sparse_vocabulary = pinecone_dataload.SPARSE_VOCABULARY_PATH
+            if args.backend == "replica" and not args.replica_dir:
+                from local_replica import export_snapshot, index_metric
+                from embedding_settings import embedding_cache_model_key
+                args.replica_dir = os.path.join(workdir, "replica")
+                os.makedirs(args.replica_dir)
+                index_name = pinecone_dataload.INDEX_NAME
+                export_snapshot(stub_index, args.replica_dir, index_name,
+                                index_metric(pinecone_dataload.get_pinecone_client(), index_name),
+                                embedding_cache_model_key(), pinecone_dataload.DIMENSION)
+
+        if args.backend == "replica":
+            if not args.replica_dir:
+                parser.error("--backend replica needs --replica-dir")
+            search = replica_search(LocalReplica.load(args.replica_dir))
+        else:
+            search = pinecone_search(pinecone_dataload.get_index(args.index))
+        sparse_encoder = BM25Encoder.load(args.sparse_vocabulary) if args.sparse_vocabulary else None
+        namespaces = [ns.strip() for ns in args.namespaces.split(",")] if args.namespaces else None
+        backend = RetrievalBackend(args.backend, search, pinecone_dataload.get_embedding, sparse_encoder, args.alpha, namespaces)
+        report = run_benchmark(backend, load_golden_queries(args.golden), args.top_k, args.filtered, args.repeat, args.per_query,
+                               args.concurrency)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
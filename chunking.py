@@ -0,0 +1,140 @@
+import os
+import re
+
+# --- Chunking Configuration ---
+# Sizes are in approximate tokens (see count_tokens). Titan Text Embeddings v2 accepts up to 8,192 tokens,
+# but smaller chunks give sharper retrieval and smaller prompts.
+CHUNK_SIZE_TOKENS = int(os.getenv("CHUNK_SIZE_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_ID_SEPARATOR = "#chunk_"
+
+# Words, numbers and individual punctuation marks each count as one token. This tracks subword tokenizers
+# closely enough for budgeting without shipping a tokenizer.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Candidate sentence boundaries: terminal punctuation (optionally closed by a quote/bracket) followed by space
+_BOUNDARY_RE = re.compile(r"[.!?][\"')\]]*\s+")
+# Abbreviations that end in a period but do not end a sentence
+_ABBREVIATIONS = {"e.g.", "i.e.", "vs.", "etc.", "mr.", "ms.", "mrs.", "dr.", "inc.", "co.", "corp.", "no.", "st.", "approx."}
+_INITIALISM_RE = re.compile(r"(?:\b[A-Za-z]\.)+$") # P.O., U.S., J.P.
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count of `text`."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def split_sentences(text: str) -> list:
+    """Splits text into sentences, keeping abbreviations such as 'e.g.' and 'P.O.' inside their sentence."""
+    sentences = []
+    start = 0
+    for match in _BOUNDARY_RE.finditer(text):
+        candidate = text[start:match.start() + 1]
+        last_word = candidate.rsplit(None, 1)[-1] if candidate.strip() else ""
+        if last_word.lower() in _ABBREVIATIONS or _INITIALISM_RE.search(last_word):
+            continue
+        sentence = text[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def _split_long_sentence(sentence: str, chunk_size: int) -> list:
+    """Breaks a single sentence that exceeds the chunk size into word windows."""
+    words = sentence.split()
+    pieces, current, current_tokens = [], [], 0
+    for word in words:
+        word_tokens = count_tokens(word)
+        if current and current_tokens + word_tokens > chunk_size:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS) -> list:
+    """
+    Packs whole sentences into chunks of at most `chunk_size` tokens. Each chunk after the first starts
+    with trailing sentences of the previous chunk totalling at most `overlap` tokens.
+    """
+    if count_tokens(text) <= chunk_size:
+        return [text]
+
+    units = []
+    for sentence in split_sentences(text):
+        if count_tokens(sentence) > chunk_size:
+            units.extend(_split_long_sentence(sentence, chunk_size))
+        else:
+            units.append(sentence)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > chunk_size:
+            chunks.append(" ".join(current))
+            # Carry trailing sentences forward as overlap, without pushing the next chunk over budget
+            carried, carried_tokens = [], 0
+            for previous in reversed(current):
+                previous_tokens = count_tokens(previous)
+                if carried_tokens + previous_tokens > overlap or carried_tokens + previous_tokens + unit_tokens > chunk_size:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous_tokens
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def chunk_ids(doc_id: str, chunk_count: int) -> list:
+    """Vector IDs for a document split into `chunk_count` chunks. Unsplit documents keep their plain ID."""
+    if chunk_count <= 1:
+        return [doc_id]
+    return [f"{doc_id}{CHUNK_ID_SEPARATOR}{n}" for n in range(chunk_count)]
+
+
+def chunk_record(record: dict, chunk_size: int = CHUNK_SIZE_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS) -> list:
+    """
+    Splits a corpus record into chunk records. Each chunk record has its own 'Document ID'
+    ('doc_id#chunk_n', or the plain ID when the content fits in one chunk) and 'Content', plus
+    'Chunk Index', 'Chunk Count' and the originating 'Parent Record'.
+    """
+    texts = chunk_text(record["Content"], chunk_size, overlap)
+    ids = chunk_ids(record["Document ID"], len(texts))
+    return [
+        {"Document ID": chunk_id, "Content": text, "Chunk Index": n, "Chunk Count": len(texts), "Parent Record": record}
+        for n, (chunk_id, text) in enumerate(zip(ids, texts))
+    ]
+
+
+def collapse_chunks(docs: list) -> list:
+    """
+    Collapses retrieved LangChain Documents that are chunks of the same parent document into one Document,
+    keyed on the 'document_id' metadata. Parents keep the rank of their best chunk; their matched chunks are
+    joined in chunk order.
+    """
+    grouped = {}
+    for doc in docs:
+        parent_id = doc.metadata.get("document_id", id(doc))
+        grouped.setdefault(parent_id, []).append(doc)
+
+    collapsed = []
+    for parts in grouped.values():
+        if len(parts) == 1:
+            collapsed.append(parts[0])
+            continue
+        parts = sorted(parts, key=lambda d: d.metadata.get("chunk_index", 0))
+        head = parts[0]
+        metadata = {k: v for k, v in head.metadata.items() if k != "chunk_index"}
+        metadata["chunk_indexes"] = [d.metadata.get("chunk_index", 0) for d in parts]
+        collapsed.append(head.__class__(page_content="\n".join(d.page_content for d in parts), metadata=metadata))
+    return collapsed
@@ -0,0 +1,119 @@
+import math
+import os
+import re
+from collections import Counter
+
+from chunking import count_tokens, split_sentences
+from embedding_cache import normalize_text
+from sparse_encoder import tokenize
+
+# --- Context Assembly Configuration ---
+# Hard cap, in approximate tokens (see chunking.count_tokens), on what the prompt carries besides the instructions
+# and the question: the customer profile plus the retrieved context. 0 disables assembly (documents are joined
+# as they are). The profile may use at most PROFILE_TOKEN_SHARE of the budget; the context gets the rest.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROFILE_TOKEN_SHARE = float(os.getenv("PROFILE_TOKEN_SHARE", "0.4"))
+TRUNCATION_MARKER = "[...]"
+
+_TABLE_ROW_RE = re.compile(r"^\s*\|(.*)\|\s*$")
+_SEPARATOR_CELL_RE = re.compile(r"^-+$")
+
+
+def compact_profile(profile: str) -> str:
+    """
+    Rewrites the knowledge-graph profile tables as "Key: Value" lines: header and separator rows and the column
+    padding are dropped, section titles and other lines are kept. The facts are unchanged.
+    """
+    lines = []
+    for line in profile.splitlines():
+        row = _TABLE_ROW_RE.match(line)
+        if row is None:
+            if line.strip():
+                lines.append(line.strip())
+            continue
+        cells = [cell.strip() for cell in row.group(1).split("|")]
+        if all(_SEPARATOR_CELL_RE.match(cell) for cell in cells) or cells[:2] == ["Property", "Value"]:
+            continue
+        lines.append(f"{cells[0]}: {' | '.join(cells[1:])}" if len(cells) > 1 else cells[0])
+    return "\n".join(lines)
+
+
+def _truncate_lines(text: str, budget: int) -> str:
+    """Keeps whole lines from the top of `text` while they fit in `budget` tokens."""
+    kept, used = [], count_tokens(TRUNCATION_MARKER)
+    for line in text.splitlines():
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            return "\n".join(kept + [TRUNCATION_MARKER])
+        kept.append(line)
+        used += tokens
+    return "\n".join(kept)
+
+
+def rank_sentences(question: str, sentences: list) -> list:
+    """
+    Relevance of each sentence to the question: summed IDF (over the given sentences) of the question terms it
+    contains, divided by the square root of its length so long sentences are not favoured for length alone.
+    """
+    sentence_terms = [set(tokenize(sentence)) for sentence in sentences]
+    doc_freq = Counter(term for terms in sentence_terms for term in terms)
+    query_terms = set(tokenize(question))
+    total = len(sentences)
+    return [
+        sum(math.log(1 + total / doc_freq[term]) for term in terms & query_terms) / math.sqrt(len(terms) or 1)
+        for terms in sentence_terms
+    ]
+
+
+def assemble_context(question: str, texts: list, budget: int) -> str:
+    """
+    Joins document texts (best first) within `budget` tokens. Sentences repeated across documents are kept once.
+    If the rest does not fit, the most query-relevant sentences are kept (ties go to better-ranked documents
+    and earlier sentences) and printed in their original order.
+    """
+    sentences, seen = [], set() # (document position, sentence)
+    for position, text in enumerate(texts):
+        for sentence in split_sentences(text):
+            key = normalize_text(sentence).casefold()
+            if key not in seen:
+                seen.add(key)
+                sentences.append((position, sentence))
+
+    token_counts = [count_tokens(sentence) for _, sentence in sentences]
+    if sum(token_counts) > budget:
+        scores = rank_sentences(question, [sentence for _, sentence in sentences])
+        keep, used = set(), 0
+        for index in sorted(range(len(sentences)), key=lambda i: (-scores[i], i)):
+            if used + token_counts[index] <= budget:
+                keep.add(index)
+                used += token_counts[index]
+        sentences = [sentence for index, sentence in enumerate(sentences) if index in keep]
+
+    documents = {}
+    for position, sentence in sentences:
+        documents.setdefault(position, []).append(sentence)
+    return "\n\n".join(" ".join(documents[position]) for position in sorted(documents))
+
+
+def assemble_prompt_inputs(question: str, texts: list, profile: str, budget: int = PROMPT_TOKEN_BUDGET,
+                           profile_share: float = PROFILE_TOKEN_SHARE):
+    """
+    Returns (context, profile, stats) fitting in `budget` tokens together: the profile is compacted and, if still
+    above its share, cut at a line boundary; the context gets whatever the profile leaves.
+    """
+    raw_tokens = sum(count_tokens(text) for text in texts) + count_tokens(profile)
+    profile = compact_profile(profile)
+    profile_budget = int(budget * profile_share)
+    if count_tokens(profile) > profile_budget:
+        profile = _truncate_lines(profile, profile_budget)
+    profile_tokens = count_tokens(profile)
+    context = assemble_context(question, texts, budget - profile_tokens)
+    context_tokens = count_tokens(context)
+    stats = {
+        "raw_tokens": raw_tokens,
+        "profile_tokens": profile_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": raw_tokens - profile_tokens - context_tokens,
+        "budget": budget,
+    }
+    return context, profile, stats
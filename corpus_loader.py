@@ -0,0 +1,110 @@
+import json
+import math
+import os
+from itertools import islice
+
+# --- Corpus Loader Configuration ---
+# Number of rows read from CSV/Parquet sources per chunk. Only one chunk is held in memory at a time.
+READ_CHUNK_SIZE = int(os.getenv("CORPUS_READ_CHUNK_SIZE", "1000"))
+
+# Field names used by the ingestion pipeline (see pinecone_dataload.build_metadata)
+REQUIRED_FIELDS = ("Document ID", "Source", "Date", "Content")
+
+
+def _is_missing(value) -> bool:
+    """True for None and for the NaN that pandas uses for empty CSV cells."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _normalize_record(row: dict) -> dict:
+    """
+    Converts a raw row into the record shape used by the pipeline: empty optional columns
+    (e.g. 'Headline', 'Subject') are dropped and a JSON-encoded 'Metadata' column is decoded.
+    """
+    if not isinstance(row, dict):
+        raise ValueError(f"Corpus row is a {type(row).__name__}, expected an object")
+    record = {key: value for key, value in row.items() if not _is_missing(value)}
+    metadata = record.get("Metadata", {})
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata) if metadata.strip() else {}
+    if not isinstance(metadata, dict):
+        raise ValueError(f"'Metadata' is a {type(metadata).__name__}, expected an object")
+    # Parquet struct columns fill absent keys with None, which Pinecone metadata does not accept
+    record["Metadata"] = {key: value for key, value in metadata.items() if value is not None}
+    for field in REQUIRED_FIELDS:
+        if field not in record or (isinstance(record[field], str) and not record[field].strip()):
+            raise ValueError(f"Corpus record is missing required field '{field}'")
+    record["Document ID"] = str(record["Document ID"])
+    return record
+
+
+def _iter_jsonl(path: str):
+    """Yields the non-blank lines undecoded; iter_records decodes each one, so a malformed line skips only its row."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def _iter_csv(path: str, chunk_size: int):
+    import pandas as pd # Imported on demand; it dominates import time for callers that never read CSV
+
+    # dtype=str keeps IDs such as '001' intact; Metadata is decoded from JSON separately
+    for chunk in pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[""]):
+        for row in chunk.to_dict(orient="records"):
+            yield row
+
+
+def _iter_parquet(path: str, chunk_size: int):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet corpora requires pyarrow. Please install it with `pip install pyarrow`.")
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        for row in batch.to_pylist():
+            yield row
+
+
+def iter_records(path: str, chunk_size: int = READ_CHUNK_SIZE, stats: dict = None):
+    """
+    Lazily yields corpus records from a JSONL, CSV or Parquet file, chosen by file extension.
+    Each record uses the same field mapping as the original in-code corpus:
+    'Document ID', 'Source', 'Date', 'Content', optional 'Headline'/'Subject', and a 'Metadata' dict.
+    Malformed JSONL lines and rows missing a required field or with undecodable Metadata are reported and skipped. With a `stats` dict,
+    they are counted in stats["invalid_records"] and their document IDs, where present, collected in
+    stats["invalid_document_ids"] (so a delta run does not treat those documents as deleted).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        rows = _iter_jsonl(path)
+    elif extension == ".csv":
+        rows = _iter_csv(path, chunk_size)
+    elif extension in (".parquet", ".pq"):
+        rows = _iter_parquet(path, chunk_size)
+    else:
+        raise ValueError(f"Unsupported corpus format '{extension}' for {path}. Use .jsonl, .csv or .parquet.")
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)
+            record = _normalize_record(row)
+        except ValueError as e: # includes json.JSONDecodeError
+            document_id = row.get("Document ID") if isinstance(row, dict) else None
+            print(f"Skipping invalid corpus row {row_number} (Document ID {document_id if not _is_missing(document_id) else 'N/A'}) in {path}: {e}")
+            if stats is not None:
+                stats["invalid_records"] = stats.get("invalid_records", 0) + 1
+                if not _is_missing(document_id):
+                    stats.setdefault("invalid_document_ids", set()).add(str(document_id))
+            continue
+        yield record
+
+
+def iter_batches(iterable, batch_size: int):
+    """Groups any iterable into lists of at most `batch_size` items without materializing it."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
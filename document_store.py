@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+# --- Document Store Configuration ---
+# SQLite keeps memory-mapping up to this many bytes of the file, so repeated lookups in a warm Lambda read
+# straight from the page cache.
+MMAP_SIZE_BYTES = int(os.getenv("DOCUMENT_STORE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# SQLite limits the number of bound parameters per statement; lookups are split into groups of this size.
+LOOKUP_BATCH_SIZE = 500
+
+
+class DocumentStore:
+    """
+    SQLite-backed store of document (chunk) bodies keyed by the Pinecone vector ID, so the index only has to
+    carry filterable metadata. Ingestion writes it; the Lambda opens a bundled copy read-only and fetches the
+    bodies of all search hits with one lookup. The store is safe to share between threads.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            # immutable=1 skips locking, which also lets the file live on Lambda's read-only code volume
+            uri = f"file:{quote(os.path.abspath(path))}?mode=ro&immutable=1"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, content TEXT NOT NULL)")
+            self._conn.commit()
+        self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+
+    def put_many(self, items) -> None:
+        """Stores (vector_id, content) pairs, replacing existing bodies."""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO documents (id, content) VALUES (?, ?)", items)
+            self._conn.commit()
+
+    def get_many(self, ids) -> dict:
+        """Returns {vector_id: content} for the IDs that are present in the store."""
+        ids = list(ids)
+        contents = {}
+        with self._lock:
+            for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                group = ids[i : i + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(group))
+                rows = self._conn.execute(f"SELECT id, content FROM documents WHERE id IN ({placeholders})", group)
+                contents.update(rows)
+        return contents
+
+    def delete_many(self, ids) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE id = ?", ((vector_id,) for vector_id in ids))
+            self._conn.commit()
+
+    def checkpoint(self) -> None:
+        """Folds the write-ahead log into the main file, so the file alone can be copied into a deployment package."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+# --- Embedding Cache Configuration ---
+# Default on-disk budget for cached vectors. A 1024-dim float32 vector is 4 KB, so 512 MB holds ~130K texts.
+DEFAULT_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# When the budget is exceeded, evict least-recently-used entries until usage drops to this fraction.
+EVICTION_TARGET_RATIO = 0.9
+# Hits record their access time in memory; the times are written on the next put, eviction or close, or once this
+# many are pending, so a run of hits costs no SQLite writes.
+ACCESS_FLUSH_SIZE = 1000
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapses runs of whitespace so trivially reformatted text maps to the same cache entry."""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed cache of embedding vectors stored in SQLite.
+    Entries are keyed by (model ID, dimension, SHA-256 of the normalized text) and vectors are stored
+    as packed float32 blobs. The cache is safe to share between threads.
+    """
+
+    def __init__(self, path: str, model_id: str, dimension: int, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.model_id = model_id
+        self.dimension = dimension
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._pending_access = {} # key -> last access time not yet written
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._size_bytes = row[0]
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_id}:{self.dimension}:{digest}"
+
+    def get(self, text: str):
+        """Returns the cached embedding for `text` as a list of floats, or None on a miss."""
+        blob = self.get_raw(text)
+        if blob is None:
+            return None
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_raw(self, text: str):
+        """Returns the cached embedding for `text` as packed float32 bytes, or None on a miss."""
+        key = self._key(text)
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._pending_access[key] = time.time()
+            if len(self._pending_access) >= ACCESS_FLUSH_SIZE:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, text: str, embedding) -> None:
+        """Stores `embedding` for `text`, evicting least-recently-used entries if over budget."""
+        if hasattr(embedding, "astype"): # NumPy array
+            blob = embedding.astype("float32").tobytes()
+        else:
+            blob = array("f", embedding).tobytes()
+        key = self._key(text)
+        with self._lock:
+            self._flush_access()
+            existing = self._conn.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model_id, dimension, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, self.model_id, self.dimension, blob, time.time()),
+            )
+            self._size_bytes += len(blob) - (existing[0] if existing else 0)
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _flush_access(self) -> None:
+        """Writes the pending access times, so eviction order reflects every hit. Caller holds the lock and commits."""
+        if self._pending_access:
+            self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._pending_access.items()])
+            self._pending_access.clear()
+
+    def _evict(self) -> None:
+        """Deletes the least-recently-used entries until usage is below the eviction target. Caller holds the lock."""
+        target = int(self.max_bytes * EVICTION_TARGET_RATIO)
+        to_free = self._size_bytes - target
+        victims = []
+        for key, size in self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access"):
+            if to_free <= 0:
+                break
+            victims.append((key,))
+            to_free -= size
+            self._size_bytes -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the current on-disk vector volume."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,31 @@
+import json
+import os
+
+# --- Embedding Model Settings ---
+# Shared by ingestion (pinecone_dataload.py) and the Lambda's BedrockEmbeddings so documents and queries are
+# always embedded with the same model, dimension and normalization. Titan Text Embeddings v2 supports 256,
+# 512 and 1024 dimensions; smaller vectors cut Pinecone storage, query payloads and latency.
+# The Pinecone index dimension must match EMBEDDING_DIMENSION (see migrate_embedding_dimension.py).
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
+TITAN_V2_DIMENSIONS = (256, 512, 1024)
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1024"))
+# Titan v2 returns unit-length vectors by default, which is what the cosine index expects
+EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "true").strip().lower() in ("1", "true", "yes")
+
+if EMBEDDING_DIMENSION not in TITAN_V2_DIMENSIONS:
+    raise ValueError(f"EMBEDDING_DIMENSION must be one of {TITAN_V2_DIMENSIONS}, got {EMBEDDING_DIMENSION}.")
+
+
+def titan_model_kwargs(dimension: int = EMBEDDING_DIMENSION, normalize: bool = EMBEDDING_NORMALIZE) -> dict:
+    """Request fields selecting the output dimension and normalization, e.g. for BedrockEmbeddings(model_kwargs=...)."""
+    return {"dimensions": dimension, "normalize": normalize}
+
+
+def titan_request_body(text: str, dimension: int = EMBEDDING_DIMENSION, normalize: bool = EMBEDDING_NORMALIZE) -> str:
+    """JSON body for a Titan Text Embeddings v2 invoke_model call."""
+    return json.dumps({"inputText": text, **titan_model_kwargs(dimension, normalize)})
+
+
+def embedding_cache_model_key(model_id: str = EMBEDDING_MODEL_ID, normalize: bool = EMBEDDING_NORMALIZE) -> str:
+    """Model identifier used in embedding cache keys; normalized and raw vectors must not share entries."""
+    return f"{model_id}:{'normalized' if normalize else 'raw'}"
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import time
+import uuid
+
+# --- Journal Configuration ---
+# The journal records the progress of each ingestion run as its batches are committed, so a run that fails
+# partway can be resumed without re-embedding and re-upserting the documents it already finished.
+DEFAULT_JOURNAL_PATH = os.getenv("INGEST_JOURNAL_PATH", "ingest_journal.sqlite")
+
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+EMBEDDED = "embedded"
+UPSERTED = "upserted"
+
+# A run that changes the index also writes a marker vector, in a namespace of its own that is never searched,
+# naming that run. Copies of the index such as local replica snapshots record the marker's run ID and compare it
+# with the live one to detect any later change, including content or metadata updates that keep vector counts.
+# The run marks itself in progress before its first change and writes its own ID only after its last, so a copy
+# taken during the run, or after a run whose final marker write failed, never matches the live marker.
+INDEX_MARKER_NAMESPACE = "__ingest_state__"
+INDEX_MARKER_ID = "latest_run"
+IN_PROGRESS_SUFFIX = ":in-progress"
+
+
+def write_index_marker(index, run_id: str, dimension: int, in_progress: bool = False) -> None:
+    """Records `run_id` as the last run that changed `index`, or, with `in_progress`, as the run changing it now."""
+    values = [0.0] * dimension
+    values[0] = 1.0 # Pinecone rejects all-zero dense vectors
+    marker_run_id = run_id + IN_PROGRESS_SUFFIX if in_progress else run_id
+    index.upsert(vectors=[(INDEX_MARKER_ID, values, {"run_id": marker_run_id, "updated": time.time()})],
+                 namespace=INDEX_MARKER_NAMESPACE)
+
+
+class IngestJournal:
+    """
+    Local SQLite journal of ingestion runs and, per run, the documents that were embedded and upserted.
+    Documents are stored with their content hash, so a resumed run only skips a document if its content
+    has not changed since it was written.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                corpus_path TEXT NOT NULL,
+                index_name TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS run_documents (
+                run_id TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                PRIMARY KEY (run_id, doc_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def start_run(self, corpus_path: str, index_name: str, mode: str) -> str:
+        """Registers a new run and returns its run ID."""
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn.execute(
+            "INSERT INTO runs (run_id, corpus_path, index_name, mode, status, started, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, os.path.abspath(corpus_path), index_name, mode, RUNNING, now, now),
+        )
+        self._conn.commit()
+        return run_id
+
+    def resumable_run(self, corpus_path: str, index_name: str, mode: str):
+        """Returns the ID of the latest unfinished run over the same corpus, index and mode, or None."""
+        row = self._conn.execute(
+            "SELECT run_id FROM runs WHERE corpus_path = ? AND index_name = ? AND mode = ? AND status != ? "
+            "ORDER BY started DESC LIMIT 1",
+            (os.path.abspath(corpus_path), index_name, mode, FINISHED),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_status(self, run_id: str, status: str) -> None:
+        self._conn.execute("UPDATE runs SET status = ?, updated = ? WHERE run_id = ?", (status, time.time(), run_id))
+        self._conn.commit()
+
+    def finish_run(self, run_id: str) -> None:
+        """Marks a run as finished and drops its per-document entries, which are only needed to resume it."""
+        self._conn.execute("DELETE FROM run_documents WHERE run_id = ?", (run_id,))
+        self.set_status(run_id, FINISHED)
+
+    def record(self, run_id: str, stage: str, documents) -> None:
+        """Records (doc_id, content_hash) pairs as having reached `stage` (EMBEDDED or UPSERTED) in a run."""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO run_documents (run_id, doc_id, content_hash, stage) VALUES (?, ?, ?, ?)",
+            ((run_id, doc_id, c_hash, stage) for doc_id, c_hash in documents),
+        )
+        self._conn.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (time.time(), run_id))
+        self._conn.commit()
+
+    def upserted_documents(self, run_id: str) -> dict:
+        """Returns {doc_id: content_hash} for the documents a run finished writing."""
+        rows = self._conn.execute(
+            "SELECT doc_id, content_hash FROM run_documents WHERE run_id = ? AND stage = ?", (run_id, UPSERTED)
+        )
+        return dict(rows)
+
+    def progress(self, run_id: str) -> dict:
+        """Number of documents per stage for a run."""
+        rows = self._conn.execute("SELECT stage, COUNT(*) FROM run_documents WHERE run_id = ? GROUP BY stage", (run_id,))
+        return dict(rows)
+
+    def close(self) -> None:
+        self._conn.close()
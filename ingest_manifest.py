@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# --- Manifest Configuration ---
+# The manifest records what was last written to Pinecone for each document so that later runs can
+# compute a delta (new, changed, metadata-only, unchanged, deleted) instead of re-upserting everything.
+DEFAULT_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.sqlite")
+
+NEW = "new"
+CHANGED = "changed"
+METADATA_ONLY = "metadata_only"
+UNCHANGED = "unchanged"
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the document body."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def metadata_hash(metadata: dict) -> str:
+    """SHA-256 of the metadata dict, independent of key order."""
+    canonical = json.dumps(metadata, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Local SQLite manifest of (document ID, content hash, metadata hash, namespace, chunk count, last-ingested
+    timestamp). "" is Pinecone's default namespace.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                metadata_hash TEXT NOT NULL,
+                last_ingested REAL NOT NULL,
+                chunk_count INTEGER NOT NULL DEFAULT 1,
+                namespace TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        # Manifests written before chunking was introduced have no chunk_count column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "chunk_count" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN chunk_count INTEGER NOT NULL DEFAULT 1")
+        # ...and manifests written before namespace routing have no namespace column
+        if "namespace" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def classify(self, doc_id: str, content_digest: str, metadata_digest: str) -> str:
+        """Returns NEW, CHANGED, METADATA_ONLY or UNCHANGED for a document compared to the manifest."""
+        row = self._conn.execute(
+            "SELECT content_hash, metadata_hash FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if row is None:
+            return NEW
+        if row[0] != content_digest:
+            return CHANGED
+        if row[1] != metadata_digest:
+            return METADATA_ONLY
+        return UNCHANGED
+
+    def chunk_count(self, doc_id: str) -> int:
+        """Number of vectors last written for a document, or 0 if it is not in the manifest."""
+        row = self._conn.execute("SELECT chunk_count FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else 0
+
+    def namespace(self, doc_id: str):
+        """Namespace a document was last written to, or None if it is not in the manifest."""
+        row = self._conn.execute("SELECT namespace FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, entries) -> None:
+        """
+        Marks documents as ingested now. `entries` is an iterable of
+        (doc_id, content_hash, metadata_hash, namespace, chunk_count).
+        """
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO documents (doc_id, content_hash, metadata_hash, last_ingested, chunk_count, namespace) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((doc_id, c_hash, m_hash, now, chunks, namespace) for doc_id, c_hash, m_hash, namespace, chunks in entries),
+        )
+        self._conn.commit()
+
+    def remove(self, doc_ids) -> None:
+        """Forgets documents that were deleted from the index."""
+        self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", ((doc_id,) for doc_id in doc_ids))
+        self._conn.commit()
+
+    def missing_documents(self, seen_ids) -> list:
+        """
+        Returns (doc_id, chunk_count, namespace) for manifest documents that are not in `seen_ids`,
+        i.e. documents removed from the source.
+        """
+        seen_ids = set(seen_ids)
+        rows = self._conn.execute("SELECT doc_id, chunk_count, namespace FROM documents")
+        return [(doc_id, chunks, namespace) for doc_id, chunks, namespace in rows if doc_id not in seen_ids]
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
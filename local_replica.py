@@ -0,0 +1,365 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ingest_journal import INDEX_MARKER_ID, INDEX_MARKER_NAMESPACE, IN_PROGRESS_SUFFIX
+
+# --- Local Replica Configuration ---
+# A local replica is a versioned snapshot of the Pinecone index (vectors, metadata and sparse values) that the
+# Lambda loads at cold start and searches in process instead of making a network round trip per query.
+# Snapshots are written to <snapshot dir>/<version>/ and <snapshot dir>/LATEST names the current version:
+#
+#   python local_replica.py --out replica_snapshot            # export INDEX_NAME (all namespaces)
+#
+# Namespaces below REPLICA_HNSW_MIN_VECTORS are searched exactly with NumPy; larger ones get an HNSW graph when
+# hnswlib is installed (pip install hnswlib), built at export time and saved with the snapshot.
+REPLICA_HNSW_MIN_VECTORS = int(os.getenv("REPLICA_HNSW_MIN_VECTORS", "20000"))
+REPLICA_KEEP_VERSIONS = 2 # Older snapshot versions are deleted after a successful export
+FETCH_BATCH_SIZE = 100 # IDs per Pinecone fetch request (they are sent in the URL)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+FILTER_MASK_CACHE_SIZE = 128 # Boolean row masks of recently used metadata filters
+SNAPSHOT_FORMAT_VERSION = 1
+LATEST_FILE = "LATEST"
+
+
+def _field(obj, name):
+    """Reads `name` from a Pinecone response object or a plain dict."""
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def read_index_marker(index):
+    """Run ID of the last ingestion run that changed `index` (see ingest_journal.py), or None if none recorded one."""
+    vectors = _field(index.fetch(ids=[INDEX_MARKER_ID], namespace=INDEX_MARKER_NAMESPACE), "vectors") or {}
+    marker = vectors.get(INDEX_MARKER_ID)
+    return (_field(marker, "metadata") or {}).get("run_id") if marker is not None else None
+
+
+def index_metric(pinecone_client, index_name: str) -> str:
+    """The similarity metric `index_name` was created with, as reported by Pinecone."""
+    return _field(pinecone_client.describe_index(index_name), "metric")
+
+
+def matches_filter(metadata: dict, filter: dict) -> bool:
+    """Evaluates a Pinecone metadata filter ($eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $exists, $and, $or)."""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif not _matches_condition(metadata, key, condition if isinstance(condition, dict) else {"$eq": condition}):
+            return False
+    return True
+
+
+def _matches_condition(metadata: dict, key: str, condition: dict) -> bool:
+    present = key in metadata
+    value = metadata.get(key)
+    values = value if isinstance(value, list) else [value] # list fields match if any element does
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            ok = present == operand
+        elif not present:
+            ok = operator in ("$ne", "$nin")
+        elif operator == "$eq":
+            ok = operand in values
+        elif operator == "$ne":
+            ok = operand not in values
+        elif operator == "$in":
+            ok = any(item in operand for item in values)
+        elif operator == "$nin":
+            ok = not any(item in operand for item in values)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            ok = isinstance(value, (int, float)) and {
+                "$gt": value > operand, "$gte": value >= operand, "$lt": value < operand, "$lte": value <= operand
+            }[operator]
+        else:
+            raise ValueError(f"Unsupported metadata filter operator '{operator}'.")
+        if not ok:
+            return False
+    return True
+
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        return None
+    return hnswlib
+
+
+def export_snapshot(index, snapshot_dir: str, index_name: str, metric: str, model_key: str, dimension: int,
+                    namespaces=None) -> str:
+    """
+    Copies every vector of `index` (or of `namespaces`) into a new snapshot version under `snapshot_dir` and
+    points LATEST at it. `metric` should be the index's own (index_metric()), not the local configuration.
+    Requires a serverless index, which supports listing IDs. Returns the version path.
+    """
+    stats = index.describe_index_stats()
+    namespace_counts = {name: _field(summary, "vector_count") for name, summary in (_field(stats, "namespaces") or {}).items()}
+    if namespaces is None:
+        namespaces = sorted(name for name in namespace_counts if name != INDEX_MARKER_NAMESPACE)
+    namespaces = list(namespaces)
+    ingest_run_id = read_index_marker(index) # read before the export, so changes made during it show up as stale
+
+    version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    version_dir = os.path.join(snapshot_dir, version)
+    temp_dir = f"{version_dir}.tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    ids, metadata, dense = [], [], []
+    sparse_indptr, sparse_indices, sparse_values = [0], [], []
+    namespace_rows = {}
+    for namespace in namespaces:
+        start = len(ids)
+        for id_page in index.list(namespace=namespace):
+            for offset in range(0, len(id_page), FETCH_BATCH_SIZE):
+                fetched = _field(index.fetch(ids=id_page[offset : offset + FETCH_BATCH_SIZE], namespace=namespace), "vectors")
+                for vector_id, vector in fetched.items():
+                    ids.append(vector_id)
+                    metadata.append(dict(_field(vector, "metadata") or {}))
+                    dense.append(np.asarray(_field(vector, "values"), dtype=np.float32))
+                    sparse = _field(vector, "sparse_values")
+                    if sparse:
+                        sparse_indices.extend(_field(sparse, "indices"))
+                        sparse_values.extend(_field(sparse, "values"))
+                    sparse_indptr.append(len(sparse_indices))
+        namespace_rows[namespace] = [start, len(ids)]
+        print(f"Exported {len(ids) - start} vectors from namespace '{namespace or '(default)'}'.")
+
+    vectors = np.stack(dense) if dense else np.empty((0, dimension), dtype=np.float32)
+    np.save(os.path.join(temp_dir, "vectors.npy"), vectors)
+    np.savez(os.path.join(temp_dir, "sparse.npz"), indptr=np.asarray(sparse_indptr, dtype=np.int64),
+             indices=np.asarray(sparse_indices, dtype=np.int32), values=np.asarray(sparse_values, dtype=np.float32))
+    with open(os.path.join(temp_dir, "records.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "metadata": metadata}, f, separators=(",", ":"))
+
+    hnsw_namespaces = []
+    hnswlib = _import_hnswlib()
+    for position, (namespace, (start, end)) in enumerate(namespace_rows.items()):
+        if end - start < REPLICA_HNSW_MIN_VECTORS:
+            continue
+        if hnswlib is None:
+            print(f"Namespace '{namespace}' has {end - start} vectors but hnswlib is not installed; it will be searched exactly.")
+            continue
+        graph = hnswlib.Index(space="cosine" if metric == "cosine" else "ip", dim=vectors.shape[1])
+        graph.init_index(max_elements=end - start, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        graph.add_items(vectors[start:end], np.arange(end - start))
+        graph.save_index(os.path.join(temp_dir, f"hnsw-{position}.bin"))
+        hnsw_namespaces.append(namespace)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT_VERSION,
+        "version": version,
+        "created": time.time(),
+        "index_name": index_name,
+        "metric": metric,
+        "model_key": model_key,
+        "dimension": dimension,
+        "namespaces": {namespace: {"rows": rows, "hnsw": namespace in hnsw_namespaces} for namespace, rows in namespace_rows.items()},
+        "index_counts": {namespace: namespace_counts.get(namespace, 0) for namespace in namespaces},
+        "ingest_run_id": ingest_run_id,
+    }
+    with open(os.path.join(temp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_dir, version_dir)
+    with open(os.path.join(snapshot_dir, f"{LATEST_FILE}.tmp"), "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(os.path.join(snapshot_dir, f"{LATEST_FILE}.tmp"), os.path.join(snapshot_dir, LATEST_FILE))
+
+    versions = sorted(name for name in os.listdir(snapshot_dir)
+                      if os.path.isdir(os.path.join(snapshot_dir, name)) and not name.endswith(".tmp"))
+    for old_version in versions[:-REPLICA_KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(snapshot_dir, old_version), ignore_errors=True)
+    return version_dir
+
+
+class LocalReplica:
+    """
+    In-memory copy of a Pinecone index loaded from a snapshot. query() returns matches shaped like Pinecone's
+    ({"id", "score", "metadata"}), scored the same way: cosine or dot product on the dense values, plus the
+    sparse dot product for hybrid queries. Plain dense queries on namespaces with an HNSW graph are approximate;
+    filtered and hybrid queries are always exact NumPy scans over the namespace.
+    """
+
+    def __init__(self, manifest: dict, vectors: np.ndarray, ids: list, metadata: list, sparse: dict, graphs: dict):
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.metric = manifest["metric"]
+        self.ids = ids
+        self.metadata = metadata
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.namespace_rows = {namespace: tuple(info["rows"]) for namespace, info in manifest["namespaces"].items()}
+        self.graphs = graphs # namespace -> hnswlib.Index over that namespace's rows
+        self.sparse_indptr = sparse["indptr"]
+        self.sparse_indices = sparse["indices"]
+        self.sparse_values = sparse["values"]
+        # Row of every stored sparse entry, so a sparse dot product is one gather and one bincount
+        self.sparse_rows = np.repeat(np.arange(len(ids)), np.diff(self.sparse_indptr))
+        self._filter_masks = OrderedDict() # LRU of (namespace, filter) -> row mask, shared by query threads
+        self._filter_masks_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, snapshot_dir: str, version: str = None) -> "LocalReplica":
+        """Loads `version`, or the version named in LATEST."""
+        if version is None:
+            with open(os.path.join(snapshot_dir, LATEST_FILE), encoding="utf-8") as f:
+                version = f.read().strip()
+        version_dir = os.path.join(snapshot_dir, version)
+        with open(os.path.join(version_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported replica snapshot format {manifest.get('format')} in '{version_dir}'.")
+        with open(os.path.join(version_dir, "records.json"), encoding="utf-8") as f:
+            records = json.load(f)
+        with np.load(os.path.join(version_dir, "sparse.npz")) as sparse_file:
+            sparse = {name: sparse_file[name] for name in ("indptr", "indices", "values")}
+        graphs = {}
+        hnswlib = _import_hnswlib()
+        for position, (namespace, info) in enumerate(manifest["namespaces"].items()):
+            if info["hnsw"] and hnswlib is not None:
+                start, end = info["rows"]
+                graph = hnswlib.Index(space="cosine" if manifest["metric"] == "cosine" else "ip", dim=manifest["dimension"])
+                graph.load_index(os.path.join(version_dir, f"hnsw-{position}.bin"), max_elements=end - start)
+                graph.set_ef(HNSW_EF_SEARCH)
+                graphs[namespace] = graph
+        vectors = np.load(os.path.join(version_dir, "vectors.npy"))
+        return cls(manifest, vectors, records["ids"], records["metadata"], sparse, graphs)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def serves(self, namespace: str) -> bool:
+        return (namespace or "") in self.namespace_rows
+
+    def age_seconds(self) -> float:
+        return time.time() - self.manifest["created"]
+
+    def expired(self, max_age_seconds: float) -> bool:
+        """True once the snapshot is older than `max_age_seconds` (0 = never). Cheap enough to check per query."""
+        return bool(max_age_seconds) and self.age_seconds() > max_age_seconds
+
+    def staleness(self, model_key: str, dimension: int, max_age_seconds: float = 0, index=None):
+        """
+        Returns why the snapshot must not be used, or None if it is fresh: a different embedding model or
+        dimension, older than `max_age_seconds` (0 = no limit), or, with `index`, a change to the live index since
+        the export. Changes are detected by the ingest run ID in the index marker; snapshots or indexes without
+        one fall back to comparing vector counts, which misses updates that keep the counts.
+        """
+        if self.manifest["model_key"] != model_key or self.manifest["dimension"] != dimension:
+            return (f"built for {self.manifest['model_key']} at {self.manifest['dimension']} dims, "
+                    f"expected {model_key} at {dimension}")
+        if self.expired(max_age_seconds):
+            return f"{self.age_seconds() / 3600:.1f} hours old"
+        if index is None:
+            return None
+        snapshot_run_id = self.manifest.get("ingest_run_id")
+        live_run_id = read_index_marker(index) if snapshot_run_id else None
+        if snapshot_run_id and live_run_id:
+            if snapshot_run_id.endswith(IN_PROGRESS_SUFFIX):
+                return f"exported while ingest run {snapshot_run_id[:-len(IN_PROGRESS_SUFFIX)]} was changing the index"
+            if live_run_id != snapshot_run_id:
+                return f"index changed by ingest run {live_run_id} after the snapshot (run {snapshot_run_id})"
+            return None
+        namespaces = _field(index.describe_index_stats(), "namespaces") or {}
+        for namespace, (start, end) in self.namespace_rows.items():
+            live = _field(namespaces[namespace], "vector_count") if namespace in namespaces else 0
+            if live != end - start:
+                return f"namespace '{namespace or '(default)'}' has {live} vectors in the index, {end - start} in the snapshot"
+        return None
+
+    def _filter_mask(self, namespace: str, filter: dict) -> np.ndarray:
+        key = (namespace, json.dumps(filter, sort_keys=True))
+        with self._filter_masks_lock:
+            mask = self._filter_masks.get(key)
+            if mask is not None:
+                self._filter_masks.move_to_end(key)
+                return mask
+        # Built outside the lock; two threads may build the same mask, and both results are identical
+        start, end = self.namespace_rows[namespace]
+        mask = np.fromiter((matches_filter(self.metadata[row], filter) for row in range(start, end)), dtype=bool, count=end - start)
+        with self._filter_masks_lock:
+            self._filter_masks[key] = mask
+            self._filter_masks.move_to_end(key)
+            if len(self._filter_masks) > FILTER_MASK_CACHE_SIZE:
+                self._filter_masks.popitem(last=False)
+        return mask
+
+    def _sparse_scores(self, start: int, end: int, sparse_vector: dict) -> np.ndarray:
+        query_indices = np.asarray(sparse_vector["indices"], dtype=np.int64)
+        lo, hi = self.sparse_indptr[start], self.sparse_indptr[end]
+        if not len(query_indices) or lo == hi:
+            return np.zeros(end - start, dtype=np.float32)
+        indices = self.sparse_indices[lo:hi]
+        weights = np.zeros(max(int(indices.max()), int(query_indices.max())) + 1, dtype=np.float32)
+        weights[query_indices] = sparse_vector["values"]
+        contributions = self.sparse_values[lo:hi] * weights[indices]
+        return np.bincount(self.sparse_rows[lo:hi] - start, weights=contributions, minlength=end - start).astype(np.float32)
+
+    def query(self, vector, top_k: int = 4, namespace: str = "", filter: dict = None, sparse_vector: dict = None,
+              include_values: bool = False) -> list:
+        namespace = namespace or ""
+        start, end = self.namespace_rows[namespace]
+        if end == start or top_k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        if self.metric == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+
+        graph = self.graphs.get(namespace)
+        if graph is not None and filter is None and sparse_vector is None:
+            labels, distances = graph.knn_query(query, k=min(top_k, end - start))
+            rows = labels[0].astype(np.int64)
+            scores = 1.0 - distances[0] # hnswlib distances are 1 - cosine ("cosine") and 1 - dot ("ip")
+        else:
+            scores = self.vectors[start:end] @ query
+            if sparse_vector is not None:
+                scores = scores + self._sparse_scores(start, end, sparse_vector)
+            candidates = np.arange(end - start)
+            if filter:
+                candidates = np.flatnonzero(self._filter_mask(namespace, filter))
+                scores = scores[candidates]
+            if len(candidates) > top_k:
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            rows, scores = candidates[top], scores[top]
+        matches = [{"id": self.ids[start + row], "score": float(score), "metadata": self.metadata[start + row]}
+                   for row, score in zip(rows, scores)]
+        if include_values:
+            for match, row in zip(matches, rows):
+                match["values"] = self.vectors[start + row] # unit length for cosine indexes
+        return matches
+
+
+if __name__ == "__main__":
+    import argparse
+    import pinecone_dataload
+    from embedding_settings import embedding_cache_model_key
+    parser = argparse.ArgumentParser(description="Export a Pinecone index into a local replica snapshot.")
+    parser.add_argument("--out", required=True, help="Snapshot directory; a new version is added under it.")
+    parser.add_argument("--index", help=f"Index to export (default: {pinecone_dataload.INDEX_NAME})")
+    parser.add_argument("--namespaces", help="Comma-separated namespaces (default: all).")
+    args = parser.parse_args()
+    index_name = args.index or pinecone_dataload.INDEX_NAME
+    os.makedirs(args.out, exist_ok=True)
+    path = export_snapshot(
+        pinecone_dataload.get_index(index_name), args.out, index_name,
+        index_metric(pinecone_dataload.get_pinecone_client(), index_name),
+        embedding_cache_model_key(), pinecone_dataload.DIMENSION,
+        [ns.strip() for ns in args.namespaces.split(",")] if args.namespaces is not None else None,
+    )
+    print(f"Replica snapshot written to '{path}'.")
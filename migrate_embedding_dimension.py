@@ -0,0 +1,129 @@
+import argparse
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from corpus_loader import iter_records
+from embedding_settings import TITAN_V2_DIMENSIONS
+from namespace_routing import NamespaceRouter, NAMESPACE_ROUTING
+from pinecone_dataload import CORPUS_PATH, DIMENSION, INDEX_NAME, get_embedding, get_index, run_ingest
+
+# --- Embedding Dimension Migration ---
+# Builds a Pinecone index at a reduced Titan v2 dimension next to the current one, then measures how well it
+# reproduces the current index's results. Once recall is acceptable, point INDEX_NAME and EMBEDDING_DIMENSION
+# (for both ingestion and the Lambda) at the new index and delete the old one.
+#
+#   python migrate_embedding_dimension.py --target-dimension 512
+#   python migrate_embedding_dimension.py --target-dimension 256 --skip-build --queries-file queries.txt
+DEFAULT_TOP_K = 10
+DEFAULT_SAMPLE_SIZE = 50
+NAMESPACE_FANOUT_WORKERS = 4
+
+
+def sample_queries(corpus_path, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Uses record headlines or subjects (falling back to the first 200 characters of content) as queries."""
+    queries = []
+    for record in itertools.islice(iter_records(corpus_path), sample_size):
+        queries.append(record.get("Headline") or record.get("Subject") or record["Content"][:200])
+    return queries
+
+
+def routed_namespaces():
+    """Namespaces ingestion writes to under NAMESPACE_ROUTING; just the default namespace when routing is off."""
+    router = NamespaceRouter.from_config(NAMESPACE_ROUTING)
+    return router.namespaces if router is not None else [""]
+
+
+def top_k_ids(index, query_text, dimension, top_k, namespaces=("",), executor=None):
+    """
+    Returns (vector IDs of the top_k matches, query seconds) for `query_text` embedded at `dimension`. Several
+    namespaces are queried in parallel on `executor` and their matches merged by score.
+    """
+    embedding = get_embedding(query_text, dimension)
+    if embedding is None:
+        return None, 0.0
+    vector = embedding.tolist()
+
+    def search(namespace):
+        return index.query(vector=vector, top_k=top_k, include_metadata=False, namespace=namespace).matches
+
+    started = time.perf_counter()
+    if len(namespaces) > 1 and executor is not None:
+        matches = [match for results in executor.map(search, namespaces) for match in results]
+    else:
+        matches = [match for namespace in namespaces for match in search(namespace)]
+    matches.sort(key=lambda match: match.score, reverse=True)
+    return [match.id for match in matches[:top_k]], time.perf_counter() - started
+
+
+def compare_indexes(queries, source_index_name, source_dimension, target_index_name, target_dimension, top_k=DEFAULT_TOP_K):
+    """
+    Queries both indexes with each query and returns a report of recall@k of the target index, taking the
+    source index's top_k results as ground truth, along with query latencies and vector sizes. With namespace
+    routing on, every routed namespace is searched.
+    """
+    source_index, target_index = get_index(source_index_name), get_index(target_index_name)
+    namespaces = routed_namespaces()
+    executor = ThreadPoolExecutor(max_workers=NAMESPACE_FANOUT_WORKERS, thread_name_prefix="namespace") if len(namespaces) > 1 else None
+    recalls, source_seconds, target_seconds = [], [], []
+    for query_text in queries:
+        source_ids, source_elapsed = top_k_ids(source_index, query_text, source_dimension, top_k, namespaces, executor)
+        target_ids, target_elapsed = top_k_ids(target_index, query_text, target_dimension, top_k, namespaces, executor)
+        if not source_ids or target_ids is None:
+            print(f"Skipping query '{query_text[:50]}': no results from the source index or embedding failed.")
+            continue
+        recalls.append(len(set(source_ids) & set(target_ids)) / len(source_ids))
+        source_seconds.append(source_elapsed)
+        target_seconds.append(target_elapsed)
+    if executor is not None:
+        executor.shutdown()
+
+    if not recalls:
+        return {"queries": 0}
+    return {
+        "queries": len(recalls),
+        "namespaces": namespaces,
+        f"mean_recall@{top_k}": round(float(np.mean(recalls)), 4),
+        f"min_recall@{top_k}": round(float(np.min(recalls)), 4),
+        "source_p50_query_ms": round(float(np.percentile(source_seconds, 50)) * 1000, 1),
+        "target_p50_query_ms": round(float(np.percentile(target_seconds, 50)) * 1000, 1),
+        "source_vector_bytes": source_dimension * 4,
+        "target_vector_bytes": target_dimension * 4,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a reduced-dimension index side by side and report its recall.")
+    parser.add_argument("--target-dimension", type=int, required=True,
+                        choices=[d for d in TITAN_V2_DIMENSIONS if d != DIMENSION])
+    parser.add_argument("--target-index", help="Defaults to '<INDEX_NAME>-<target dimension>'.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--queries-file", help="One query per line. Defaults to headlines sampled from the corpus.")
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE)
+    parser.add_argument("--skip-build", action="store_true", help="Only compare; the target index already exists.")
+    args = parser.parse_args(argv)
+
+    target_index = args.target_index or f"{INDEX_NAME}-{args.target_dimension}"
+    if not args.skip_build:
+        # A full run with its own manifest, so the current index's manifest is left untouched
+        run_ingest(corpus_path=args.corpus, mode="full", index_name=target_index, dimension=args.target_dimension,
+                   manifest_path=f"ingest_manifest_{args.target_dimension}.sqlite")
+
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(args.corpus, args.sample_size)
+
+    print(f"Comparing '{target_index}' ({args.target_dimension}-dim) against '{INDEX_NAME}' ({DIMENSION}-dim) "
+          f"on {len(queries)} queries, top_k={args.top_k}...")
+    report = compare_indexes(queries, INDEX_NAME, DIMENSION, target_index, args.target_dimension, args.top_k)
+    print(f"Migration recall report: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
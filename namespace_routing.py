@@ -0,0 +1,62 @@
+import json
+import os
+import re
+
+# --- Namespace Routing Configuration ---
+# NAMESPACE_ROUTING selects how ingestion assigns records to Pinecone namespaces:
+#   "off" (default)  - everything goes to the default namespace, as before
+#   "default"        - DEFAULT_RULES below
+#   <path>.json      - {"rules": [...], "default_namespace": "..."} with rules in the same shape as DEFAULT_RULES
+NAMESPACE_ROUTING = os.getenv("NAMESPACE_ROUTING", "off")
+
+# Rules are tried in order and the first match wins. A rule matches when every condition it names holds:
+#   "source":       regular expression searched in the record's Source
+#   "metadata_key": the record's Metadata contains this key
+#   "metadata":     {key: value} pairs that must all be equal in the record's Metadata
+DEFAULT_RULES = [
+    {"namespace": "policy", "metadata_key": "policy_area"},
+    {"namespace": "risk", "metadata_key": "application_id"},
+    {"namespace": "news", "source": r"News|Reuters|Wall Street Journal|FinCEN"},
+    {"namespace": "savings", "source": r"Wealth Management|Asset Management|Chase\.com|Customer|Client"},
+]
+DEFAULT_FALLBACK_NAMESPACE = "general"
+
+
+class NamespaceRouter:
+    """Maps records to Pinecone namespaces with an ordered list of Source/metadata rules."""
+
+    def __init__(self, rules, default_namespace: str = DEFAULT_FALLBACK_NAMESPACE):
+        self.rules = [dict(rule, source=re.compile(rule["source"])) if "source" in rule else dict(rule) for rule in rules]
+        self.default_namespace = default_namespace
+        for rule in self.rules:
+            if not rule.get("namespace"):
+                raise ValueError(f"Namespace routing rule without a namespace: {rule}")
+
+    @classmethod
+    def from_config(cls, value: str = NAMESPACE_ROUTING):
+        """Builds the router selected by NAMESPACE_ROUTING, or returns None when routing is off."""
+        if not value or value == "off":
+            return None
+        if value == "default":
+            return cls(DEFAULT_RULES)
+        with open(value, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["rules"], config.get("default_namespace", DEFAULT_FALLBACK_NAMESPACE))
+
+    def route(self, record) -> str:
+        metadata = record.get("Metadata") or {}
+        for rule in self.rules:
+            if "source" in rule and not rule["source"].search(record.get("Source", "")):
+                continue
+            if "metadata_key" in rule and rule["metadata_key"] not in metadata:
+                continue
+            if any(metadata.get(key) != value for key, value in rule.get("metadata", {}).items()):
+                continue
+            return rule["namespace"]
+        return self.default_namespace
+
+    @property
+    def namespaces(self) -> list:
+        """Every namespace the router can produce, in rule order."""
+        names = [rule["namespace"] for rule in self.rules] + [self.default_namespace]
+        return list(dict.fromkeys(names))
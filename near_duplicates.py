@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+# --- Near-Duplicate Detection Configuration ---
+# Records whose estimated Jaccard similarity (over word shingles of their content) to an earlier record is at or
+# above the threshold are collapsed into that record. 0 disables the stage.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0"))
+# Only records with equal values for these metadata keys are compared, so e.g. templated notes about two different
+# customers are never collapsed. Set to "" to compare across the whole corpus.
+NEAR_DUPLICATE_SCOPE_KEYS = tuple(
+    key.strip() for key in os.getenv("NEAR_DUPLICATE_SCOPE_KEYS", "customer_id").split(",") if key.strip()
+)
+NEAR_DUPLICATE_REPORT_PATH = os.getenv("NEAR_DUPLICATE_REPORT_PATH", "near_duplicates_report.json")
+NUM_PERMUTATIONS = 128
+SHINGLE_SIZE = 3 # words per shingle
+
+# Permutations are h(x) = (a * x + b) mod p with p = 2**31 - 1, so a * x stays below 2**62 in uint64 arithmetic
+_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Distinct 32-bit hashes of the lower-cased word `size`-grams of `text`."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERMUTATIONS):
+    """
+    Picks (bands, rows) with bands * rows == num_perm whose LSH S-curve midpoint, (1/bands) ** (1/rows),
+    is closest to `threshold`.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+class NearDuplicateDetector:
+    """
+    Streaming MinHash/LSH near-duplicate detector. Each record is compared against the representatives seen so
+    far: if one is estimated to be at least `threshold` similar, the record is a duplicate of it; otherwise the
+    record becomes a representative itself. Only representatives' signatures are kept (num_perm * 4 bytes each).
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, scope_keys=NEAR_DUPLICATE_SCOPE_KEYS,
+                 num_perm: int = NUM_PERMUTATIONS, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Near-duplicate threshold must be in (0, 1], got {threshold}.")
+        self.threshold = threshold
+        self.scope_keys = tuple(scope_keys)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self._buckets = {} # (scope, band, band hash) -> [representative IDs]
+        self._signatures = {} # representative ID -> signature
+        self.clusters = {} # representative ID -> [(duplicate ID, estimated Jaccard)]
+        self.records_checked = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of `text`: the minimum of each permutation over its shingle hashes."""
+        hashes = shingle_hashes(text) % np.uint64(_PRIME)
+        if not len(hashes):
+            return np.full(self._a.shape[0], _PRIME, dtype=np.uint32)
+        # One (num_perm, n_shingles) matrix, so all permutations are applied in a single vectorized step
+        permuted = (self._a * hashes + self._b) % np.uint64(_PRIME)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _scope(self, record) -> tuple:
+        metadata = record.get("Metadata") or {}
+        return tuple(str(metadata.get(key)) for key in self.scope_keys)
+
+    def check(self, record):
+        """
+        Returns (representative ID, estimated Jaccard) if `record` near-duplicates an earlier representative,
+        else registers it as a representative and returns None.
+        """
+        self.records_checked += 1
+        doc_id = record["Document ID"]
+        scope = self._scope(record)
+        signature = self.signature(record["Content"])
+        band_keys = [(scope, band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+                     for band in range(self.bands)]
+
+        candidates = dict.fromkeys(rep for key in band_keys for rep in self._buckets.get(key, ()) if rep != doc_id)
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        if best is not None:
+            self.clusters.setdefault(best[0], []).append((doc_id, round(best[1], 3)))
+            return best
+
+        self._signatures[doc_id] = signature
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(doc_id)
+        return None
+
+    @property
+    def duplicates_found(self) -> int:
+        return sum(len(duplicates) for duplicates in self.clusters.values())
+
+    def report(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "scope_keys": list(self.scope_keys),
+            "bands": self.bands,
+            "rows_per_band": self.rows,
+            "records_checked": self.records_checked,
+            "duplicates_collapsed": self.duplicates_found,
+            "clusters": [
+                {"representative": representative, "duplicates": [{"document_id": doc_id, "estimated_jaccard": similarity}
+                                                                  for doc_id, similarity in duplicates]}
+                for representative, duplicates in self.clusters.items()
+            ],
+        }
+
+    def write_report(self, path: str = NEAR_DUPLICATE_REPORT_PATH) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,326 @@
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+
+import numpy as np
+
+from local_replica import matches_filter
+
+# --- Local Stand-ins for Bedrock, S3 and Pinecone ---
+# In-process replacements for the bedrock-runtime client, the Pinecone client/index and the S3 and Bedrock
+# batch-inference clients used by bedrock_batch_embedding.py, with configurable latency and failure rates, so the
+# pipeline can be exercised and timed without AWS or Pinecone credentials.
+# Embeddings are deterministic pseudo-random unit vectors derived from the input text.
+
+
+class LatencyModel:
+    """
+    Log-normally distributed delay with the given mean in milliseconds. `sigma` controls the tail:
+    0 gives a fixed delay, ~0.5 a realistic network-call spread.
+    """
+
+    def __init__(self, mean_ms: float = 0.0, sigma: float = 0.0):
+        self.mean_ms = mean_ms
+        self.sigma = sigma
+
+    def sample_seconds(self) -> float:
+        if self.mean_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.mean_ms / 1000.0
+        mu = math.log(self.mean_ms) - self.sigma ** 2 / 2 # keeps the mean at mean_ms
+        return random.lognormvariate(mu, self.sigma) / 1000.0
+
+    def wait(self) -> None:
+        delay = self.sample_seconds()
+        if delay:
+            time.sleep(delay)
+
+
+class StubClientError(Exception):
+    """Mimics botocore's ClientError closely enough for is_throttling_error()."""
+
+    def __init__(self, code: str, operation: str):
+        super().__init__(f"An error occurred ({code}) when calling the {operation} operation: stubbed")
+        self.response = {"Error": {"Code": code, "Message": "stubbed"}}
+
+
+def stub_embedding(text: str, dimension: int) -> np.ndarray:
+    """Deterministic unit-length float32 vector for `text`."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class StubBedrockRuntime:
+    """Stand-in for a boto3 'bedrock-runtime' client that serves Titan v2 style embedding responses."""
+
+    def __init__(self, latency: LatencyModel = None, throttle_rate: float = 0.0):
+        self.latency = latency or LatencyModel()
+        self.throttle_rate = throttle_rate
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def invoke_model(self, body, modelId, accept="application/json", contentType="application/json", **kwargs):
+        with self._lock:
+            self.calls += 1
+        self.latency.wait()
+        if random.random() < self.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            raise StubClientError("ThrottlingException", "InvokeModel")
+        request = json.loads(body)
+        embedding = stub_embedding(request["inputText"], int(request.get("dimensions", 1024)))
+        payload = {"embedding": embedding.tolist(), "inputTextTokenCount": len(request["inputText"].split())}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8")), "contentType": "application/json"}
+
+
+class StubIndex:
+    """
+    Stand-in for a Pinecone Index. Counts requests and, with `keep_vectors`, holds the vectors in memory so
+    query() can answer exactly, honoring metadata filters and sparse values. `metric` is set by create_index().
+    """
+
+    def __init__(self, latency: LatencyModel = None, error_rate: float = 0.0, keep_vectors: bool = False,
+                 metric: str = "cosine"):
+        self.latency = latency or LatencyModel()
+        self.metric = metric
+        self.error_rate = error_rate
+        self.keep_vectors = keep_vectors
+        self._lock = threading.Lock()
+        self.vectors = {} # namespace -> {id: (values, metadata, sparse_values)}
+        self.counters = {"upsert_requests": 0, "upserted_vectors": 0, "upsert_errors": 0, "deletes": 0, "updates": 0, "queries": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def upsert(self, vectors, namespace: str = None, **kwargs):
+        self.latency.wait()
+        self._count("upsert_requests")
+        if random.random() < self.error_rate:
+            self._count("upsert_errors")
+            raise StubClientError("ServiceUnavailable", "Upsert")
+        self._count("upserted_vectors", len(vectors))
+        if self.keep_vectors:
+            with self._lock:
+                stored = self.vectors.setdefault(namespace or "", {})
+                for vector in vectors:
+                    if isinstance(vector, dict):
+                        vector_id, values, metadata, sparse = vector["id"], vector["values"], vector.get("metadata"), vector.get("sparse_values")
+                    else:
+                        vector_id, values = vector[0], vector[1]
+                        metadata, sparse = vector[2] if len(vector) > 2 else None, vector[3] if len(vector) > 3 else None
+                    stored[vector_id] = (np.asarray(values, dtype=np.float32), metadata or {}, sparse)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, namespace: str = None, **kwargs):
+        self.latency.wait()
+        self._count("deletes", len(ids or []))
+        with self._lock:
+            stored = self.vectors.get(namespace or "", {})
+            for vector_id in ids or []:
+                stored.pop(vector_id, None)
+        return {}
+
+    def update(self, id, set_metadata=None, namespace: str = None, sparse_values=None, **kwargs):
+        self.latency.wait()
+        self._count("updates")
+        with self._lock:
+            stored = self.vectors.get(namespace or "", {})
+            if id in stored and (set_metadata or sparse_values):
+                values, metadata, sparse = stored[id]
+                stored[id] = (values, {**metadata, **(set_metadata or {})}, sparse_values or sparse)
+        return {}
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False, include_values: bool = False,
+              namespace: str = None, filter=None, sparse_vector=None, **kwargs):
+        """Exact search scored like Pinecone: cosine or dot product (`metric`) plus the sparse dot product."""
+        self.latency.wait()
+        self._count("queries")
+        with self._lock:
+            items = list(self.vectors.get(namespace or "", {}).items())
+        if filter:
+            items = [item for item in items if matches_filter(item[1][1], filter)]
+        matches = []
+        if items:
+            matrix = np.stack([values for _, (values, _, _) in items])
+            query = np.asarray(vector, dtype=np.float32)
+            scores = matrix @ query
+            if self.metric == "cosine":
+                scores = scores / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+            if sparse_vector is not None:
+                query_weights = dict(zip(sparse_vector["indices"], sparse_vector["values"]))
+                scores = scores + np.array([
+                    sum(query_weights.get(i, 0.0) * v for i, v in zip(sparse["indices"], sparse["values"])) if sparse else 0.0
+                    for _, (_, _, sparse) in items
+                ], dtype=np.float32)
+            for row in np.argsort(-scores, kind="stable")[:top_k]:
+                vector_id, (values, metadata, _) = items[row]
+                match = {"id": vector_id, "score": float(scores[row])}
+                if include_metadata:
+                    match["metadata"] = dict(metadata)
+                if include_values:
+                    match["values"] = values.tolist()
+                matches.append(_Record(match))
+        return _Record({"matches": matches, "namespace": namespace or ""})
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            namespaces = {name: _Record({"vector_count": len(stored)}) for name, stored in self.vectors.items() if stored}
+        return _Record({"namespaces": namespaces, "total_vector_count": sum(ns.vector_count for ns in namespaces.values())})
+
+    def list(self, namespace: str = None, limit: int = 100, **kwargs):
+        """Yields pages of vector IDs, like the serverless Index.list()."""
+        with self._lock:
+            ids = sorted(self.vectors.get(namespace or "", {}))
+        for offset in range(0, len(ids), limit):
+            yield ids[offset : offset + limit]
+
+    def fetch(self, ids, namespace: str = None, **kwargs):
+        self.latency.wait()
+        with self._lock:
+            stored = self.vectors.get(namespace or "", {})
+            found = {vector_id: stored[vector_id] for vector_id in ids if vector_id in stored}
+        vectors = {vector_id: _Record({"id": vector_id, "values": values.tolist(), "metadata": dict(metadata),
+                                       "sparse_values": _Record(sparse) if sparse else None})
+                   for vector_id, (values, metadata, sparse) in found.items()}
+        return _Record({"vectors": vectors, "namespace": namespace or ""})
+
+
+class _Record(dict):
+    """Dict that also allows attribute access, like the Pinecone client's response objects."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class StubPinecone:
+    """Stand-in for the Pinecone client. Every index name maps to one StubIndex built by `index_factory`."""
+
+    def __init__(self, index_factory=StubIndex):
+        self.index_factory = index_factory
+        self.indexes = {}
+
+    def create_index(self, name, dimension, metric="cosine", spec=None, **kwargs):
+        if name in self.indexes:
+            raise Exception(f"(409) Index '{name}' already exists")
+        self.indexes[name] = self.index_factory()
+        self.indexes[name].metric = metric
+        self.indexes[name].dimension = dimension
+
+    def Index(self, name, **kwargs):
+        if name not in self.indexes:
+            self.indexes[name] = self.index_factory()
+        return self.indexes[name]
+
+    def list_indexes(self):
+        return [{"name": name} for name in self.indexes]
+
+    def describe_index(self, name):
+        index = self.indexes[name]
+        return _Record({"name": name, "metric": index.metric, "dimension": getattr(index, "dimension", None)})
+
+
+class StubStreamingBody(io.BytesIO):
+    """Mimics botocore's StreamingBody: read() plus iter_lines()."""
+
+    def iter_lines(self):
+        for line in self:
+            yield line.rstrip(b"\r\n")
+
+
+class StubS3:
+    """In-memory stand-in for the subset of a boto3 's3' client used by batch embedding."""
+
+    def __init__(self, page_size: int = 1000):
+        self.page_size = page_size
+        self.objects = {} # (bucket, key) -> bytes
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, "rb") as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise StubClientError("NoSuchKey", "GetObject")
+        return {"Body": StubStreamingBody(self.objects[(Bucket, Key)])}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, **kwargs):
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start : start + self.page_size]
+        response = {"Contents": [{"Key": key, "Size": len(self.objects[(Bucket, key)])} for key in page],
+                    "IsTruncated": start + self.page_size < len(keys)}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + self.page_size)
+        return response
+
+
+class StubBedrockBatch:
+    """
+    Stand-in for the 'bedrock' control-plane client's model-invocation jobs. A job reports InProgress for
+    `polls_to_complete` polls, then writes Titan-style output records next to a manifest, as Bedrock does,
+    into the StubS3 it was given. `error_rate` of the records get an error entry instead of an embedding.
+    """
+
+    def __init__(self, s3: StubS3, polls_to_complete: int = 2, error_rate: float = 0.0, final_status: str = "Completed"):
+        self.s3 = s3
+        self.polls_to_complete = polls_to_complete
+        self.error_rate = error_rate
+        self.final_status = final_status
+        self.jobs = {} # job ARN -> job description
+
+    def create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig, outputDataConfig, **kwargs):
+        job_arn = f"arn:aws:bedrock:us-east-1:000000000000:model-invocation-job/{hashlib.sha1(jobName.encode()).hexdigest()[:12]}"
+        self.jobs[job_arn] = {"jobArn": job_arn, "jobName": jobName, "modelId": modelId, "status": "Submitted", "polls": 0,
+                              "inputDataConfig": inputDataConfig, "outputDataConfig": outputDataConfig}
+        return {"jobArn": job_arn}
+
+    def get_model_invocation_job(self, jobIdentifier, **kwargs):
+        job = self.jobs[jobIdentifier]
+        if job["status"] in ("Submitted", "InProgress"):
+            job["polls"] += 1
+            job["status"] = "InProgress"
+            if job["polls"] > self.polls_to_complete:
+                if self.final_status in ("Completed", "PartiallyCompleted"):
+                    self._run(job)
+                job["status"] = self.final_status
+        return {key: value for key, value in job.items() if key != "polls"}
+
+    def _run(self, job) -> None:
+        bucket, _, input_prefix = job["inputDataConfig"]["s3InputDataConfig"]["s3Uri"][len("s3://"):].partition("/")
+        output_prefix = job["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"][len("s3://"):].partition("/")[2].rstrip("/")
+        output_prefix = f"{output_prefix}/{job['jobArn'].rsplit('/', 1)[-1]}"
+        processed = errors = 0
+        input_keys = sorted(key for object_bucket, key in self.s3.objects if object_bucket == bucket and key.startswith(input_prefix))
+        for input_key in input_keys:
+            lines = []
+            for line in self.s3.get_object(Bucket=bucket, Key=input_key)["Body"].iter_lines():
+                request = json.loads(line)
+                model_input = request["modelInput"]
+                if random.random() < self.error_rate:
+                    request["error"] = {"errorCode": 400, "errorMessage": "stubbed"}
+                    errors += 1
+                else:
+                    embedding = stub_embedding(model_input["inputText"], int(model_input.get("dimensions", 1024)))
+                    request["modelOutput"] = {"embedding": embedding.tolist(), "inputTextTokenCount": len(model_input["inputText"].split())}
+                lines.append(json.dumps(request))
+                processed += 1
+            name = input_key.rsplit("/", 1)[-1]
+            self.s3.put_object(Bucket=bucket, Key=f"{output_prefix}/{name}.out", Body="\n".join(lines) + "\n")
+        manifest = {"totalRecordCount": processed, "processedRecordCount": processed,
+                    "successRecordCount": processed - errors, "errorRecordCount": errors}
+        self.s3.put_object(Bucket=bucket, Key=f"{output_prefix}/manifest.json.out", Body=json.dumps(manifest))
@@ -1,314 +1,274 @@
 import os
-import pandas as pd
-from pinecone import Pinecone, Index, ServerlessSpec, PodSpec
-import boto3 # Import boto3 for AWS Bedrock
 import json # For handling JSON payloads for Bedrock
+import threading # Guards lazy client initialization across embedding workers
+import time # Per-stage timing of ingestion runs
+from contextlib import contextmanager
+import numpy as np # Embeddings are kept as float32 arrays until upsert
 from tqdm import tqdm # For progress bar
-import time # For sleep during index deletion
+from collections import deque # Bounded window of in-flight embedding requests
+from concurrent.futures import ThreadPoolExecutor # For concurrent Bedrock calls
+from embedding_cache import EmbeddingCache # Disk-backed cache so unchanged content is never re-embedded
+from ingest_manifest import IngestManifest, content_hash, metadata_hash, NEW, CHANGED, METADATA_ONLY # Delta ingestion
+from ingest_journal import IngestJournal, EMBEDDED, UPSERTED, RUNNING, FAILED, write_index_marker # Resumable runs
+from corpus_loader import iter_records, iter_batches # Streaming JSONL/CSV/Parquet corpus reader
+from bedrock_rate_limiter import BedrockRateLimiter, RateLimitedBedrockClient # Quota-aware pacing of Bedrock calls
+from pinecone_upsert import upsert_vectors, UpsertStats, UPSERT_MAX_WORKERS # Parallel byte-size-aware upserts
+from vector_buffer import VectorBuffer # Compact 2D float32 storage for a batch of embeddings
+from chunking import chunk_record, chunk_ids, CHUNK_SIZE_TOKENS, CHUNK_OVERLAP_TOKENS # Sentence-aware chunking
+from document_store import DocumentStore # Chunk bodies kept outside Pinecone metadata
+from namespace_routing import NamespaceRouter, NAMESPACE_ROUTING # Source/metadata -> Pinecone namespace
+from near_duplicates import NearDuplicateDetector, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_REPORT_PATH # MinHash/LSH dedup
+from sparse_encoder import BM25Encoder # Locally computed BM25 vectors for hybrid search
+from embedding_settings import ( # Model, dimension and normalization shared with the Lambda
+    EMBEDDING_MODEL_ID, EMBEDDING_DIMENSION, EMBEDDING_NORMALIZE, titan_request_body, embedding_cache_model_key
+)
+# The Pinecone and boto3 SDKs are imported inside the client getters below, so importing this module
+# (e.g. from pinecone_retrieval.py for get_embedding) is cheap and has no side effects.
 
 # --- 1. Pinecone Configuration ---
 # IMPORTANT: Replace with your actual Pinecone API Key and Environment
 # You can get these from your Pinecone dashboard: app.pinecone.io
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY") # Ensure you set this environment variable
 PINECONE_ENVIRONMENT = "us-east-1" # e.g., "gcp-starter" or "us-east-1"
-INDEX_NAME = "smart-saving-unstruct" # Name for your Pinecone index
-DIMENSION = 1024 # This is the dimension of the 'all-MiniLM-L6-v2' model embeddings
-METRIC = "cosine" # Similarity metric: 'cosine', 'euclidean', or 'dotproduct'
+INDEX_NAME = os.getenv("INDEX_NAME", "smart-saving-unstruct") # Name for your Pinecone index
+DIMENSION = EMBEDDING_DIMENSION # Titan v2 output dimension (256, 512 or 1024); must match the index
+# --- Hybrid (Sparse-Dense) Search Configuration ---
+# With SPARSE_VECTORS enabled, every chunk also gets a BM25 sparse vector (see sparse_encoder.py) so the Lambda can
+# run weighted hybrid queries that match exact terms such as application IDs. Pinecone only accepts sparse values
+# on 'dotproduct' indexes, so this needs a new index (set INDEX_NAME); Titan's unit-length vectors make dotproduct
+# equivalent to cosine for the dense part. The vocabulary file must be bundled with the Lambda.
+SPARSE_VECTORS = os.getenv("SPARSE_VECTORS", "false").strip().lower() in ("1", "true", "yes")
+SPARSE_VOCABULARY_PATH = os.getenv("SPARSE_VOCABULARY_PATH", "sparse_vocabulary.json")
+METRIC = "dotproduct" if SPARSE_VECTORS else "cosine" # Similarity metric: 'cosine', 'euclidean', or 'dotproduct'
 
 # --- 2. AWS Bedrock Configuration ---
 # IMPORTANT: Configure your AWS credentials.
 # boto3 will automatically look for credentials in environment variables (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
 # or in ~/.aws/credentials. Ensure your AWS region is also configured.
 AWS_REGION = "us-east-1" # Or your desired AWS region where Bedrock is available
-EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
-
-# --- 3. Initialize Pinecone ---
-try:
-    pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
-    print(f"Successfully initialized Pinecone client.")
-except Exception as e:
-    print(f"Error initializing Pinecone: {e}")
-    print("Please ensure your PINECONE_API_KEY and PINECONE_ENVIRONMENT are correct.")
-    exit()
-
-# --- 4. Drop and Recreate Pinecone Index ---
-# This ensures a clean slate every time the script is run.
-# if INDEX_NAME in pc.list_indexes():
-# print(f"Index '{INDEX_NAME}' already exists. Deleting it for recreation...")
-# try:
-#     pc.delete_index(INDEX_NAME)
-#     print(f"Index '{INDEX_NAME}' deleted successfully.")
-#     time.sleep(30)  # Wait a few seconds to ensure deletion is processed
-# except Exception as e:
-#     print(f"Error deleting Pinecone index '{INDEX_NAME}': {e}")
-#     # If deletion fails (e.g., due to permissions or a transient issue), exit or handle appropriately
-#     exit()
-
-print(f"Creating Pinecone index '{INDEX_NAME}' with dimension {DIMENSION}...")
-try:
-    # Using ServerlessSpec for older pinecone-client versions that require 'spec' argument.
-    # Assumes your Pinecone environment is an AWS region for serverless.
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=DIMENSION,
-        metric=METRIC,
-        spec=ServerlessSpec(cloud="aws", region=PINECONE_ENVIRONMENT)
-    )
-    print(f"Index '{INDEX_NAME}' created successfully.")
-except Exception as e:
-    # This block should ideally not be hit if delete_index was successful,
-    # but kept for robustness against very rare timing issues or if
-    # another process created it right after deletion.
-    if "already exists" in str(e).lower() or "(409)" in str(e):
-        print(f"Index '{INDEX_NAME}' already exists (encountered 409 Conflict during creation attempt).")
-    else:
-        print(f"Error creating Pinecone index: {e}")
-        exit()
-
-# Connect to the index
-index = pc.Index(INDEX_NAME)
-
-# --- 5. Initialize AWS Bedrock Client ---
-try:
-    bedrock_client = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=AWS_REGION
-    )
-    print(f"Successfully initialized AWS Bedrock client in region {AWS_REGION}.")
-except Exception as e:
-    print(f"Error initializing AWS Bedrock client: {e}")
-    print("Please ensure your AWS credentials and region are correctly configured.")
-    exit()
+# EMBEDDING_MODEL_ID, EMBEDDING_DIMENSION and EMBEDDING_NORMALIZE come from embedding_settings.py
+
+# --- Concurrent Embedding Configuration ---
+# Number of worker threads calling Bedrock, and the maximum number of requests that may be
+# outstanding at once. The window keeps memory bounded and results flowing in document order.
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "8"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "32"))
+
+# --- Embedding Cache Configuration ---
+# Embeddings are cached on disk keyed by (model, normalization, dimension, content hash). Set EMBEDDING_CACHE_PATH to ""
+# to disable the cache.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+
+# --- Document Store Configuration ---
+# When set, chunk bodies are written to this SQLite file (bundle it with the Lambda and set the same variable
+# there) and Pinecone metadata no longer carries "original_content". Leave empty to keep bodies in Pinecone.
+# Each index needs its own document store, like its own manifest.
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "")
+
+# --- Ingestion Mode Configuration ---
+# "full" re-embeds and re-upserts every record; "delta" only writes what changed since the last run
+# according to the manifest, and deletes documents that are no longer in the source.
+INGEST_MODE = os.getenv("INGEST_MODE", "full")
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.sqlite")
+# Progress of each run is journaled per committed batch; a run started with resume=True (--resume) continues the
+# latest unfinished run over the same corpus, index and mode and skips the documents it already wrote.
+INGEST_JOURNAL_PATH = os.getenv("INGEST_JOURNAL_PATH", "ingest_journal.sqlite")
+
+# --- 3. Lazily Initialized Clients ---
+# Nothing connects to Pinecone or Bedrock at import time. Each getter creates its client on first use and
+# reuses it afterwards; the lock makes first use safe from the embedding worker threads.
+_clients_lock = threading.RLock()
+_pinecone_client = None
+_indexes = {} # index name -> Index handle
+_bedrock_client = None
+_bedrock_limiter = None
+_embedding_caches = {} # dimension -> EmbeddingCache, or None when the cache is disabled
+_document_store = None
+_document_store_initialized = False
+
+def get_pinecone_client():
+    """Returns the shared Pinecone client, creating it on first use."""
+    global _pinecone_client
+    if _pinecone_client is None:
+        with _clients_lock:
+            if _pinecone_client is None:
+                from pinecone import Pinecone
+                try:
+                    _pinecone_client = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
+                    print(f"Successfully initialized Pinecone client.")
+                except Exception as e:
+                    print(f"Error initializing Pinecone: {e}")
+                    print("Please ensure your PINECONE_API_KEY and PINECONE_ENVIRONMENT are correct.")
+                    raise
+    return _pinecone_client
+
+def ensure_index(index_name=None, dimension=None):
+    """Creates the Pinecone index if it does not exist yet. Only ingestion calls this."""
+    from pinecone import ServerlessSpec
+    index_name = index_name or INDEX_NAME
+    dimension = dimension or DIMENSION
+
+    # --- Drop and Recreate Pinecone Index ---
+    # This ensures a clean slate every time the script is run.
+    # if INDEX_NAME in pc.list_indexes():
+    # print(f"Index '{INDEX_NAME}' already exists. Deleting it for recreation...")
+    # try:
+    #     pc.delete_index(INDEX_NAME)
+    #     print(f"Index '{INDEX_NAME}' deleted successfully.")
+    #     time.sleep(30)  # Wait a few seconds to ensure deletion is processed
+    # except Exception as e:
+    #     print(f"Error deleting Pinecone index '{INDEX_NAME}': {e}")
+    #     # If deletion fails (e.g., due to permissions or a transient issue), exit or handle appropriately
+    #     exit()
+
+    print(f"Creating Pinecone index '{index_name}' with dimension {dimension}...")
+    try:
+        # Using ServerlessSpec for older pinecone-client versions that require 'spec' argument.
+        # Assumes your Pinecone environment is an AWS region for serverless.
+        get_pinecone_client().create_index(
+            name=index_name,
+            dimension=dimension,
+            metric=METRIC,
+            spec=ServerlessSpec(cloud="aws", region=PINECONE_ENVIRONMENT)
+        )
+        print(f"Index '{index_name}' created successfully.")
+    except Exception as e:
+        # Kept for robustness against very rare timing issues or if
+        # another process created the index in the meantime.
+        if "already exists" in str(e).lower() or "(409)" in str(e):
+            print(f"Index '{index_name}' already exists (encountered 409 Conflict during creation attempt).")
+        else:
+            print(f"Error creating Pinecone index: {e}")
+            raise
+
+def get_index(index_name=None):
+    """Returns the shared handle to a Pinecone index (INDEX_NAME by default), connecting on first use."""
+    index_name = index_name or INDEX_NAME
+    if index_name not in _indexes:
+        with _clients_lock:
+            if index_name not in _indexes:
+                _indexes[index_name] = get_pinecone_client().Index(index_name)
+    return _indexes[index_name]
+
+def get_bedrock_client():
+    """Returns the shared, rate-limited Bedrock runtime client, creating it on first use."""
+    global _bedrock_client, _bedrock_limiter
+    if _bedrock_client is None:
+        with _clients_lock:
+            if _bedrock_client is None:
+                import boto3 # Import boto3 for AWS Bedrock
+                from botocore.config import Config as BotoConfig # To size the HTTP connection pool
+                try:
+                    bedrock_runtime = boto3.client(
+                        service_name='bedrock-runtime',
+                        region_name=AWS_REGION,
+                        # One pooled connection per embedding worker, otherwise urllib3 discards connections under load.
+                        # Throttling and transient (5xx, timeout, connection) errors are retried by the rate limiter, so botocore makes a single attempt.
+                        config=BotoConfig(max_pool_connections=max(EMBED_MAX_WORKERS, 10), retries={"mode": "standard", "max_attempts": 1})
+                    )
+                    # All embedding calls share one limiter, so concurrent workers stay within the Bedrock quota together
+                    _bedrock_limiter = BedrockRateLimiter()
+                    _bedrock_client = RateLimitedBedrockClient(bedrock_runtime, _bedrock_limiter)
+                    print(f"Successfully initialized AWS Bedrock client in region {AWS_REGION}.")
+                except Exception as e:
+                    print(f"Error initializing AWS Bedrock client: {e}")
+                    print("Please ensure your AWS credentials and region are correctly configured.")
+                    raise
+    return _bedrock_client
+
+def use_clients(pinecone_client=None, bedrock_runtime=None):
+    """
+    Installs pre-built clients in place of the ones the getters would create, e.g. local stand-ins for
+    offline benchmarks. `bedrock_runtime` is wrapped in a fresh rate limiter like the real client.
+    """
+    global _pinecone_client, _bedrock_client, _bedrock_limiter
+    with _clients_lock:
+        if pinecone_client is not None:
+            _pinecone_client = pinecone_client
+            _indexes.clear()
+        if bedrock_runtime is not None:
+            _bedrock_limiter = BedrockRateLimiter()
+            _bedrock_client = RateLimitedBedrockClient(bedrock_runtime, _bedrock_limiter)
+
+def get_embedding_cache(dimension=None):
+    """Returns the shared embedding cache for `dimension`, or None when EMBEDDING_CACHE_PATH is empty."""
+    dimension = dimension or DIMENSION
+    if dimension not in _embedding_caches:
+        with _clients_lock:
+            if dimension not in _embedding_caches:
+                embedding_cache = None
+                if EMBEDDING_CACHE_PATH:
+                    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, embedding_cache_model_key(), dimension)
+                    print(f"Using embedding cache at '{EMBEDDING_CACHE_PATH}' for {dimension}-dim vectors.")
+                _embedding_caches[dimension] = embedding_cache
+    return _embedding_caches[dimension]
+
+def get_document_store():
+    """Returns the shared document store, or None when DOCUMENT_STORE_PATH is empty."""
+    global _document_store, _document_store_initialized
+    if not _document_store_initialized:
+        with _clients_lock:
+            if not _document_store_initialized:
+                if DOCUMENT_STORE_PATH:
+                    _document_store = DocumentStore(DOCUMENT_STORE_PATH)
+                    print(f"Storing chunk bodies in '{DOCUMENT_STORE_PATH}' instead of Pinecone metadata.")
+                _document_store_initialized = True
+    return _document_store
+
+def __getattr__(name):
+    """Resolves the client handles that callers import directly, e.g. `from pinecone_dataload import index`."""
+    if name == "index":
+        return get_index()
+    if name == "pc":
+        return get_pinecone_client()
+    if name == "bedrock_client":
+        return get_bedrock_client()
+    if name == "embedding_cache":
+        return get_embedding_cache()
+    if name == "document_store":
+        return get_document_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Embedding Function using Bedrock ---
-def get_embedding(text):
-    """Generates an embedding for the given text using AWS Bedrock Titan Embed Text v2."""
+def get_embedding(text, dimension=None):
+    """
+    Generates an embedding for the given text using AWS Bedrock Titan Embed Text v2, at `dimension`
+    (EMBEDDING_DIMENSION by default) and with EMBEDDING_NORMALIZE normalization.
+    Returns a 1-D float32 NumPy array (call .tolist() where a JSON list is required), or None on failure.
+    """
     if not text:
-        return []
-    
-    body = json.dumps({"inputText": text})
-    
+        return np.empty(0, dtype=np.float32)
+
+    dimension = dimension or DIMENSION
+    embedding_cache = get_embedding_cache(dimension)
+    if embedding_cache is not None:
+        cached = embedding_cache.get_raw(text)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32)
+
+    body = titan_request_body(text, dimension, EMBEDDING_NORMALIZE)
+
     try:
-        response = bedrock_client.invoke_model(
+        response = get_bedrock_client().invoke_model(
             body=body,
             modelId=EMBEDDING_MODEL_ID,
             accept="application/json",
             contentType="application/json"
         )
         response_body = json.loads(response.get("body").read())
-        embedding = response_body["embedding"]
+        embedding = np.asarray(response_body["embedding"], dtype=np.float32)
+        if embedding_cache is not None:
+            embedding_cache.put(text, embedding)
         return embedding
     except Exception as e:
         print(f"Error invoking Bedrock model for text: '{text[:50]}...': {e}")
         return None # Return None to indicate failure
 
-# --- 6. Unstructured Data Extraction (from the provided document) ---
-# This data is directly extracted from your "unstructured_data_for_rag" immersive.
-# In a real application, you'd load this from a database, files, or an API.
-unstructured_data_records = [
-    # --- Risk Analysis Agent Data ---
-    {
-        "Document ID": "JPMC_RN_001",
-        "Source": "JPMC Banker Interview Notes",
-        "Date": "2025-05-28",
-        "Content": "Applicant (P001) seeking mortgage (L-JPMC-2025-001) for a primary residence in a growing suburban area of Dallas, TX. Confirmed stable employment at a Fortune 500 company for 10+ years. Expressed long-term commitment to the area. Discussed recent pay raise due to promotion. No discernible red flags or inconsistencies. Overall impression: strong, reliable borrower profile. Follow-up action: Verify employment & income via automated system.",
-        "Metadata": {"customer_id": "P001", "application_id": "L-JPMC-2025-001", "banker_id": "B007", "sentiment": "positive", "risk_indicator": "low", "product_type": "mortgage", "location": "Dallas, TX"}
-    },
-    {
-        "Document ID": "JPMC_RN_002",
-        "Source": "JPMC Banker Interview Notes",
-        "Date": "2025-06-03",
-        "Content": "Applicant (P003) for new Chase Sapphire Preferred card. Admitted to recent unexpected medical expenses impacting cash flow. Mentioned having just moved to NYC for a new entry-level job and is adjusting to the higher cost of living. Expressed desire for a higher credit limit to consolidate existing small store card balances. Showed signs of stress regarding immediate financial flexibility. Needs careful review for potential debt cycle risk. Advised exploring credit counseling options.",
-        "Metadata": {"customer_id": "P003", "application_id": "CC-JPMC-2025-003", "banker_id": "B012", "sentiment": "negative", "risk_indicator": "moderate_high", "red_flag_keywords": ["medical bills", "high cost of living", "debt consolidation", "new job"], "location": "NYC"}
-    },
-    {
-        "Document ID": "JPMC_RN_003",
-        "Source": "JPMC Banker Interview Notes",
-        "Date": "2025-06-06",
-        "Content": "Applicant (P004), a small business owner (restaurant supplies). Seeking $150K term loan for inventory expansion. Business revenue is strong year-over-year but cash reserves are tight due to recent equipment upgrades. Provided detailed projections and confirmed existing long-term contracts. Seems knowledgeable about market dynamics but needs capital infusion to capture growth. Risk factors: reliance on single large supplier, tight margins.",
-        "Metadata": {"customer_id": "P004", "application_id": "SBL-JPMC-2025-004", "banker_id": "B005", "sentiment": "neutral-positive", "risk_indicator": "moderate", "product_type": "small_business_loan", "business_type": "restaurant_supplies"}
-    },
-    {
-        "Document ID": "JPMC_RN_004",
-        "Source": "JPMC Banker Interview Notes",
-        "Date": "2025-06-07",
-        "Content": "Applicant (P005), recent college graduate, first credit card. Starting entry-level position at tech firm. Limited credit history. Parents are JPMC high-net-worth clients, willing to be co-signers if needed. Applicant is keen to build credit responsibly. Low requested limit. Positive indicators: family banking relationship, secure first job. Needs cautious approval with potential for secured card or lower limit initially.",
-        "Metadata": {"customer_id": "P005", "application_id": "CC-JPMC-2025-005", "banker_id": "B009", "sentiment": "positive", "risk_indicator": "low_history_moderate", "product_type": "credit_card", "customer_segment": "recent_grad"}
-    },
-    {
-        "Document ID": "JPMC_EM_001",
-        "Source": "Applicant Email",
-        "Date": "2025-05-29",
-        "Subject": "Follow-up on Mortgage Application - L-JPMC-2025-001 - Additional documentation",
-        "Content": "Dear [Banker Name], Per your request, I've attached my last three years of tax returns and my current employment verification letter. I also included a copy of my recent bonus statement, which should further support my income stability. Thank you for your continued assistance with my home purchase.",
-        "Metadata": {"customer_id": "P001", "application_id": "L-JPMC-2025-001", "document_type": "tax_returns", "income_support": "bonus"}
-    },
-    {
-        "Document ID": "JPMC_EM_002",
-        "Source": "Applicant Email",
-        "Date": "2025-06-04",
-        "Subject": "Regarding my Credit Card Application - CC-JPMC-2025-003 - Urgent",
-        "Content": "Hi, I know my application might look challenging due to recent medical bills. My existing store card limits are maxed out, and I'm really struggling to manage minimum payments. I'm actively pursuing a second job at a local cafe, with interviews scheduled next week. I truly believe a new Chase card with a slightly higher limit would help me consolidate and simplify my payments. Please, any flexibility would be greatly appreciated.",
-        "Metadata": {"customer_id": "P003", "application_id": "CC-JPMC-2025-003", "financial_distress": "true", "purpose": "debt_consolidation", "mitigation_attempt": "second_job"}
-    },
-    {
-        "Document ID": "JPMC_EM_003",
-        "Source": "Applicant Email",
-        "Date": "2025-06-07",
-        "Subject": "Follow-up on Small Business Loan Request - SBL-JPMC-2025-004 - Inventory Contract",
-        "Content": "Hello, following our discussion, I've attached the signed contract with 'National Distributors' for Q3/Q4 bulk inventory. This solidifies the revenue projection I shared. Regarding the 'tight margins' mentioned, we've implemented new cost-saving measures on packaging, which should boost profitability by 1.5% next quarter. This loan is critical for capitalizing on upcoming holiday season demand.",
-        "Metadata": {"customer_id": "P004", "application_id": "SBL-JPMC-2025-004", "business_update": "true", "mitigation_strategy": "cost_savings", "market_opportunity": "holiday_season"}
-    },
-    {
-        "Document ID": "JPMC_POL_001",
-        "Source": "JPMC Internal Risk Manual - Consumer Lending, Chapter 2: Credit Card Underwriting",
-        "Date": "2024-11-15",
-        "Content": "JPMorgan Chase's underwriting policy for new credit card applications emphasizes a holistic view of financial health. Applicants with a FICO score below 670 require escalated review. Specific attention must be paid to recent credit inquiries, debt-to-income ratio exceeding 40%, and patterns indicating reliance on new credit for debt consolidation. Geographical risk assessment is paramount, considering local economic indicators and employment rates in the applicant's primary residence area (e.g., impact of tech layoffs in California vs. stable manufacturing in Midwest).",
-        "Metadata": {"policy_area": "consumer_lending", "product_type": "credit_card", "jpmc_specific": "true", "risk_threshold_FICO": 670, "risk_threshold_DTI": 0.40}
-    },
-    {
-        "Document ID": "JPMC_POL_002",
-        "Source": "JPMC Internal Risk Manual - Mortgage Lending, Appendix A: Economic Impact Adjustments",
-        "Date": "2025-02-01",
-        "Content": "Due to fluctuating interest rates and potential US economic slowdown in Q3 2025, mortgage underwriting criteria have been adjusted. For applicants with variable income, a conservative estimate based on the lowest quarterly earnings over the past 12 months should be used. For properties in areas with projected declines in home values (e.g., certain overheated markets in Florida/Arizona), LTV ratios will be capped at 75%. Stress testing for a 150-basis point interest rate increase is now mandatory for all new fixed-rate mortgage approvals. Documentation of property appraisal and local market reports required for such cases.",
-        "Metadata": {"policy_area": "mortgage_lending", "economic_factor": "interest_rates, economic_slowdown", "us_economy_impact": "true", "LTV_cap": 0.75, "stress_test_bps": 150}
-    },
-    {
-        "Document ID": "JPMC_POL_003",
-        "Source": "JPMC Internal Risk Manual - Small Business Lending, Chapter 5: Industry Risk Profiles",
-        "Date": "2024-10-01",
-        "Content": "Small business loan applications are evaluated against industry-specific risk profiles. The restaurant supply sector, while generally stable, faces seasonality and vulnerability to food inflation. For loan amounts over $100K, a review of supplier concentration risk and diverse customer base is required. Businesses with less than 3 years operating history or inconsistent cash flow must provide enhanced collateral or a personal guarantee.",
-        "Metadata": {"policy_area": "small_business_lending", "industry": "restaurant_supply", "risk_factors": ["seasonality", "inflation", "supplier_concentration"], "loan_threshold": 100000}
-    },
-    {
-        "Document ID": "JPMC_POL_004",
-        "Source": "JPMC Internal Fraud Prevention Guide, Section 3: Credit Application Fraud",
-        "Date": "2025-01-20",
-        "Content": "Common red flags for credit application fraud include: multiple recent applications across different banks, inconsistent personal information (address, employer) across documents, use of P.O. Box addresses, significant discrepancies between stated income and occupation, and refusal to provide additional verification documents. Any application flagged by the fraud detection system must be escalated to a dedicated fraud analyst team for manual review.",
-        "Metadata": {"policy_area": "fraud_prevention", "fraud_type": "credit_application", "risk_indicators": ["multiple_applications", "inconsistent_info", "PO_Box", "income_discrepancy"]}
-    },
-    {
-        "Document ID": "NEWS_JPMC_001",
-        "Source": "Bloomberg News Report",
-        "Date": "2025-06-05",
-        "Headline": "US Economy Shows Mixed Signals: Persistent Inflation, Robust Job Growth",
-        "Content": "Recent economic data for the United States indicates a bifurcated recovery. While non-farm payrolls continue to surprise on the upside, suggesting a strong labor market, core inflation remains stubbornly elevated, particularly in the services sector. The Federal Reserve's next move on interest rates is highly anticipated, with markets split between a pause and another 25-basis point hike. This mixed environment poses challenges for consumer lending institutions like JPMorgan Chase, balancing growth opportunities with default risks. Regional disparities in employment recovery are noted, especially in states reliant on manufacturing.",
-        "Metadata": {"economy_focus": "US", "economic_indicator": "inflation, employment", "relevance_to_jpmc": "high", "fed_outlook": "uncertain", "regional_impact": "true"}
-    },
-    {
-        "Document ID": "NEWS_JPMC_002",
-        "Source": "Reuters - JPMC Q1 2025 Earnings Call Transcript Excerpt",
-        "Date": "2025-04-12",
-        "Content": "Jamie Dimon, CEO of JPMorgan Chase, stated during the Q1 2025 earnings call: 'Our consumer banking segment saw robust deposit growth, but credit card net charge-offs saw a slight uptick, aligning with broader industry trends. We are closely monitoring the subprime segment and proactively adjusting our risk models to reflect the evolving macroeconomic landscape in the US. Our investment banking pipeline remains strong, particularly in technology and healthcare sectors, despite a slower start to M&A activity in Q1.'",
-        "Metadata": {"economy_focus": "US", "company": "JPMorgan Chase", "financial_performance": "earnings_call", "segment": "consumer_banking, credit_card, investment_banking", "risk_trend": "charge_offs", "sector_outlook": "tech, healthcare"}
-    },
-    {
-        "Document ID": "NEWS_JPMC_003",
-        "Source": "Wall Street Journal Report",
-        "Date": "2025-05-20",
-        "Headline": "US Restaurant Supply Chain Faces Increased Raw Material Costs",
-        "Content": "Suppliers to the US restaurant industry are grappling with an unexpected surge in raw material costs, particularly for packaging and certain food commodities. This inflationary pressure is squeezing profit margins for distributors and could lead to increased demand for short-term working capital loans. Companies with long-term contracts and diversified client bases are better positioned, but smaller players may face liquidity challenges.",
-        "Metadata": {"economy_focus": "US", "industry": "restaurant_supply", "economic_impact": "inflation", "business_loan_risk": "high"}
-    },
-    {
-        "Document ID": "NEWS_JPMC_004",
-        "Source": "FinCEN Advisory",
-        "Date": "2025-06-01",
-        "Headline": "FinCEN Issues Advisory on Emerging AI-Driven Financial Crime Risks",
-        "Content": "The Financial Crimes Enforcement Network (FinCEN) has issued an advisory highlighting the growing threat of AI-driven financial crimes, including sophisticated identity theft and synthetic identity fraud targeting credit applications. Financial institutions, including major banks like JPMorgan Chase, are urged to enhance their fraud detection capabilities and report suspicious activity promptly. This could lead to increased scrutiny for new account openings and loan applications.",
-        "Metadata": {"economy_focus": "US", "regulatory_body": "FinCEN", "risk_type": "financial_crime, fraud", "impact_on_banking": "operational_risk"}
-    },
-    # --- Saving Advisor Agent Data ---
-    {
-        "Document ID": "JPMC_ADVICE_001",
-        "Source": "JPMorgan Chase Wealth Management Blog - Article",
-        "Date": "2025-03-15",
-        "Headline": "Navigating Volatility: Long-Term Saving Strategies for the US Market",
-        "Content": "Even amidst US economic uncertainty, consistent, long-term saving remains paramount. For our clients, we emphasize diversifying across asset classes, leveraging tax-advantaged accounts like 401(k)s and IRAs, and regularly reviewing your financial plan. Consider dollar-cost averaging into equity markets to smooth out short-term fluctuations. Our advisors can help you identify JPMC investment products that align with your risk tolerance and time horizon.",
-        "Metadata": {"topic": "long_term_saving", "economy_focus": "US", "jpmc_alignment": "high", "risk_level": "all", "strategy": "diversification, dollar_cost_averaging", "tax_advantaged": ["401k", "IRA"]}
-    },
-    {
-        "Document ID": "JPMC_ADVICE_002",
-        "Source": "J.P. Morgan Asset Management - Market Insights Report Excerpt",
-        "Date": "2025-05-01",
-        "Headline": "Mid-Year Outlook 2025: Opportunities in US Equities Amidst Inflation Concerns",
-        "Content": "Our latest market insights suggest continued resilience in US corporate earnings, despite persistent inflation. While large-cap tech companies remain strong, we see emerging value in industrials and healthcare sectors. Investors should maintain a diversified portfolio but consider tactical overweight positions in sectors benefiting from structural growth trends. Bond yields are expected to remain attractive, offering income and diversification benefits. We recommend a staggered approach to new bond investments.",
-        "Metadata": {"topic": "market_outlook", "economy_focus": "US", "asset_class_focus": ["equities", "bonds"], "sector_focus": ["industrials", "healthcare"], "jpmc_alignment": "true"}
-    },
-    {
-        "Document ID": "JPMC_ADVICE_003",
-        "Source": "JPMC Tax Planning Guide for Wealth Management Clients",
-        "Date": "2025-02-10",
-        "Headline": "Maximizing Tax Efficiency in Your Savings and Investments",
-        "Content": "For US-based clients, tax-loss harvesting, contributing to Roth IRAs (if eligible), and utilizing 529 plans for education savings are key strategies. Consider the tax implications of capital gains and dividends when constructing your portfolio. JPMorgan Chase wealth advisors can help you structure your investments to minimize your tax burden while aligning with your financial goals.",
-        "Metadata": {"topic": "tax_planning", "economy_focus": "US", "jpmc_alignment": "true", "strategy": ["tax_loss_harvesting", "Roth IRA", "529 plan"]}
-    },
-    {
-        "Document ID": "JPMC_PROD_001",
-        "Source": "Chase.com Product Page",
-        "Date": "2025-01-01",
-        "Product Name": "Chase Premier Savings Account",
-        "Content": "The Chase Premier Savings Account offers competitive interest rates with tiered balances, rewarding higher deposits. Link it to your Chase checking account for seamless transfers. Features include FDIC insurance up to the maximum legal limit and access to Chase financial advisors for personalized planning. Ideal for mid-to-long term savings goals and building a substantial emergency fund. Available nationwide in the US, with easy online and mobile access.",
-        "Metadata": {"product_type": "savings_account", "bank": "JPMorgan Chase", "interest_tiering": "true", "geography": "US", "features": ["FDIC_insured", "advisor_access", "online_access"]}
-    },
-    {
-        "Document ID": "JPMC_PROD_002",
-        "Source": "J.P. Morgan Asset Management - Fund Fact Sheet",
-        "Date": "2025-05-01",
-        "Product Name": "JPMorgan SmartRetirement Blend 2045 Fund",
-        "Content": "A target-date fund designed for investors planning to retire around 2045. It invests in a diversified portfolio of underlying J.P. Morgan funds, gradually shifting from more aggressive equity-heavy allocations to more conservative fixed-income as the target date approaches. Aims for capital appreciation while managing risk for retirement income. Suitable for moderate-risk investors seeking a comprehensive, professionally managed retirement solution, specifically for US retirement accounts (e.g., 401k, IRA).",
-        "Metadata": {"product_type": "mutual_fund", "fund_family": "J.P. Morgan", "target_date": "2045", "risk_level": "moderate", "investment_horizon": "long_term", "us_retirement_accounts": "true"}
-    },
-    {
-        "Document ID": "JPMC_PROD_003",
-        "Source": "J.P. Morgan Wealth Management - Services Overview",
-        "Date": "2024-11-01",
-        "Service Name": "Personalized Financial Planning & Advisory",
-        "Content": "J.P. Morgan Wealth Management offers bespoke financial planning services for high-net-worth individuals and families. Our advisors assist with investment management, retirement planning, estate planning, and tax optimization strategies. We provide access to exclusive investment opportunities and research insights tailored to the US market. Minimum investable assets may apply.",
-        "Metadata": {"service_type": "wealth_management", "bank": "J.P. Morgan", "client_segment": "high_net_worth", "services_offered": ["investment_management", "retirement_planning", "estate_planning", "tax_optimization"], "geography": "US"}
-    },
-    {
-        "Document ID": "JPMC_TEST_001",
-        "Source": "JPMC Customer Feedback Survey",
-        "Date": "2025-04-20",
-        "Customer ID": "P001",
-        "Content": "My J.P. Morgan advisor was incredibly helpful in setting up my retirement plan. The online tools provided through Chase Mobile are fantastic for tracking my progress. I feel much more confident about my financial future thanks to their personalized advice and the SmartRetirement Fund recommendation. Living in the US, knowing my investments are aligned with the local market is a big plus.",
-        "Metadata": {"customer_id": "P001", "sentiment": "positive", "feedback_type": "wealth_management_advice", "bank": "JPMorgan Chase", "product_mentioned": "SmartRetirement Fund"}
-    },
-    {
-        "Document ID": "JPMC_TEST_002",
-        "Source": "JPMC Client Review Portal",
-        "Date": "2025-05-10",
-        "Customer ID": "P002",
-        "Content": "I've been with Chase Private Client for years, and their investment advice has been consistently solid. During the recent market dip, my advisor helped me rebalance my portfolio, and I've seen a good recovery. Their research on US small-cap opportunities was particularly valuable. The personalized service makes a real difference for a business owner like me.",
-        "Metadata": {"customer_id": "P002", "sentiment": "positive", "feedback_type": "investment_advice", "bank": "JPMorgan Chase", "client_segment": "private_client", "market_condition": "dip_recovery"}
-    },
-    {
-        "Document ID": "JPMC_TEST_003",
-        "Source": "JPMC Customer Service Email (Complaint)",
-        "Date": "2025-06-01",
-        "Customer ID": "P003",
-        "Content": "I'm frustrated with the fees on my savings account. I was expecting a higher interest rate based on online ads, but the minimum balance requirement makes it hard for me. As someone just starting out in NYC, every dollar counts. It feels like the products aren't tailored for people with lower balances. I need simpler, low-cost savings options.",
-        "Metadata": {"customer_id": "P003", "sentiment": "negative", "feedback_type": "product_dissatisfaction", "bank": "JPMorgan Chase", "product_mentioned": "savings_account", "pain_point": "fees, minimum_balance", "location": "NYC"}
-    }
-]
-
-# --- 7. Prepare Data for Upsert ---
-# Create a list of dictionaries, where each dictionary is a vector.
-# Pinecone requires vectors in the format: (id, vector_list, metadata_dict)
-vectors_to_upsert = []
-for record in tqdm(unstructured_data_records, desc="Generating embeddings"):
-    doc_id = record["Document ID"]
-    content = record["Content"]
-    
-    # Generate embedding using Bedrock
-    embedding = get_embedding(content)
-    if embedding is None:
-        print(f"Skipping document {doc_id} due to embedding error.")
-        continue
-
-    # Prepare metadata - ensure it's JSON serializable
-    metadata = record.get("Metadata", {})
+# --- Metadata Builder ---
+def build_metadata(record):
+    """Builds the Pinecone metadata for a record (everything except the original content)."""
+    # Copy so the source record is not mutated - ensure it's JSON serializable
+    metadata = dict(record.get("Metadata", {}))
     # Add other top-level fields to metadata for better filtering/context
     metadata["document_id"] = record["Document ID"]
     metadata["source"] = record["Source"]
@@ -316,25 +276,375 @@ for record in tqdm(unstructured_data_records, desc="Generating embeddings"):
     if "Headline" in record: # Add headline if present
         metadata["headline"] = record["Headline"]
     if "Subject" in record: # Add subject if present
-        metadata["subject"] = record["Subject"] 
-    metadata["original_content"] = content # Store original content for retrieval
+        metadata["subject"] = record["Subject"]
+    return metadata
+
+def sparse_document_text(record, content):
+    """
+    Text a chunk's BM25 vector is computed from: the chunk plus the record's scalar metadata values, so identifiers
+    that only appear in metadata (application IDs, customer IDs) can be matched exactly.
+    """
+    values = [str(value) for value in build_metadata(record).values() if isinstance(value, (str, int, float))]
+    return " ".join([content, *values])
 
-    vectors_to_upsert.append((doc_id, embedding, metadata))
+# --- Concurrent Embedding Stage ---
+def embed_records(records, max_workers=EMBED_MAX_WORKERS, max_in_flight=EMBED_MAX_IN_FLIGHT, dimension=None):
+    """
+    Embeds each record's 'Content' on a thread pool at `dimension` and yields (record, embedding) pairs in the
+    same order as the input. At most `max_in_flight` requests are outstanding at any time, so
+    `records` may be an arbitrarily long iterable. A failed embedding is yielded as None.
+    """
+    max_in_flight = max(max_in_flight, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed") as executor:
+        pending = deque()
+        for record in records:
+            pending.append((record, executor.submit(get_embedding, record["Content"], dimension)))
+            if len(pending) >= max_in_flight:
+                head_record, head_future = pending.popleft()
+                yield head_record, head_future.result()
+        while pending:
+            head_record, head_future = pending.popleft()
+            yield head_record, head_future.result()
 
-print(f"Prepared {len(vectors_to_upsert)} vectors for upsert.")
+# --- 4. Unstructured Data Source ---
+# Records are streamed from a JSONL, CSV or Parquet file (see corpus_loader.py) instead of being held in
+# memory. The bundled JSONL file contains the Risk Analysis and Saving Advisor agent data.
+CORPUS_PATH = os.getenv(
+    "CORPUS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "unstructured_data_records.jsonl")
+)
+# Records embedded and upserted together. Each batch is split into size-limited upsert requests that are sent
+# concurrently, so larger batches give the upsert engine more requests to overlap.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+DELETE_BATCH_SIZE = 1000 # Pinecone accepts at most 1000 IDs per delete request
 
-# --- 8. Upsert Vectors to Pinecone ---
-BATCH_SIZE = 100 # Adjust batch size based on your Pinecone tier limits and network conditions
+def delete_vectors(index, ids, namespace=""):
+    """Deletes vector IDs from one namespace in requests of at most DELETE_BATCH_SIZE IDs."""
+    kwargs = {"namespace": namespace} if namespace else {}
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        index.delete(ids=ids[i : i + DELETE_BATCH_SIZE], **kwargs)
+
+def plan_batch(records, manifest, seen_ids, mode, router=None):
+    """
+    Compares a batch of records against the manifest. Returns (records_to_embed, metadata_updates,
+    manifest_entries). In "full" mode every record is re-embedded; in "delta" mode only new or changed
+    records are, and metadata-only changes become (doc_id, metadata) updates. Each record is assigned a namespace
+    by `router` ("" without one); a record whose namespace changed is re-embedded so it can be moved.
+    """
+    records_to_embed = []
+    metadata_updates = [] # (doc_id, metadata) pairs whose content is unchanged
+    manifest_entries = {} # doc_id -> (doc_id, content_hash, metadata_hash, namespace) to record once written
+    for record in records:
+        doc_id = record["Document ID"]
+        seen_ids.add(doc_id)
+        metadata = build_metadata(record)
+        c_hash, m_hash = content_hash(record["Content"]), metadata_hash(metadata)
+        namespace = router.route(record) if router is not None else ""
+        manifest_entries[doc_id] = (doc_id, c_hash, m_hash, namespace)
+
+        status = NEW if mode == "full" else manifest.classify(doc_id, c_hash, m_hash)
+        if status != NEW and manifest.namespace(doc_id) != namespace:
+            status = CHANGED
+        if status in (NEW, CHANGED):
+            records_to_embed.append(record)
+        elif status == METADATA_ONLY:
+            metadata_updates.append((doc_id, metadata))
+    return records_to_embed, metadata_updates, manifest_entries
+
+def prepare_vectors(records_to_embed, dimension=None, sparse_encoder=None):
+    """
+    Splits records into chunks, embeds the chunks concurrently and returns (vectors, chunk_counts), where
+    vectors are Pinecone (id, values, metadata_dict) tuples and chunk_counts maps each fully embedded
+    parent document ID to its number of chunks. A document is skipped entirely if any chunk fails to embed.
+    The values are float32 row views into one VectorBuffer; they become lists only when upserted.
+    With a document store configured, chunk bodies are written there before the upsert instead of being put
+    in the metadata, so no vector is ever searchable without its body.
+    With a `sparse_encoder`, each vector tuple gets a fourth element holding its BM25 sparse values.
+    """
+    document_store = get_document_store()
+    chunks = (chunk for record in records_to_embed for chunk in chunk_record(record))
+    dimension = dimension or DIMENSION
+    buffer = VectorBuffer(dimension, capacity=len(records_to_embed))
+    rows_by_doc = {} # doc_id -> [(chunk_id, buffer_row, metadata, content, sparse_values)]
+    failed_doc_ids = set()
+    for chunk, embedding in embed_records(chunks, dimension=dimension):
+        record = chunk["Parent Record"]
+        doc_id = record["Document ID"]
+
+        # Embedding was generated concurrently by embed_records(); None means the Bedrock call failed
+        if embedding is None:
+            if doc_id not in failed_doc_ids:
+                print(f"Skipping document {doc_id} due to embedding error.")
+            failed_doc_ids.add(doc_id)
+            continue
+
+        metadata = build_metadata(record)
+        if chunk["Chunk Count"] > 1:
+            metadata["chunk_index"] = chunk["Chunk Index"]
+            metadata["chunk_count"] = chunk["Chunk Count"]
+        if document_store is None:
+            metadata["original_content"] = chunk["Content"] # Store original (chunk) content for retrieval
+        sparse_values = sparse_encoder.encode_document(sparse_document_text(record, chunk["Content"])) if sparse_encoder is not None else None
+        rows_by_doc.setdefault(doc_id, []).append(
+            (chunk["Document ID"], buffer.append(embedding), metadata, chunk["Content"], sparse_values)
+        )
+
+    # Row views are taken only after the last append, because growing the buffer reallocates it
+    vectors, chunk_counts, bodies = [], {}, []
+    for doc_id, doc_rows in rows_by_doc.items():
+        if doc_id not in failed_doc_ids:
+            for chunk_id, row, metadata, content, sparse_values in doc_rows:
+                vectors.append((chunk_id, buffer[row], metadata, sparse_values) if sparse_values else (chunk_id, buffer[row], metadata))
+                bodies.append((chunk_id, content))
+            chunk_counts[doc_id] = len(doc_rows)
+    if document_store is not None:
+        document_store.put_many(bodies)
+    return vectors, chunk_counts
+
+# --- Stage Timing ---
+class StageTimer:
+    """Accumulates wall-clock seconds per ingestion stage, so runs can report where their time went."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - started
+
+    def iterate(self, iterable, stage):
+        """Yields from `iterable`, charging the time spent producing each item to `stage`."""
+        iterator = iter(iterable)
+        while True:
+            with self(stage):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def __str__(self):
+        return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.seconds.items())
+
+# --- 5. Ingestion Entry Point ---
+def run_ingest(corpus_path=None, mode=None, index_name=None, dimension=None, manifest_path=None, resume=False):
+    """
+    Streams the corpus through chunk -> embed -> metadata -> upsert and returns the run totals.
+    Each batch is planned against the manifest, chunked, embedded, upserted and recorded before the next batch
+    is read, so peak memory depends on INGEST_BATCH_SIZE rather than on the size of the corpus.
+    In "delta" mode only new or changed documents are embedded and upserted, metadata-only changes become
+    metadata updates, and documents that disappeared from the source are deleted at the end.
+    The returned totals include "stage_seconds", the wall-clock time spent in each stage.
+    Every committed batch is written to the journal. With `resume`, the latest unfinished run over the same corpus,
+    index and mode is continued, skipping documents it already upserted whose content has not changed since.
+    Records are upserted into the namespace chosen by the NAMESPACE_ROUTING rules (the default namespace when off).
+    With NEAR_DUPLICATE_THRESHOLD set, near-duplicates of an earlier record are dropped before planning, so only one
+    representative per cluster is embedded; in "delta" mode previously ingested duplicates are deleted like removed
+    documents. The clusters are written to NEAR_DUPLICATE_REPORT_PATH.
+    `index_name`, `dimension` and `manifest_path` default to the module settings; overriding them builds a
+    separate index side by side (see migrate_embedding_dimension.py). Each index needs its own manifest.
+    """
+    corpus_path = corpus_path or CORPUS_PATH
+    mode = mode or INGEST_MODE
+    index_name = index_name or INDEX_NAME
+    dimension = dimension or DIMENSION
+    ensure_index(index_name, dimension)
+    index = get_index(index_name)
+    get_bedrock_client()
+
+    manifest = IngestManifest(manifest_path or INGEST_MANIFEST_PATH)
+    journal = IngestJournal(INGEST_JOURNAL_PATH)
+    run_id = journal.resumable_run(corpus_path, index_name, mode) if resume else None
+    if run_id:
+        already_upserted = journal.upserted_documents(run_id) # doc_id -> content hash
+        journal.set_status(run_id, RUNNING)
+        print(f"Resuming run {run_id}: {journal.progress(run_id)} documents per stage were already done.")
+    else:
+        already_upserted = {}
+        run_id = journal.start_run(corpus_path, index_name, mode)
+        if resume:
+            print("No unfinished run to resume; starting a new run.")
+    seen_ids = set() # Only IDs are kept across batches, to detect deleted documents
+    upsert_stats = UpsertStats()
+    timer = StageTimer()
+    router = NamespaceRouter.from_config(NAMESPACE_ROUTING)
+    detector = NearDuplicateDetector(NEAR_DUPLICATE_THRESHOLD) if NEAR_DUPLICATE_THRESHOLD else None
+    if router is not None:
+        print(f"Routing records into namespaces {router.namespaces}.")
+    sparse_encoder = None
+    if SPARSE_VECTORS:
+        # Corpus statistics are recomputed from the whole source on every run (tokenizing only, no Bedrock calls),
+        # while existing vocabulary indices are kept so vectors already in the index stay comparable.
+        with timer("sparse_fit"):
+            sparse_encoder = BM25Encoder.load(SPARSE_VOCABULARY_PATH) if os.path.exists(SPARSE_VOCABULARY_PATH) else BM25Encoder()
+            sparse_encoder.fit(sparse_document_text(record, chunk["Content"])
+                               for record in iter_records(corpus_path) for chunk in chunk_record(record))
+            sparse_encoder.save(SPARSE_VOCABULARY_PATH)
+        print(f"Fitted BM25 sparse encoder on {sparse_encoder.n_docs} chunks ({len(sparse_encoder.vocabulary)} terms), saved to '{SPARSE_VOCABULARY_PATH}'.")
+    totals = {"embedded_documents": 0, "upserted_vectors": 0, "stale_chunks_deleted": 0, "metadata_updated": 0, "unchanged": 0, "resumed_skipped": 0, "near_duplicates": 0, "invalid_records": 0}
+    read_stats = {} # invalid corpus rows skipped by the reader
+    index_changing = False
+
+    def mark_index_changing():
+        # Written before the run's first change to the index; replicas compare it with their snapshot's marker
+        nonlocal index_changing
+        if not index_changing:
+            write_index_marker(index, run_id, dimension, in_progress=True)
+            index_changing = True
+    print(f"Ingesting '{corpus_path}' into '{index_name}' ({dimension}-dim) in '{mode}' mode, {INGEST_BATCH_SIZE} records per batch, "
+          f"chunks of {CHUNK_SIZE_TOKENS} tokens ({CHUNK_OVERLAP_TOKENS} overlap), "
+          f"{EMBED_MAX_WORKERS} embedding workers (max {EMBED_MAX_IN_FLIGHT} in flight), {UPSERT_MAX_WORKERS} upsert workers...")
 
-if vectors_to_upsert:
     try:
-        for i in tqdm(range(0, len(vectors_to_upsert), BATCH_SIZE), desc="Upserting to Pinecone"):
-            batch = vectors_to_upsert[i : i + BATCH_SIZE]
-            index.upsert(vectors=batch)
-        print(f"Successfully upserted {len(vectors_to_upsert)} vectors to Pinecone index '{INDEX_NAME}'.")
+        batches = timer.iterate(iter_batches(iter_records(corpus_path, stats=read_stats), INGEST_BATCH_SIZE), "read")
+        for batch in tqdm(batches, desc="Ingesting batches"):
+            if detector is not None:
+                # Duplicates are left out of seen_ids too, so copies ingested by earlier runs get deleted
+                with timer("dedup"):
+                    representatives = [record for record in batch if detector.check(record) is None]
+                totals["near_duplicates"] += len(batch) - len(representatives)
+                batch = representatives
+            with timer("plan"):
+                records_to_embed, metadata_updates, manifest_entries = plan_batch(batch, manifest, seen_ids, mode, router)
+            pending_count = len(records_to_embed) + len(metadata_updates)
+            totals["unchanged"] += len(batch) - pending_count
+            if already_upserted:
+                # Documents the resumed run already wrote with the same content are not embedded or upserted again
+                records_to_embed = [record for record in records_to_embed
+                                    if already_upserted.get(record["Document ID"]) != manifest_entries[record["Document ID"]][1]]
+                metadata_updates = [(doc_id, metadata) for doc_id, metadata in metadata_updates
+                                    if already_upserted.get(doc_id) != manifest_entries[doc_id][1]]
+                totals["resumed_skipped"] += pending_count - len(records_to_embed) - len(metadata_updates)
+
+            if records_to_embed or metadata_updates:
+                mark_index_changing()
+            with timer("chunk_and_embed"):
+                vectors_to_upsert, chunk_counts = prepare_vectors(records_to_embed, dimension, sparse_encoder)
+            totals["embedded_documents"] += len(chunk_counts)
+            journal.record(run_id, EMBEDDED, ((doc_id, manifest_entries[doc_id][1]) for doc_id in chunk_counts))
+            with timer("upsert"):
+                vectors_by_namespace = {}
+                for vector in vectors_to_upsert:
+                    vectors_by_namespace.setdefault(manifest_entries[vector[2]["document_id"]][3], []).append(vector)
+                upserted_ids = set()
+                for namespace, namespace_vectors in vectors_by_namespace.items():
+                    upserted_ids |= upsert_vectors(index, namespace_vectors, stats=upsert_stats, namespace=namespace)
+            totals["upserted_vectors"] += len(upserted_ids)
+
+            # Only documents whose every chunk was written are recorded; the rest are retried on the next run
+            failed_doc_ids = {vector[2]["document_id"] for vector in vectors_to_upsert if vector[0] not in upserted_ids}
+            for doc_id in failed_doc_ids:
+                print(f"Document {doc_id} was not fully upserted and will be retried on the next run.")
+                del chunk_counts[doc_id]
+
+            # A changed document may now have fewer chunks than before, or have moved to another namespace;
+            # remove the vectors it no longer uses
+            with timer("manifest"):
+                stale_ids = {} # namespace -> vector IDs
+                stale_bodies = [] # chunk IDs no longer used in any namespace
+                for doc_id, count in chunk_counts.items():
+                    previous_count = manifest.chunk_count(doc_id) # 0 for documents not ingested before
+                    if previous_count:
+                        previous_ids = set(chunk_ids(doc_id, previous_count))
+                        unused_ids = previous_ids - set(chunk_ids(doc_id, count))
+                        previous_namespace = manifest.namespace(doc_id)
+                        moved = previous_namespace != manifest_entries[doc_id][3]
+                        stale_ids.setdefault(previous_namespace, []).extend(previous_ids if moved else unused_ids)
+                        stale_bodies.extend(unused_ids)
+                for namespace, namespace_ids in stale_ids.items():
+                    delete_vectors(index, namespace_ids, namespace)
+                if stale_bodies and get_document_store() is not None:
+                    get_document_store().delete_many(stale_bodies)
+                totals["stale_chunks_deleted"] += sum(len(namespace_ids) for namespace_ids in stale_ids.values())
+                manifest.record((*manifest_entries[doc_id], count) for doc_id, count in chunk_counts.items())
+                journal.record(run_id, UPSERTED, ((doc_id, manifest_entries[doc_id][1]) for doc_id in chunk_counts))
+
+            # Pinecone merges set_metadata into the existing metadata, so the stored dense vectors are left untouched.
+            # BM25 vectors are computed from the metadata values too (sparse_document_text), so they are re-encoded.
+            with timer("metadata_update"):
+                records_by_id = {record["Document ID"]: record for record in batch} if sparse_encoder is not None else {}
+                for doc_id, metadata in metadata_updates:
+                    count = manifest.chunk_count(doc_id)
+                    namespace_kwargs = {"namespace": manifest_entries[doc_id][3]} if manifest_entries[doc_id][3] else {}
+                    sparse_by_id = {}
+                    if sparse_encoder is not None:
+                        record = records_by_id[doc_id]
+                        sparse_by_id = {chunk["Document ID"]: sparse_encoder.encode_document(sparse_document_text(record, chunk["Content"]))
+                                        for chunk in chunk_record(record)}
+                    for vector_id in chunk_ids(doc_id, count):
+                        sparse_kwargs = {"sparse_values": sparse_by_id[vector_id]} if sparse_by_id.get(vector_id) else {}
+                        index.update(id=vector_id, set_metadata=metadata, **namespace_kwargs, **sparse_kwargs)
+                    manifest.record([(*manifest_entries[doc_id], count)])
+                    totals["metadata_updated"] += 1
+                journal.record(run_id, UPSERTED, ((doc_id, manifest_entries[doc_id][1]) for doc_id, _ in metadata_updates))
+        # Documents whose row was invalid this time are kept in the index as they are rather than deleted
+        totals["invalid_records"] = read_stats.get("invalid_records", 0)
+        seen_ids |= read_stats.get("invalid_document_ids", set())
+        print(f"Successfully ingested into Pinecone index '{index_name}': {totals}")
+        print(f"Upsert throughput: {upsert_stats}")
+        print(f"Stage timings: {timer}")
     except Exception as e:
-        print(f"Error during upsert to Pinecone: {e}")
-else:
-    print("No vectors to upsert.")
+        print(f"Error during ingestion to Pinecone: {e}")
+        print(f"Progress before the error: {totals}, upserts: {upsert_stats}")
+        print(f"Run {run_id} can be continued with resume=True (python pinecone_dataload.py --resume).")
+        journal.set_status(run_id, FAILED)
+        journal.close()
+        manifest.close()
+        raise
+
+    embedding_cache = get_embedding_cache(dimension)
+    if embedding_cache is not None:
+        print(f"Embedding cache stats: {embedding_cache.stats()}")
+    print(f"Bedrock rate limiter stats: {_bedrock_limiter.stats()}")
+
+    # --- Delete Documents Removed from the Source ---
+    deleted_documents = manifest.missing_documents(seen_ids) if mode == "delta" else []
+    deleted_ids = {} # namespace -> vector IDs
+    for doc_id, count, namespace in deleted_documents:
+        deleted_ids.setdefault(namespace, []).extend(chunk_ids(doc_id, count))
+    if deleted_ids:
+        try:
+            mark_index_changing()
+            with timer("delete"):
+                for namespace, namespace_ids in tqdm(deleted_ids.items(), desc="Deleting from Pinecone"):
+                    delete_vectors(index, namespace_ids, namespace)
+                    if get_document_store() is not None:
+                        get_document_store().delete_many(namespace_ids)
+                manifest.remove(doc_id for doc_id, _, _ in deleted_documents)
+            totals["deleted_documents"] = len(deleted_documents)
+            print(f"Successfully deleted {len(deleted_documents)} removed documents "
+                  f"({sum(len(namespace_ids) for namespace_ids in deleted_ids.values())} vectors) "
+                  f"from Pinecone index '{index_name}'.")
+        except Exception as e:
+            print(f"Error during delete from Pinecone: {e}")
+
+    if detector is not None:
+        detector.write_report(NEAR_DUPLICATE_REPORT_PATH)
+        print(f"Collapsed {detector.duplicates_found} near-duplicates into {len(detector.clusters)} representatives "
+              f"(Jaccard >= {detector.threshold}); report written to '{NEAR_DUPLICATE_REPORT_PATH}'.")
+    if get_document_store() is not None:
+        get_document_store().checkpoint()
+        print(f"Document store '{DOCUMENT_STORE_PATH}' holds {len(get_document_store())} chunk bodies.")
+    if index_changing:
+        try:
+            write_index_marker(index, run_id, dimension)
+        except Exception as e:
+            # The in-progress marker stays in place, so replicas keep treating the index as changed
+            print(f"Error writing the ingest marker to '{index_name}': {e}")
+    journal.finish_run(run_id)
+    journal.close()
+    manifest.close()
+    totals["stage_seconds"] = {stage: round(seconds, 3) for stage, seconds in timer.seconds.items()}
+    return totals
 
 
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Ingest the unstructured corpus into Pinecone.")
+    parser.add_argument("--corpus", help=f"JSONL, CSV or Parquet file (default: {CORPUS_PATH})")
+    parser.add_argument("--mode", choices=["full", "delta"], help=f"Ingestion mode (default: {INGEST_MODE})")
+    parser.add_argument("--resume", action="store_true", help="Continue the latest unfinished run instead of starting over.")
+    args = parser.parse_args()
+    run_ingest(corpus_path=args.corpus, mode=args.mode, resume=args.resume)
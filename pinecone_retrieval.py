@@ -1,4 +1,4 @@
-from pinecone_dataload import get_embedding, index, EMBEDDING_MODEL_ID
+from pinecone_dataload import get_embedding, get_index, get_document_store, EMBEDDING_MODEL_ID # Importing does not trigger an ingest
 # --- Retrieval Part (Uncommented and Ready for Use) ---
 print("\n--- Testing Retrieval (Example Search) ---")
 query_text = "Can you share JPMC Tax Planning Guide?"
@@ -8,13 +8,23 @@ if query_embedding is None:
     print("Could not generate embedding for query, cannot perform search.")
 else:
     try:
-        search_results = index.query(
-            vector=query_embedding,
+        search_results = get_index().query(
+            vector=query_embedding.tolist(), # get_embedding returns a float32 NumPy array
             top_k=3, # Retrieve top 3 most relevant documents
             include_metadata=True # Include original metadata with results
         )
-        print(f"\nTop {len(search_results.matches)} search results for query: '{query_text}'")
-        for i, match in enumerate(search_results.matches):
+        # Long documents are stored as 'doc_id#chunk_n' vectors; show each parent document once, at its best rank
+        matches, seen_documents = [], set()
+        for match in search_results.matches:
+            document_id = match.metadata.get('document_id', match.id)
+            if document_id not in seen_documents:
+                seen_documents.add(document_id)
+                matches.append(match)
+        # With DOCUMENT_STORE_PATH set, bodies live in the document store and are fetched for all matches at once
+        document_store = get_document_store()
+        bodies = document_store.get_many(match.id for match in matches) if document_store is not None else {}
+        print(f"\nTop {len(matches)} search results for query: '{query_text}'")
+        for i, match in enumerate(matches):
             print(f"\n--- Result {i+1} (ID: {match.id}, Score: {match.score:.4f}) ---")
             print(f"  Source: {match.metadata.get('source', 'N/A')}")
             if 'headline' in match.metadata:
@@ -22,7 +32,7 @@ else:
             if 'subject' in match.metadata:
                 print(f"  Subject: {match.metadata['subject']}")
             print(f"  Date: {match.metadata.get('date', 'N/A')}")
-            print(f"  Content Excerpt: {match.metadata.get('original_content', 'N/A')[:500]}...") # Show first 500 chars
+            print(f"  Content Excerpt: {match.metadata.get('original_content', bodies.get(match.id, 'N/A'))[:500]}...") # Show first 500 chars
             print(f"  Metadata: {match.metadata}")
             print("-" * 30)
     except Exception as e:
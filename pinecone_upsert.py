@@ -0,0 +1,128 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- Upsert Engine Configuration ---
+# Pinecone rejects upsert requests over 2 MB or 1000 vectors. Batches are sized by their estimated
+# serialized size with some headroom for request framing.
+MAX_REQUEST_BYTES = int(os.getenv("UPSERT_MAX_REQUEST_BYTES", str(int(2 * 1024 * 1024 * 0.9))))
+MAX_VECTORS_PER_REQUEST = 1000
+UPSERT_MAX_WORKERS = int(os.getenv("UPSERT_MAX_WORKERS", "4"))
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "3"))
+# A float serialized as JSON ("-0.012345678901234567,") is at most ~24 bytes
+BYTES_PER_VALUE = 24
+
+
+def estimate_vector_bytes(vector) -> int:
+    """Estimated serialized size of an (id, values, metadata[, sparse_values]) tuple in an upsert request."""
+    vector_id, values, metadata = vector[0], vector[1], vector[2] if len(vector) > 2 else None
+    size = len(vector_id.encode("utf-8")) + len(values) * BYTES_PER_VALUE + 64
+    if metadata:
+        size += len(json.dumps(metadata, ensure_ascii=False, default=str).encode("utf-8"))
+    if len(vector) > 3 and vector[3]:
+        size += len(vector[3]["indices"]) * (BYTES_PER_VALUE + 12) # an index (up to 10 digits) and a value each
+    return size
+
+
+def to_wire_format(batch) -> list:
+    """
+    Converts (id, values, metadata) tuples holding NumPy rows to the plain lists the Pinecone client sends.
+    Vectors with a fourth element, sparse values ({"indices", "values"}), are sent as dicts, since the client's
+    tuple format has no place for them.
+    """
+    wire = []
+    for vector in batch:
+        values = vector[1].tolist() if hasattr(vector[1], "tolist") else vector[1]
+        if len(vector) > 3 and vector[3]:
+            wire.append({"id": vector[0], "values": values, "metadata": vector[2], "sparse_values": vector[3]})
+        else:
+            wire.append((vector[0], values, *vector[2:3]))
+    return wire
+
+
+def batch_by_bytes(vectors, max_bytes: int = MAX_REQUEST_BYTES, max_count: int = MAX_VECTORS_PER_REQUEST,
+                   oversized: list = None):
+    """
+    Yields lists of vectors whose estimated serialized size stays under `max_bytes`. A vector that is over the
+    limit on its own can never be sent; it is reported, left out, and appended to `oversized` if given.
+    """
+    batch, batch_bytes = [], 0
+    for vector in vectors:
+        vector_bytes = estimate_vector_bytes(vector)
+        if vector_bytes > max_bytes:
+            print(f"Skipping vector '{vector[0]}': {vector_bytes} bytes, over the {max_bytes} byte request limit.")
+            if oversized is not None:
+                oversized.append(vector)
+            continue
+        if batch and (batch_bytes + vector_bytes > max_bytes or len(batch) >= max_count):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(vector)
+        batch_bytes += vector_bytes
+    if batch:
+        yield batch
+
+
+class UpsertStats:
+    """Running totals for upserts, so throughput can be reported across many calls."""
+
+    def __init__(self):
+        self.vectors = 0
+        self.requests = 0
+        self.retries = 0
+        self.failed_vectors = 0
+        self.seconds = 0.0
+
+    @property
+    def vectors_per_second(self) -> float:
+        return self.vectors / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.vectors} vectors in {self.requests} requests, {self.retries} retries, "
+                f"{self.failed_vectors} failed, {self.seconds:.2f}s upserting ({self.vectors_per_second:.1f} vectors/sec)")
+
+
+def upsert_vectors(index, vectors, stats: UpsertStats = None, max_workers: int = UPSERT_MAX_WORKERS,
+                   max_retries: int = UPSERT_MAX_RETRIES, namespace: str = None):
+    """
+    Upserts `vectors` in byte-sized batches sent concurrently. Only batches that fail are retried, with
+    jittered exponential backoff, up to `max_retries` times. Returns the set of vector IDs that were written;
+    IDs missing from the result belong to batches that still failed after all retries.
+    """
+    stats = stats if stats is not None else UpsertStats()
+    kwargs = {"namespace": namespace} if namespace else {}
+    oversized = [] # counted as failed; their IDs are missing from the result like any failed batch
+    pending = list(batch_by_bytes(vectors, oversized=oversized))
+    upserted_ids = set()
+    started = time.perf_counter()
+
+    def send(batch):
+        # Values are converted to lists inside the worker, so only in-flight requests hold the wire format
+        index.upsert(vectors=to_wire_format(batch), **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upsert") as executor:
+        for attempt in range(max_retries + 1):
+            if attempt:
+                stats.retries += len(pending)
+                time.sleep(min(30.0, 0.5 * 2 ** (attempt - 1)) * (1 + random.random()))
+            futures = {executor.submit(send, batch): batch for batch in pending}
+            failed = []
+            for future in as_completed(futures):
+                batch = futures[future]
+                stats.requests += 1
+                try:
+                    future.result()
+                    upserted_ids.update(vector[0] for vector in batch)
+                    stats.vectors += len(batch)
+                except Exception as e:
+                    print(f"Error upserting batch of {len(batch)} vectors (attempt {attempt + 1}): {e}")
+                    failed.append(batch)
+            pending = failed
+            if not pending:
+                break
+
+    stats.failed_vectors += sum(len(batch) for batch in pending) + len(oversized)
+    stats.seconds += time.perf_counter() - started
+    return upserted_ids
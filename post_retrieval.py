@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+
+from chunking import count_tokens
+
+# --- Post-Retrieval Selection Configuration ---
+# With RETRIEVAL_FETCH_K > 0, a search fetches that many candidates together with their vectors in one query and
+# then picks which ones reach the prompt: candidates scoring below MIN_RETRIEVAL_SCORE are dropped, the rest are
+# chosen by maximal marginal relevance (MMR_LAMBDA: 1.0 = relevance only, 0.0 = diversity only), and selection
+# stops at the search's k or once CONTEXT_TOKEN_BUDGET tokens of context are chosen, whichever comes first.
+# MIN_RETRIEVAL_SCORE is compared with the scores the index returns, so its scale depends on the search: cosine
+# similarity (-1..1) on a cosine index, and for hybrid search on a dotproduct index
+# HYBRID_ALPHA * dense dot product + (1 - HYBRID_ALPHA) * BM25 dot product. 0 keeps every candidate with a
+# non-negative score.
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "0"))
+MIN_RETRIEVAL_SCORE = float(os.getenv("MIN_RETRIEVAL_SCORE", "0"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+
+def normalize_scores(scores) -> np.ndarray:
+    """Min-max scales retrieval scores to 0..1 (all 1.0 when they are equal), keeping their order."""
+    scores = np.asarray(scores, dtype=np.float32)
+    low, high = float(scores.min()), float(scores.max())
+    if high - low <= 1e-12:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def mmr_order(relevance, vectors, lambda_mult: float = MMR_LAMBDA, limit: int = None) -> list:
+    """
+    Row indices of `vectors` in maximal-marginal-relevance order: each step picks the row maximizing
+    lambda * relevance[row] - (1 - lambda) * max cos(row, already picked). `relevance` should be on a 0..1 scale,
+    like the cosine redundancy term. Stops after `limit` rows.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    count = vectors.shape[0]
+    limit = count if limit is None else min(limit, count)
+    if not limit:
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = unit @ unit.T
+    redundancy = np.full(count, -np.inf, dtype=np.float32) # max similarity to the picked rows so far
+    available = np.ones(count, dtype=bool)
+    order = []
+    for _ in range(limit):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        objective = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * penalty, -np.inf)
+        picked = int(np.argmax(objective))
+        order.append(picked)
+        available[picked] = False
+        redundancy = np.maximum(redundancy, pairwise[picked])
+    return order
+
+
+def select_candidates(candidates, max_k: int, min_score: float = MIN_RETRIEVAL_SCORE,
+                      lambda_mult: float = MMR_LAMBDA, token_budget: int = CONTEXT_TOKEN_BUDGET) -> list:
+    """
+    Chooses at most `max_k` of `candidates`, (Document, score, vector) triples, for the prompt: a minimum-score
+    cutoff, then MMR order with the index's own scores (normalized) as relevance, so hybrid and exact-term ranking
+    is kept, adding documents while they fit in `token_budget`. Returns the chosen (Document, score) pairs in
+    selection order.
+    """
+    kept = [candidate for candidate in candidates if candidate[1] >= min_score and candidate[2] is not None]
+    if not kept:
+        return []
+    relevance = normalize_scores([score for _, score, _ in kept])
+    order = mmr_order(relevance, np.stack([np.asarray(vector, dtype=np.float32) for _, _, vector in kept]), lambda_mult)
+    selected, used_tokens = [], 0
+    for row in order:
+        doc, score, _ = kept[row]
+        tokens = count_tokens(doc.page_content)
+        if used_tokens + tokens > token_budget:
+            continue # a shorter, less relevant candidate may still fit
+        selected.append((doc, score))
+        used_tokens += tokens
+        if len(selected) >= max_k:
+            break
+    return selected
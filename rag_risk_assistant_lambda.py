@@ -11,9 +11,29 @@ from langchain_core.output_parsers import StrOutputParser
 from neo4j import GraphDatabase
 from neo4j.exceptions import ServiceUnavailable
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 # Removed: from dotenv import load_dotenv (environment variables will be set in Lambda)
 from langchain_core.documents import Document
-from typing import Union, Tuple
+from typing import Any, List, Union, Tuple
+from embedding_cache import EmbeddingCache, normalize_text
+from ttl_cache import TTLCache
+from answer_cache import (
+    SemanticAnswerCache, SQLiteAnswerStore, profile_version, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_PATH
+)
+from document_store import DocumentStore
+from sparse_encoder import BM25Encoder, hybrid_scale
+from local_replica import LocalReplica
+from embedding_settings import (
+    EMBEDDING_MODEL_ID, EMBEDDING_DIMENSION, EMBEDDING_NORMALIZE, titan_model_kwargs, embedding_cache_model_key
+)
+from chunking import collapse_chunks, count_tokens
+from context_assembler import assemble_prompt_inputs, PROMPT_TOKEN_BUDGET
+from post_retrieval import select_candidates, RETRIEVAL_FETCH_K, MIN_RETRIEVAL_SCORE, MMR_LAMBDA, CONTEXT_TOKEN_BUDGET
+from batch_retrieval import retrieve_many
+from bedrock_rate_limiter import BedrockRateLimiter, RateLimitedBedrockClient
+from botocore.config import Config as BotoConfig
 
 # --- Configuration (from Environment Variables) ---
 # These variables will be set directly in the AWS Lambda environment.
@@ -22,8 +42,66 @@ PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
 INDEX_NAME = os.getenv("INDEX_NAME")
 PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")
 AWS_REGION_1 = os.getenv("AWS_REGION_1")
-EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
 GENERATION_MODEL_ID = os.getenv("GENERATION_MODEL_ID")
+# EMBEDDING_MODEL_ID, EMBEDDING_DIMENSION and EMBEDDING_NORMALIZE come from embedding_settings.py and must
+# match the settings INDEX_NAME was built with.
+
+# --- Bedrock Retry Configuration ---
+# The rate limiter retries throttling and transient (5xx, timeout, connection) errors. Each call may spend at most
+# this many seconds backing off before its error is returned, so retries end well inside the function timeout.
+BEDROCK_MAX_RETRY_SECONDS = float(os.getenv("BEDROCK_MAX_RETRY_SECONDS", "10"))
+
+# --- Embedding Cache Configuration ---
+# /tmp is the only writable path in Lambda and survives across warm invocations. Set to "" to disable.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# In-memory LRU of recent query embeddings in front of the SQLite cache, keyed on the normalized cleaned query.
+# Repeated templated questions are answered without a disk read or a Bedrock call. Set the size to 0 to disable.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+
+# --- Document Store Configuration ---
+# Path to the chunk-body store built by ingestion with the same DOCUMENT_STORE_PATH, bundled with the function.
+# When empty, bodies are read from the "original_content" metadata field as before.
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "")
+
+# --- Hybrid Search Configuration ---
+# Path to the BM25 vocabulary written by ingestion with SPARSE_VECTORS enabled, bundled with the function. When set,
+# queries combine dense and sparse vectors weighted by HYBRID_ALPHA (1.0 = dense only, 0.0 = sparse only), so
+# exact terms like application IDs are matched even at a low RETRIEVER_TOP_K.
+SPARSE_VOCABULARY_PATH = os.getenv("SPARSE_VOCABULARY_PATH", "")
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.7"))
+RETRIEVER_TOP_K = int(os.getenv("RETRIEVER_TOP_K", "3"))
+
+# --- Namespace Configuration ---
+# Namespaces searched when a request does not name its own (see namespace_routing.py for how ingestion assigns
+# them), e.g. "risk,policy". Empty searches the default namespace. Several namespaces are queried in parallel.
+RETRIEVER_NAMESPACES = [ns.strip() for ns in os.getenv("RETRIEVER_NAMESPACES", "").split(",") if ns.strip()]
+NAMESPACE_FANOUT_WORKERS = 4
+
+# --- Customer-Scoped Retrieval Configuration ---
+# When a request names a customer (e.g. "Jane Doe (P001): ..."), the question is embedded once and two passes run in
+# parallel: CUSTOMER_TOP_K matches filtered to that customer's ID, and GLOBAL_TOP_K matches from documents that apply
+# to every customer - those matching GLOBAL_RETRIEVAL_FILTER (by default, without a customer_id: policies, news,
+# product pages), in GLOBAL_RETRIEVAL_NAMESPACES if set. The results are merged by score, so the customer's own notes
+# are found at a small k. Requests without a customer ID use a single RETRIEVER_TOP_K search as before.
+CUSTOMER_ID_METADATA_KEY = "customer_id"
+CUSTOMER_TOP_K = int(os.getenv("CUSTOMER_TOP_K", "2"))
+GLOBAL_TOP_K = int(os.getenv("GLOBAL_TOP_K", "1"))
+GLOBAL_RETRIEVAL_FILTER = json.loads(os.getenv("GLOBAL_RETRIEVAL_FILTER", '{"customer_id": {"$exists": false}}'))
+GLOBAL_RETRIEVAL_NAMESPACES = [ns.strip() for ns in os.getenv("GLOBAL_RETRIEVAL_NAMESPACES", "").split(",") if ns.strip()]
+
+# --- Local Replica Configuration ---
+# Snapshot directory written by `python local_replica.py --out <dir>` and bundled with the function. When set, the
+# latest snapshot is loaded at cold start and searched in process; Pinecone is queried instead if the snapshot is
+# older than REPLICA_MAX_AGE_HOURS (0 = no limit), was built for another embedding model or dimension, or (with
+# REPLICA_VERIFY_COUNTS) the index changed since the export: a newer ingest run ID in the index marker, or different
+# vector counts for snapshots without one. Namespaces missing from it also use Pinecone. Warm containers re-check
+# the age on every request and the index every REPLICA_RECHECK_SECONDS, and switch to Pinecone once it is stale.
+REPLICA_SNAPSHOT_DIR = os.getenv("REPLICA_SNAPSHOT_DIR", "")
+REPLICA_MAX_AGE_HOURS = float(os.getenv("REPLICA_MAX_AGE_HOURS", "24"))
+REPLICA_VERIFY_COUNTS = os.getenv("REPLICA_VERIFY_COUNTS", "true").strip().lower() in ("1", "true", "yes")
+REPLICA_RECHECK_SECONDS = float(os.getenv("REPLICA_RECHECK_SECONDS", "300"))
 
 # --- Neo4j Configuration ---
 NEO4J_URI = os.getenv("NEO4J_URI")
@@ -39,13 +117,247 @@ embeddings_instance = None
 vectorstore_instance = None
 llm_instance = None
 neo4j_driver = None
+bedrock_limiter = None
+document_store = None
+answer_cache = None
+replica_checked_at = 0.0 # time.monotonic() of the last replica check against the index
+
+
+class CachedBedrockEmbeddings(BedrockEmbeddings):
+    """
+    BedrockEmbeddings that consults an in-memory query LRU (query_cache) and then a persistent EmbeddingCache
+    (cache) before calling Bedrock. Query LRU keys ignore case and whitespace differences.
+    """
+
+    cache: Any = None
+    query_cache: Any = None
+
+    def embed_query(self, text: str) -> List[float]:
+        query_key = normalize_text(text).casefold() if self.query_cache is not None else None
+        if query_key is not None:
+            embedding = self.query_cache.get(query_key)
+            if embedding is not None:
+                return embedding
+        if self.cache is None:
+            embedding = super().embed_query(text)
+        else:
+            embedding = self.cache.get(text)
+            if embedding is None:
+                embedding = super().embed_query(text)
+                self.cache.put(text, embedding)
+        if query_key is not None:
+            self.query_cache.put(query_key, embedding)
+        return embedding
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class RiskAssistantVectorstore(LangchainPineconeVectorstore):
+    """
+    Pinecone vector store with four optional extensions:
+    - document_store: matches carry only metadata, and the bodies of all matches are fetched from the document
+      store with one lookup after the search. Matches that still carry the text key are used as is.
+    - sparse_encoder: queries are hybrid, combining the dense embedding with a BM25 sparse vector weighted by
+      hybrid_alpha. The index must use the dotproduct metric.
+    - replica: a LocalReplica of the index; namespaces it holds are searched in process instead of in Pinecone.
+    - fetch_k: post-retrieval selection; fetch_k candidates are fetched with their vectors and at most k of them are
+      kept by min_score, MMR (mmr_lambda) and token_budget.
+    Searches can also fan out over several namespaces (namespaces=[...]); the query is embedded once, the
+    namespaces are queried in parallel and the best k matches overall are returned.
+    scoped_similarity_search() combines a customer-filtered pass and a global pass over one query embedding.
+    retrieve_many() runs several searches concurrently (see batch_retrieval.py).
+    """
+
+    document_store: DocumentStore = None
+    sparse_encoder: BM25Encoder = None
+    hybrid_alpha: float = 1.0
+    replica: LocalReplica = None
+    fetch_k: int = 0 # > 0 enables post-retrieval selection (see post_retrieval.py)
+    min_score: float = 0.0
+    mmr_lambda: float = 1.0
+    token_budget: int = 0
+    _fanout_executor: ThreadPoolExecutor = None
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, namespace: str = None,
+                                     namespaces: List[str] = None) -> List[Tuple[Document, float]]:
+        embedding, sparse_vector = self._query_vectors(query)
+        namespaces = namespaces or ([namespace] if namespace is not None else None)
+        return self._select(self._candidates(embedding, sparse_vector, k, filter, namespaces), k, self.token_budget)
+
+    def scoped_similarity_search(self, query: str, customer_id: str, customer_k: int, global_k: int,
+                                 global_filter: dict = None, namespaces: List[str] = None,
+                                 global_namespaces: List[str] = None) -> List[Document]:
+        """
+        Returns up to customer_k matches whose customer_id is `customer_id` plus up to global_k matches for
+        `global_filter` (in `global_namespaces`, else `namespaces`), best score first. The query is embedded once
+        and the global pass runs in parallel with the customer pass. With post-retrieval selection, the customer
+        pass is selected first and the global pass gets the rest of the token budget.
+        """
+        embedding, sparse_vector = self._query_vectors(query)
+        global_pass = self._executor().submit(
+            self._candidates, embedding, sparse_vector, global_k, global_filter, global_namespaces or namespaces
+        )
+        customer_candidates = self._candidates(
+            embedding, sparse_vector, customer_k, {CUSTOMER_ID_METADATA_KEY: {"$eq": customer_id}}, namespaces
+        )
+        customer_docs = self._select(customer_candidates, customer_k, self.token_budget)
+        remaining_budget = self.token_budget - sum(count_tokens(doc.page_content) for doc, _ in customer_docs)
+        global_docs = self._select(global_pass.result(), global_k, max(remaining_budget, 0))
+        merged, seen = [], set()
+        for doc, score in sorted(customer_docs + global_docs, key=lambda doc_and_score: doc_and_score[1], reverse=True):
+            key = (doc.metadata.get("document_id"), doc.metadata.get("chunk_index"), doc.page_content[:64])
+            if key not in seen: # the passes overlap when the global filter admits customer documents
+                seen.add(key)
+                merged.append(doc)
+        return merged
+
+    def retrieve_many(self, queries: List[str], k: int = 4, filter: dict = None,
+                      namespaces: List[str] = None) -> List[Tuple[List[Tuple[Document, float]], dict]]:
+        """
+        similarity_search_with_score() for every query, with the embedding calls and the searches running
+        concurrently. Returns (results, timings) per query, in query order.
+        """
+        def search(query, vectors):
+            embedding, sparse_vector = vectors
+            return self._select(self._candidates(embedding, sparse_vector, k, filter, namespaces), k, self.token_budget)
+
+        return retrieve_many(queries, self._query_vectors, search)
+
+    def _query_vectors(self, query: str):
+        """Dense query embedding and, for hybrid search, the BM25 sparse vector, both scaled by hybrid_alpha."""
+        embedding = self._embedding.embed_query(query)
+        sparse_vector = None
+        if self.sparse_encoder is not None:
+            sparse_vector = self.sparse_encoder.encode_query(query)
+            if sparse_vector["indices"]:
+                embedding, sparse_vector = hybrid_scale(embedding, sparse_vector, self.hybrid_alpha)
+            else:
+                sparse_vector = None # no query term is in the vocabulary; plain dense search
+        return embedding, sparse_vector
+
+    def _candidates(self, embedding, sparse_vector, k, filter, namespaces) -> List[Tuple[Document, float, Any]]:
+        """
+        (Document, score, vector) triples for a search of k results, best first. With post-retrieval selection,
+        fetch_k candidates are fetched with their vectors instead; otherwise the vectors are None.
+        """
+        top_k, include_values = (max(self.fetch_k, k), True) if self.fetch_k else (k, False)
+        if namespaces and len(namespaces) > 1:
+            return self._fan_out(embedding, sparse_vector, top_k, filter, namespaces, include_values)
+        return self._query_candidates(embedding, top_k, filter, namespaces[0] if namespaces else None, sparse_vector, include_values)
+
+    def _select(self, candidates, k, token_budget) -> List[Tuple[Document, float]]:
+        if not self.fetch_k:
+            return [(doc, score) for doc, score, _ in candidates[:k]]
+        return select_candidates(candidates, k, self.min_score, self.mmr_lambda, token_budget)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._fanout_executor is None:
+            RiskAssistantVectorstore._fanout_executor = ThreadPoolExecutor(
+                max_workers=NAMESPACE_FANOUT_WORKERS, thread_name_prefix="namespace"
+            )
+        return self._fanout_executor
+
+    def _fan_out(self, embedding, sparse_vector, k, filter, namespaces, include_values=False) -> List[Tuple[Document, float, Any]]:
+
+        def search(namespace):
+            candidates = self._query_candidates(embedding, k, filter, namespace, sparse_vector, include_values)
+            for doc, _, _ in candidates:
+                doc.metadata["namespace"] = namespace
+            return candidates
+
+        merged = [candidate for candidates in self._executor().map(search, namespaces) for candidate in candidates]
+        return sorted(merged, key=lambda candidate: candidate[1], reverse=True)[:k]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], *, k: int = 4, filter: dict = None,
+                                               namespace: str = None, sparse_vector: dict = None) -> List[Tuple[Document, float]]:
+        namespace = self._namespace if namespace is None else namespace
+        if self.document_store is None and sparse_vector is None and not (self.replica is not None and self.replica.serves(namespace)):
+            return super().similarity_search_by_vector_with_score(embedding, k=k, filter=filter, namespace=namespace)
+        return [(doc, score) for doc, score, _ in self._query_candidates(embedding, k, filter, namespace, sparse_vector)]
+
+    def _query_candidates(self, embedding, k, filter, namespace, sparse_vector=None, include_values=False) -> List[Tuple[Document, float, Any]]:
+        """One query against the replica or Pinecone; bodies come from the text key or the document store."""
+        namespace = self._namespace if namespace is None else namespace
+        if self.replica is not None and self.replica.serves(namespace):
+            matches = self.replica.query(embedding, top_k=k, namespace=namespace, filter=filter,
+                                         sparse_vector=sparse_vector, include_values=include_values)
+        else:
+            query_kwargs = {"sparse_vector": sparse_vector} if sparse_vector is not None else {}
+            matches = self._index.query(
+                vector=embedding,
+                top_k=k,
+                include_metadata=True,
+                include_values=include_values,
+                namespace=namespace,
+                filter=filter,
+                **query_kwargs,
+            )["matches"]
+        bodies = self.document_store.get_many(
+            match["id"] for match in matches if self._text_key not in match["metadata"]
+        ) if self.document_store is not None else {}
+        candidates = []
+        for match in matches:
+            metadata = dict(match["metadata"])
+            text = metadata.pop(self._text_key, None) or bodies.get(match["id"])
+            if text is None:
+                print(f"No `{self._text_key}` or document store body found for vector '{match['id']}'. Skipping.")
+                continue
+            candidates.append((Document(page_content=text, metadata=metadata), match["score"],
+                               match["values"] if include_values else None))
+        return candidates
+
+
+def load_replica(vectorstore):
+    """Attaches the latest local replica snapshot to `vectorstore` unless it is stale; Pinecone serves otherwise."""
+    try:
+        replica = LocalReplica.load(REPLICA_SNAPSHOT_DIR)
+        reason = replica.staleness(
+            embedding_cache_model_key(), EMBEDDING_DIMENSION, max_age_seconds=REPLICA_MAX_AGE_HOURS * 3600,
+            index=vectorstore._index if REPLICA_VERIFY_COUNTS else None
+        )
+    except Exception as e:
+        # The replica is an optimization only; keep querying Pinecone
+        print(f"Error loading local replica from '{REPLICA_SNAPSHOT_DIR}': {e}")
+        return
+    if reason:
+        print(f"Local replica version {replica.version} is stale ({reason}); querying Pinecone.")
+        return
+    global replica_checked_at
+    vectorstore.replica = replica
+    replica_checked_at = time.monotonic()
+    print(f"Serving namespaces {sorted(replica.namespace_rows)} from local replica version {replica.version} "
+          f"({len(replica)} vectors, {len(replica.graphs)} HNSW graphs).")
+
+
+def check_replica(vectorstore):
+    """
+    Per-request freshness check for a warm container: drops the replica once it is older than
+    REPLICA_MAX_AGE_HOURS, or, checked every REPLICA_RECHECK_SECONDS, once the index has changed since the export.
+    """
+    global replica_checked_at
+    replica = vectorstore.replica
+    if replica is None:
+        return
+    reason = f"{replica.age_seconds() / 3600:.1f} hours old" if replica.expired(REPLICA_MAX_AGE_HOURS * 3600) else None
+    if reason is None and REPLICA_VERIFY_COUNTS and REPLICA_RECHECK_SECONDS and \
+            time.monotonic() - replica_checked_at >= REPLICA_RECHECK_SECONDS:
+        replica_checked_at = time.monotonic()
+        try:
+            reason = replica.staleness(embedding_cache_model_key(), EMBEDDING_DIMENSION, index=vectorstore._index)
+        except Exception as e:
+            print(f"Error checking local replica version {replica.version} against the index: {e}")
+    if reason:
+        vectorstore.replica = None
+        print(f"Local replica version {replica.version} is stale ({reason}); querying Pinecone from now on.")
+
 
 def initialize_components():
     """
     Initializes all necessary clients and LangChain components.
     This function should be called only once per Lambda container lifecycle.
     """
-    global pc_client, bedrock_runtime_client, rag_chain, embeddings_instance, vectorstore_instance, llm_instance, neo4j_driver
+    global pc_client, bedrock_runtime_client, rag_chain, embeddings_instance, vectorstore_instance, llm_instance, neo4j_driver, bedrock_limiter, document_store, answer_cache
 
     # --- Initialize Pinecone Client ---
     if pc_client is None:
@@ -63,9 +375,16 @@ def initialize_components():
         if not AWS_REGION_1:
             raise ValueError("AWS_REGION_1 not set as a Lambda environment variable.")
         try:
-            bedrock_runtime_client = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=AWS_REGION_1
+            # Embedding and generation calls share one limiter; it retries throttling and transient errors within
+            # BEDROCK_MAX_RETRY_SECONDS, so botocore does not
+            bedrock_limiter = BedrockRateLimiter(max_retry_seconds=BEDROCK_MAX_RETRY_SECONDS)
+            bedrock_runtime_client = RateLimitedBedrockClient(
+                boto3.client(
+                    service_name='bedrock-runtime',
+                    region_name=AWS_REGION_1,
+                    config=BotoConfig(retries={"mode": "standard", "max_attempts": 1})
+                ),
+                bedrock_limiter
             )
             print(f"Successfully initialized AWS Bedrock client in region {AWS_REGION_1}.")
         except Exception as e:
@@ -74,10 +393,28 @@ def initialize_components():
 
     # --- Initialize LangChain Embeddings ---
     if embeddings_instance is None:
-        print(f"Initializing embedding model {EMBEDDING_MODEL_ID} for LangChain...")
-        embeddings_instance = BedrockEmbeddings(
+        print(f"Initializing embedding model {EMBEDDING_MODEL_ID} ({EMBEDDING_DIMENSION}-dim) for LangChain...")
+        embedding_cache = None
+        if EMBEDDING_CACHE_PATH:
+            try:
+                embedding_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH, embedding_cache_model_key(), EMBEDDING_DIMENSION, max_bytes=EMBEDDING_CACHE_MAX_BYTES
+                )
+                print(f"Using embedding cache at '{EMBEDDING_CACHE_PATH}'.")
+            except Exception as e:
+                # The cache is an optimization only; continue with uncached embeddings
+                print(f"Error opening embedding cache: {e}")
+        query_cache = None
+        if QUERY_EMBEDDING_CACHE_SIZE > 0:
+            query_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL_SECONDS)
+            print(f"Caching up to {QUERY_EMBEDDING_CACHE_SIZE} query embeddings in memory "
+                  f"for {QUERY_EMBEDDING_CACHE_TTL_SECONDS:.0f}s.")
+        embeddings_instance = CachedBedrockEmbeddings(
             model_id=EMBEDDING_MODEL_ID,
-            client=bedrock_runtime_client
+            model_kwargs=titan_model_kwargs(EMBEDDING_DIMENSION, EMBEDDING_NORMALIZE),
+            client=bedrock_runtime_client,
+            cache=embedding_cache,
+            query_cache=query_cache
         )
 
     # --- Initialize LangChain Pinecone Vectorstore ---
@@ -86,16 +423,47 @@ def initialize_components():
             raise ValueError("INDEX_NAME not set as a Lambda environment variable.")
         print(f"Initializing LangChain Pinecone Vectorstore using index '{INDEX_NAME}'...")
         try:
-            vectorstore_instance = LangchainPineconeVectorstore.from_existing_index(
+            vectorstore_instance = RiskAssistantVectorstore.from_existing_index(
                 index_name=INDEX_NAME,
                 embedding=embeddings_instance,
                 text_key="original_content"
             )
+            if DOCUMENT_STORE_PATH:
+                document_store = DocumentStore(DOCUMENT_STORE_PATH, read_only=True)
+                vectorstore_instance.document_store = document_store
+                print(f"Fetching document bodies from '{DOCUMENT_STORE_PATH}'.")
+            if SPARSE_VOCABULARY_PATH:
+                vectorstore_instance.sparse_encoder = BM25Encoder.load(SPARSE_VOCABULARY_PATH)
+                vectorstore_instance.hybrid_alpha = HYBRID_ALPHA
+                print(f"Hybrid search enabled with alpha={HYBRID_ALPHA} "
+                      f"({len(vectorstore_instance.sparse_encoder.vocabulary)} sparse terms).")
+            if REPLICA_SNAPSHOT_DIR:
+                load_replica(vectorstore_instance)
+            if RETRIEVAL_FETCH_K:
+                vectorstore_instance.fetch_k = RETRIEVAL_FETCH_K
+                vectorstore_instance.min_score = MIN_RETRIEVAL_SCORE
+                vectorstore_instance.mmr_lambda = MMR_LAMBDA
+                vectorstore_instance.token_budget = CONTEXT_TOKEN_BUDGET
+                print(f"Selecting context from {RETRIEVAL_FETCH_K} candidates by MMR (lambda={MMR_LAMBDA}, "
+                      f"min score {MIN_RETRIEVAL_SCORE}, budget {CONTEXT_TOKEN_BUDGET} tokens).")
             print("LangChain Pinecone vector store initialized from existing index.")
         except Exception as e:
             print(f"Error initializing LangChain Pinecone Vectorstore: {e}")
             raise
 
+    # --- Initialize Semantic Answer Cache ---
+    if answer_cache is None and ANSWER_CACHE_THRESHOLD:
+        try:
+            answer_cache = SemanticAnswerCache(
+                ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES,
+                store=SQLiteAnswerStore(ANSWER_CACHE_PATH) if ANSWER_CACHE_PATH else None, dimension=EMBEDDING_DIMENSION
+            )
+            print(f"Semantic answer cache enabled (similarity >= {ANSWER_CACHE_THRESHOLD}, TTL {ANSWER_CACHE_TTL_SECONDS:.0f}s, "
+                  f"{len(answer_cache)} entries loaded).")
+        except Exception as e:
+            # The cache is an optimization only; answer every request with the chain
+            print(f"Error opening answer cache: {e}")
+
     # --- Initialize Neo4j Driver ---
     if neo4j_driver is None:
         if not NEO4J_URI or not NEO4J_USERNAME or not NEO4J_PASSWORD:
@@ -135,12 +503,34 @@ def initialize_components():
 
     # --- Build the RAG chain ---
     if rag_chain is None:
-        retriever = vectorstore_instance.as_retriever(search_kwargs={"k": 3})
-        print("Retriever initialized with top-k search set to 3.")
+        def retrieve_context(x):
+            # A request may name its own namespaces; RETRIEVER_NAMESPACES applies otherwise
+            namespaces = x.get("namespaces") or RETRIEVER_NAMESPACES
+            if x.get("customer_id"):
+                return vectorstore_instance.scoped_similarity_search(
+                    x["question"], x["customer_id"], CUSTOMER_TOP_K, GLOBAL_TOP_K, GLOBAL_RETRIEVAL_FILTER,
+                    namespaces=namespaces, global_namespaces=GLOBAL_RETRIEVAL_NAMESPACES
+                )
+            return vectorstore_instance.similarity_search(x["question"], k=RETRIEVER_TOP_K, namespaces=namespaces)
+        print(f"Retriever initialized with top-k search set to {RETRIEVER_TOP_K} "
+              f"({CUSTOMER_TOP_K} customer + {GLOBAL_TOP_K} global when a customer ID is given), "
+              f"namespaces {RETRIEVER_NAMESPACES or ['(default)']}.")
 
         def format_docs(docs: list[Document]) -> str:
             return "\n\n".join(doc.page_content for doc in docs)
 
+        def assemble_inputs(x):
+            # Chunks of the same parent document are merged so the prompt carries each document once
+            docs = collapse_chunks(x["context"])
+            if not PROMPT_TOKEN_BUDGET:
+                return {**x, "context": format_docs(docs)}
+            context, profile, stats = assemble_prompt_inputs(
+                x["question"], [doc.page_content for doc in docs], x["user_profile_info"], PROMPT_TOKEN_BUDGET
+            )
+            print(f"Prompt inputs: {stats['profile_tokens']} profile + {stats['context_tokens']} context tokens "
+                  f"(budget {stats['budget']}), {stats['tokens_saved']} of {stats['raw_tokens']} tokens saved.")
+            return {**x, "context": context, "user_profile_info": profile}
+
         prompt_template = ChatPromptTemplate.from_messages(
             [
                 (
@@ -166,11 +556,9 @@ def initialize_components():
         print("Prompt template initialized.")
         rag_chain = (
             RunnablePassthrough.assign(
-                context=lambda x: retriever.invoke(x["question"])
-            )
-            | RunnablePassthrough.assign(
-                context=lambda x: format_docs(x["context"])
+                context=retrieve_context
             )
+            | RunnableLambda(assemble_inputs)
             | prompt_template
             | llm_instance
             | StrOutputParser()
@@ -321,6 +709,24 @@ def extract_user_info_and_clean_query(full_query: str) -> Tuple[Union[str, None]
 # Call initialize_components once when the Lambda execution environment is spun up.
 initialize_components()
 
+def extract_namespaces(event: dict) -> List[str]:
+    """
+    Namespaces a request asks to search, given as "namespace": "risk" or "namespaces": ["risk", "policy"]
+    (or "risk,policy") at the top level of the event or in an API Gateway JSON body. Empty if none are given.
+    """
+    sources = [event]
+    if isinstance(event.get('body'), str):
+        try:
+            sources.append(json.loads(event['body']))
+        except json.JSONDecodeError:
+            pass
+    for source in sources:
+        value = source.get('namespaces') or source.get('namespace') if isinstance(source, dict) else None
+        if value:
+            return [ns.strip() for ns in value.split(",") if ns.strip()] if isinstance(value, str) else list(value)
+    return []
+
+
 def lambda_handler(event, context):
     """
     Main handler function for the AWS Lambda.
@@ -363,6 +769,9 @@ def lambda_handler(event, context):
 
         print(f"Raw User Query: \"{raw_user_query}\"")
 
+        if vectorstore_instance is not None:
+            check_replica(vectorstore_instance)
+
         # Extract user info and get cleaned query
         user_name, user_id, cleaned_query = extract_user_info_and_clean_query(raw_user_query)
 
@@ -386,12 +795,32 @@ def lambda_handler(event, context):
         # Prepare the input for the RAG chain
         chain_input = {
             "question": cleaned_query,
-            "user_profile_info": user_profile_info
+            "user_profile_info": user_profile_info,
+            "namespaces": extract_namespaces(event),
+            "customer_id": user_id
         }
         print(f"\nChain Input for RAG:\n{json.dumps(chain_input, indent=2)}")
 
-        final_response = rag_chain.invoke(chain_input)
+        # Answers are reused only for the same customer, profile version and namespaces
+        cached_answer = None
+        if answer_cache is not None:
+            answer_scope = SemanticAnswerCache.scope(user_id or user_name, profile_version(user_profile_info), chain_input["namespaces"])
+            question_embedding = embeddings_instance.embed_query(cleaned_query) # also warms the query LRU for retrieval
+            cached_answer = answer_cache.lookup(answer_scope, question_embedding)
+
+        if cached_answer is not None:
+            final_response, similarity = cached_answer
+            print(f"\nAnswer cache hit (similarity {similarity:.4f}); skipping retrieval and generation.")
+        else:
+            final_response = rag_chain.invoke(chain_input)
+            if answer_cache is not None:
+                answer_cache.put(answer_scope, question_embedding, final_response)
         print(f"\nRAG Response:\n{final_response}")
+        print(f"Bedrock rate limiter stats: {bedrock_limiter.stats()}")
+        if embeddings_instance.query_cache is not None:
+            print(f"Query embedding cache stats: {embeddings_instance.query_cache.stats()}")
+        if answer_cache is not None:
+            print(f"Answer cache stats: {answer_cache.stats()}")
 
         return {
             'statusCode': 200,
@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+# --- Sparse Encoder Configuration ---
+# BM25 parameters: K1 controls term-frequency saturation, B how strongly long chunks are penalized.
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+VOCABULARY_VERSION = 1
+
+# Identifier-like runs such as "CC-JPMC-2025-003", "P.O." or "4.5%" are kept whole; their alphanumeric parts are
+# emitted as well, so "CC-JPMC-2025-003" also matches a question that only mentions "JPMC".
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:[-./_][A-Za-z0-9]+)*")
+_PART_RE = re.compile(r"[A-Za-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on or our that the their this to was "
+    "were will with you your can could should would what which who how do does did not no so if than then there".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased BM25 terms for `text`: whole identifier-like tokens plus their parts, without stopwords."""
+    terms = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+
+class BM25Encoder:
+    """
+    Encodes text as Pinecone sparse vectors ({"indices": [...], "values": [...]}) for hybrid search.
+    Documents get BM25 term-frequency weights and queries get IDF weights, so their dot product is the BM25 score.
+    Term indices come from a vocabulary persisted as JSON next to the corpus statistics; indices are never
+    reassigned, so vectors already in the index stay valid when the vocabulary grows.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {} # term -> index
+        self.doc_freq = {} # term -> number of chunks containing it
+        self.n_docs = 0
+        self.avg_doc_length = 1.0
+
+    def _term_index(self, term: str, add: bool):
+        index = self.vocabulary.get(term)
+        if index is None and add:
+            index = self.vocabulary[term] = len(self.vocabulary)
+        return index
+
+    def fit(self, texts) -> "BM25Encoder":
+        """Recomputes document frequencies and average length over `texts`, extending the vocabulary as needed."""
+        doc_freq, n_docs, total_length = Counter(), 0, 0
+        for text in texts:
+            terms = tokenize(text)
+            doc_freq.update(set(terms))
+            n_docs += 1
+            total_length += len(terms)
+        for term in doc_freq:
+            self._term_index(term, add=True)
+        self.doc_freq = dict(doc_freq)
+        self.n_docs = n_docs
+        self.avg_doc_length = total_length / n_docs if n_docs else 1.0
+        return self
+
+    def encode_document(self, text: str) -> dict:
+        """BM25 term-frequency weights of a document (chunk); terms are added to the vocabulary if new."""
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_doc_length)
+        weights = {}
+        for term, tf in terms.items():
+            weights[self._term_index(term, add=True)] = tf * (self.k1 + 1) / (tf + norm)
+        return _sparse_vector(weights)
+
+    def encode_query(self, text: str) -> dict:
+        """Unit-length IDF weights of the query terms that are in the vocabulary."""
+        weights = {}
+        for term in set(tokenize(text)):
+            index = self._term_index(term, add=False)
+            if index is not None:
+                df = self.doc_freq.get(term, 0)
+                weights[index] = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return _sparse_vector({index: weight / norm for index, weight in weights.items()} if norm else {})
+
+    def save(self, path: str) -> None:
+        """Writes the vocabulary and corpus statistics atomically."""
+        state = {
+            "version": VOCABULARY_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "n_docs": self.n_docs,
+            "avg_doc_length": self.avg_doc_length,
+            "vocabulary": {term: [index, self.doc_freq.get(term, 0)] for term, index in self.vocabulary.items()},
+        }
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Encoder":
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != VOCABULARY_VERSION:
+            raise ValueError(f"Unsupported sparse vocabulary version {state.get('version')} in '{path}'.")
+        encoder = cls(k1=state["k1"], b=state["b"])
+        encoder.n_docs = state["n_docs"]
+        encoder.avg_doc_length = state["avg_doc_length"]
+        encoder.vocabulary = {term: index for term, (index, _) in state["vocabulary"].items()}
+        encoder.doc_freq = {term: df for term, (_, df) in state["vocabulary"].items() if df}
+        return encoder
+
+
+def _sparse_vector(weights: dict) -> dict:
+    indices = sorted(weights)
+    return {"indices": indices, "values": [float(weights[index]) for index in indices]}
+
+
+def hybrid_scale(dense, sparse: dict, alpha: float):
+    """
+    Weights a dense and a sparse query vector for a dotproduct index: alpha=1 is pure dense, alpha=0 pure sparse.
+    """
+    if not 0 <= alpha <= 1:
+        raise ValueError(f"alpha must be between 0 and 1, got {alpha}.")
+    scaled_sparse = {"indices": sparse["indices"], "values": [value * (1 - alpha) for value in sparse["values"]]}
+    return [value * alpha for value in dense], scaled_sparse
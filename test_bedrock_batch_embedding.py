@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILES = ("embedding_cache.sqlite", "ingest_manifest.sqlite", "ingest_journal.sqlite", "sparse_vocabulary.json")
+
+
+def test_local_run_leaves_default_files_untouched(tmp_path):
+    """--local writes its stub vectors, manifest and journal to a scratch directory, not the default paths."""
+    env = {name: value for name, value in os.environ.items()
+           if name not in ("EMBEDDING_CACHE_PATH", "INGEST_MANIFEST_PATH", "INGEST_JOURNAL_PATH", "SPARSE_VOCABULARY_PATH")}
+    env["PINECONE_API_KEY"] = "local-test"
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, "bedrock_batch_embedding.py"), "--local"],
+                            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert '"submitted": true' in result.stdout
+    assert sorted(os.listdir(tmp_path)) == []
+    for name in DEFAULT_FILES:
+        assert not os.path.exists(os.path.join(REPO_DIR, name))
@@ -0,0 +1,30 @@
+import json
+
+from corpus_loader import iter_records
+
+VALID = {"Document ID": "DOC_1", "Source": "Advisor Notes", "Date": "2025-01-01", "Content": "Savings review.",
+         "Metadata": {"customer_id": "P001"}}
+
+
+def write_jsonl(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_malformed_jsonl_line_is_skipped(tmp_path):
+    path = write_jsonl(tmp_path / "corpus.jsonl", ['{"Document ID": "DOC_0", "Content": ', json.dumps(VALID)])
+    stats = {}
+    records = list(iter_records(path, stats=stats))
+    assert [record["Document ID"] for record in records] == ["DOC_1"]
+    assert stats["invalid_records"] == 1
+    assert "invalid_document_ids" not in stats
+
+
+def test_non_object_metadata_is_skipped(tmp_path):
+    rows = [dict(VALID, **{"Document ID": "DOC_0", "Metadata": ["customer_id", "P001"]}), VALID, ["not", "a", "row"]]
+    path = write_jsonl(tmp_path / "corpus.jsonl", [json.dumps(row) for row in rows])
+    stats = {}
+    records = list(iter_records(path, stats=stats))
+    assert [record["Document ID"] for record in records] == ["DOC_1"]
+    assert stats["invalid_records"] == 2
+    assert stats["invalid_document_ids"] == {"DOC_0"}
@@ -0,0 +1,37 @@
+import numpy as np
+
+
+class VectorBuffer:
+    """
+    Growable 2D float32 buffer for embeddings. Rows are appended in place and the backing array doubles when
+    full, so a batch of N vectors costs N * dimension * 4 bytes instead of one Python float object per value.
+    Take row views with buffer[i] only after the last append, since growing reallocates the array.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 256):
+        self.dimension = dimension
+        self._rows = np.empty((max(1, capacity), dimension), dtype=np.float32)
+        self._size = 0
+
+    def append(self, vector) -> int:
+        """Copies `vector` into the next row and returns its row index."""
+        if self._size == self._rows.shape[0]:
+            grown = np.empty((self._rows.shape[0] * 2, self.dimension), dtype=np.float32)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+        self._rows[self._size] = vector
+        self._size += 1
+        return self._size - 1
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        if not 0 <= row < self._size:
+            raise IndexError(f"row {row} out of range for buffer of {self._size} vectors")
+        return self._rows[row]
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the populated rows."""
+        return self._size * self.dimension * self._rows.itemsize